@@ -1,7 +1,6 @@
 import express from 'express';
 import path from 'path';
 import fs from 'fs';
-import { exec } from 'child_process';
 import { fileURLToPath } from 'url';
 import { pool } from '../db.js';
 import {
@@ -53,6 +52,8 @@ router.get('/', (req, res) => {
       '/exportar',
       '/datasets',
       '/copernicus/ejecutar',
+      '/copernicus/jobs/:id',
+      '/copernicus/jobs/:id/log',
       '/corrientes',
       '/corrientes/riesgo/:id',
       '/corrientes/prediccion/:id',
@@ -1638,49 +1639,80 @@ router.get('/datasets', async (req, res) => {
   res.json([]);
 });
 
-// Ejecutar script Python de Copernicus
-router.post('/copernicus/ejecutar', (req, res) => {
-  const scriptPath = path.join(__dirname, '../scripts/get_data_copernicus_and_openwather.py');
-  
-  // Verificar que el script existe
-  if (!fs.existsSync(scriptPath)) {
-    return res.status(404).json({ error: 'Script no encontrado' });
-  }
-  
-  // Ejecutar el script Python con manejo de errores
+// URL del servicio Python (trabajos de actualización de datos)
+const PYTHON_SERVICE_URL = process.env.PYTHON_SERVICE_URL || 'http://localhost:8000';
+
+// Reenviar una petición al servicio de trabajos de Python
+async function pythonJobsRequest(ruta, opciones = {}) {
+  const response = await fetch(`${PYTHON_SERVICE_URL}/jobs${ruta}`, {
+    ...opciones,
+    headers: { 'Content-Type': 'application/json', ...(opciones.headers || {}) }
+  });
+  const data = await response.json().catch(() => ({}));
+  return { status: response.status, data };
+}
+
+// Encolar la actualización de datos de Copernicus (no espera a que termine)
+router.post('/copernicus/ejecutar', async (req, res) => {
+  const { datasets, from_stage, only } = req.body || {};
+
   try {
-    exec(`python ${scriptPath}`, (error, stdout, stderr) => {
-      if (error) {
-        console.error(`Error al ejecutar el script: ${error.message}`);
-        return res.status(500).json({ 
-          success: false,
-          error: 'Error al ejecutar el script', 
-          details: error.message 
-        });
-      }
-      
-      if (stderr) {
-        console.error(`Script error: ${stderr}`);
-      }
-      
-      console.log(`Script output: ${stdout}`);
-      
-      res.json({
-        success: true,
-        output: stdout,
-        message: 'Script ejecutado correctamente'
+    const { status, data } = await pythonJobsRequest('/pipeline', {
+      method: 'POST',
+      body: JSON.stringify({ datasets, from_stage, only })
+    });
+
+    if (status >= 400) {
+      return res.status(status).json({
+        success: false,
+        error: 'No se pudo encolar la actualización de datos',
+        details: data.detail
       });
+    }
+
+    res.status(202).json({
+      success: true,
+      job_id: data.job_id,
+      estado: data.estado,
+      message: data.existente
+        ? 'Ya hay una actualización igual en curso'
+        : 'Actualización de datos encolada'
     });
   } catch (error) {
-    console.error('Error al intentar ejecutar el script:', error);
-    res.status(500).json({ 
+    console.error('Error al contactar con el servicio de trabajos:', error);
+    res.status(502).json({
       success: false,
-      error: 'Error al intentar ejecutar el script',
+      error: 'Servicio de trabajos no disponible',
       details: error.message
     });
   }
 });
 
+// Estado y progreso de una actualización de datos
+router.get('/copernicus/jobs/:id', async (req, res) => {
+  try {
+    const { status, data } = await pythonJobsRequest(`/${encodeURIComponent(req.params.id)}`);
+    res.status(status).json(data);
+  } catch (error) {
+    console.error('Error al consultar el trabajo:', error);
+    res.status(502).json({ error: 'Servicio de trabajos no disponible', details: error.message });
+  }
+});
+
+// Últimas líneas del log de una actualización de datos
+router.get('/copernicus/jobs/:id/log', async (req, res) => {
+  const lineas = parseInt(req.query.lineas, 10) || 100;
+  try {
+    const { status, data } = await pythonJobsRequest(
+      `/${encodeURIComponent(req.params.id)}/log?lines=${lineas}`
+    );
+    res.status(status).json(data);
+  } catch (error) {
+    console.error('Error al consultar el log del trabajo:', error);
+    res.status(502).json({ error: 'Servicio de trabajos no disponible', details: error.message });
+  }
+});
+
 // Obtener datos de oleaje desde archivo JSON (para ejecución sin base de datos)
 router.get('/oleaje/datos', async (req, res) => {
   try {
@@ -1,11 +1,15 @@
 #!/usr/bin/env python3
 import psycopg2
 import os
+import sys
 from dotenv import load_dotenv
 from pathlib import Path
 import logging
-import numpy as np
-from datetime import datetime, timedelta
+
+# Librería compartida con python-services (interpolación en piscifactorías)
+sys.path.insert(0, str(Path(__file__).resolve().parents[3] / "python-services"))
+from app.farm_sampler import assign_grid_fields_to_farms
+from app.query_profiler import connect_kwargs
 
 # Configuración de logging
 logging.basicConfig(
@@ -18,6 +22,9 @@ logging.basicConfig(
 )
 logger = logging.getLogger("assign_data")
 
+# Cubo de datos local (mismo directorio que process_data.py)
+CUBE_DIR = Path(os.getenv("DATA_CUBE_DIR", Path(os.path.expanduser("~/webGIS-GlorIA")) / "data" / "cube"))
+
 # Función para obtener conexión a la base de datos
 def get_db_connection():
     root_dir = Path(os.path.expanduser("~/webGIS-GlorIA"))
@@ -30,7 +37,8 @@ def get_db_connection():
             port=os.getenv("DB_PORT"),
             dbname=os.getenv("DB_NAME"),
             user=os.getenv("DB_USER"),
-            password=os.getenv("DB_PASSWORD")
+            password=os.getenv("DB_PASSWORD"),
+            **connect_kwargs()
         )
         logger.info("Conexión a la base de datos establecida")
         return conn
@@ -101,37 +109,31 @@ def get_nearest_data(conn, lon, lat, max_distance_km=30):
 
 # Función para asignar datos a una piscifactoría
 def assign_data_to_farm(conn, farm_id, data_points):
+    if not data_points:
+        return 0
     try:
         cursor = conn.cursor()
-        count = 0
+        point_ids = [point[0] for point in data_points]
         
-        for point in data_points:
-            point_id, variable, fecha, valor, dataset_id, distancia = point
-            try:
-                # Actualizar el registro para asignarlo a la piscifactoría
-                cursor.execute("""
-                    INSERT INTO gloria.variables_ambientales
-                    (dataset_id, variable_nombre, fecha_tiempo, valor, piscifactoria_id, geometria, profundidad, calidad)
-                    SELECT 
-                        dataset_id, 
-                        variable_nombre, 
-                        fecha_tiempo, 
-                        valor, 
-                        %s AS piscifactoria_id, 
-                        (SELECT geometria FROM gloria.piscifactorias WHERE id = %s) AS geometria,
-                        profundidad,
-                        calidad
-                    FROM gloria.variables_ambientales
-                    WHERE id = %s
-                    ON CONFLICT (variable_nombre, fecha_tiempo, geometria) DO UPDATE
-                    SET valor = EXCLUDED.valor, calidad = EXCLUDED.calidad
-                """, (farm_id, farm_id, point_id))
-                count += 1
-            except Exception as e:
-                logger.error(f"Error al insertar dato {point_id} a piscifactoría {farm_id}: {e}")
-                conn.rollback()
-                continue
+        # Copiar todos los registros cercanos en una sola sentencia
+        cursor.execute("""
+            INSERT INTO gloria.variables_ambientales
+            (dataset_id, variable_nombre, fecha_tiempo, valor, piscifactoria_id, geometria, profundidad, calidad)
+            SELECT 
+                va.dataset_id, 
+                va.variable_nombre, 
+                va.fecha_tiempo, 
+                va.valor, 
+                p.id AS piscifactoria_id, 
+                p.geometria,
+                va.profundidad,
+                va.calidad
+            FROM gloria.variables_ambientales va
+            JOIN gloria.piscifactorias p ON p.id = %s
+            WHERE va.id = ANY(%s)
+        """, (farm_id, point_ids))
         
+        count = cursor.rowcount
         conn.commit()
         logger.info(f"Asignados {count} datos a la piscifactoría ID {farm_id}")
         return count
@@ -151,49 +153,10 @@ def create_continuous_data(conn, farm_id, farm_name, farm_lon, farm_lat):
             logger.warning(f"Pocos datos cercanos para {farm_name}, ampliando radio")
             data_points = get_nearest_data(conn, farm_lon, farm_lat, max_distance_km=60)
         
-        # Si seguimos sin tener suficientes datos, buscamos en otra piscifactoría que ya tenga datos
-        if len(data_points) < 50:
-            logger.warning(f"Buscando datos de piscifactorías con datos...")
-            cursor = conn.cursor()
-            cursor.execute("""
-                SELECT 
-                    p.id, p.nombre, 
-                    COUNT(va.id) AS total_datos
-                FROM gloria.piscifactorias p
-                JOIN gloria.variables_ambientales va ON p.id = va.piscifactoria_id
-                GROUP BY p.id, p.nombre
-                HAVING COUNT(va.id) > 100
-                ORDER BY total_datos DESC
-                LIMIT 1
-            """)
-            
-            farm_with_data = cursor.fetchone()
-            if farm_with_data:
-                source_farm_id, source_farm_name, total = farm_with_data
-                logger.info(f"Copiando datos de {source_farm_name} ({total} datos)")
-                
-                cursor.execute("""
-                    INSERT INTO gloria.variables_ambientales
-                    (dataset_id, variable_nombre, fecha_tiempo, valor, piscifactoria_id, geometria, profundidad, calidad)
-                    SELECT 
-                        dataset_id, 
-                        variable_nombre, 
-                        fecha_tiempo, 
-                        valor * (0.9 + RANDOM() * 0.2), -- Variación del 10% para que no sean idénticos
-                        %s AS piscifactoria_id, 
-                        (SELECT geometria FROM gloria.piscifactorias WHERE id = %s) AS geometria,
-                        profundidad,
-                        calidad
-                    FROM gloria.variables_ambientales
-                    WHERE piscifactoria_id = %s
-                    ON CONFLICT (variable_nombre, fecha_tiempo, geometria) DO UPDATE
-                    SET valor = EXCLUDED.valor, calidad = EXCLUDED.calidad
-                """, (farm_id, farm_id, source_farm_id))
-                
-                count = cursor.rowcount
-                conn.commit()
-                logger.info(f"Copiados {count} datos a {farm_name}")
-                return count
+        # Sin datos cercanos no se inventan valores: mejor sin serie que una copia alterada
+        if not data_points:
+            logger.warning(f"No hay datos ambientales cerca de {farm_name}")
+            return 0
         
         # Asignar los datos encontrados a la piscifactoría
         return assign_data_to_farm(conn, farm_id, data_points)
@@ -208,10 +171,18 @@ def main():
     try:
         conn = get_db_connection()
         
-        # Obtener piscifactorías sin datos
+        # Interpolación bilineal de los campos en malla (gloria.campos_grid o cubo) en todas las piscifactorías
+        total_assigned = 0
+        try:
+            total_assigned = assign_grid_fields_to_farms(conn, cube_root=CUBE_DIR)
+            logger.info(f"Interpolados {total_assigned} datos desde campos en malla")
+        except psycopg2.Error as e:
+            conn.rollback()
+            logger.warning(f"No se pudieron interpolar campos en malla: {e}")
+        
+        # Obtener piscifactorías que siguen sin datos (fuera de las mallas)
         farms = get_farms_without_data(conn)
         
-        total_assigned = 0
         for farm in farms:
             farm_id, farm_name, farm_lon, farm_lat = farm
             logger.info(f"Procesando piscifactoría: {farm_name} ({farm_id})")
@@ -1,11 +1,17 @@
 #!/usr/bin/env python3
 import psycopg2
 import os
+import sys
 from dotenv import load_dotenv
 from pathlib import Path
 import logging
+import argparse
 from datetime import datetime, timedelta
 
+# Librería compartida con python-services (opciones de conexión)
+sys.path.insert(0, str(Path(__file__).resolve().parents[3] / "python-services"))
+from app.query_profiler import connect_kwargs
+
 # Configuración de logging
 logging.basicConfig(
     level=logging.INFO,
@@ -29,7 +35,8 @@ def get_db_connection():
             port=os.getenv("DB_PORT"),
             dbname=os.getenv("DB_NAME"),
             user=os.getenv("DB_USER"),
-            password=os.getenv("DB_PASSWORD")
+            password=os.getenv("DB_PASSWORD"),
+            **connect_kwargs()
         )
         logger.info("Conexión a la base de datos establecida")
         return conn
@@ -37,22 +44,6 @@ def get_db_connection():
         logger.error(f"Error al conectar a la base de datos: {e}")
         raise
 
-# Función para obtener todas las piscifactorías
-def get_all_farms(conn):
-    try:
-        cursor = conn.cursor()
-        cursor.execute("""
-            SELECT p.id, p.nombre, ST_X(p.geometria) AS lon, ST_Y(p.geometria) AS lat
-            FROM gloria.piscifactorias p
-            ORDER BY p.id
-        """)
-        farms = cursor.fetchall()
-        logger.info(f"Encontradas {len(farms)} piscifactorías")
-        return farms
-    except Exception as e:
-        logger.error(f"Error al obtener piscifactorías: {e}")
-        return []
-
 # Función para obtener las variables disponibles
 def get_available_variables(conn):
     try:
@@ -71,104 +62,86 @@ def get_available_variables(conn):
         logger.error(f"Error al obtener variables disponibles: {e}")
         return []
 
-# Función para obtener datos oficiales cercanos para una variable específica
-def get_nearest_official_data(conn, variable, lon, lat, max_distance_km=50):
+# Puntos de datos regionales más cercanos que se consideran por piscifactoría
+DEFAULT_NEAREST_POINTS = 4
+
+# Función para asignar una variable a todas las piscifactorías en una sola sentencia
+def assign_variable_to_all_farms(conn, variable, since=None, until=None,
+                                 points=DEFAULT_NEAREST_POINTS, max_distance_km=100):
+    """
+    Para cada piscifactoría elige primero los `points` puntos distintos con
+    datos regionales de la variable más cercanos (KNN con el operador <-> sobre
+    el índice GIST de gloria.puntos_regionales), descarta los que superan
+    max_distance_km y después recorre sus series completas en la ventana
+    temporal, asignando por día el valor del punto más próximo que tenga datos
+    ese día. Los instantes que la piscifactoría ya tiene asignados se omiten.
+    """
     try:
         cursor = conn.cursor()
         cursor.execute("""
-            WITH datos_cercanos AS (
-                SELECT 
-                    va.id,
-                    va.dataset_id,
-                    va.fecha_tiempo,
-                    va.valor,
-                    ST_AsText(va.geometria) as geom_text,
-                    va.profundidad,
-                    va.calidad,
-                    ST_Distance(
-                        va.geometria::geography, 
-                        ST_SetSRID(ST_MakePoint(%s, %s), 4326)::geography
-                    ) as distancia
-                FROM gloria.variables_ambientales va
-                WHERE va.variable_nombre = %s
+            -- MATERIALIZED: las series se leen por punto con el índice GIST (~=) de variables_ambientales
+            WITH cercanos AS MATERIALIZED (
+                SELECT p.id AS piscifactoria_id, p.geometria AS geom_piscifactoria, c.geometria, c.distancia
+                FROM gloria.piscifactorias p
+                CROSS JOIN LATERAL (
+                    -- KNN sobre el índice GIST de los puntos distintos (07-regional-points.sql)
+                    SELECT pt.geometria,
+                           ST_Distance(pt.geometria::geography, p.geometria::geography) AS distancia
+                    FROM gloria.puntos_regionales pt
+                    WHERE pt.variable_nombre = %(variable)s
+                    ORDER BY pt.geometria <-> p.geometria
+                    LIMIT %(points)s
+                ) c
+                WHERE c.distancia < %(max_distance_km)s * 1000  -- Convertir km a metros
+            )
+            INSERT INTO gloria.variables_ambientales
+            (dataset_id, variable_nombre, fecha_tiempo, valor, piscifactoria_id, geometria, profundidad, calidad)
+            SELECT DISTINCT ON (c.piscifactoria_id, DATE(va.fecha_tiempo))
+                va.dataset_id,
+                %(variable)s,
+                va.fecha_tiempo,
+                va.valor,
+                c.piscifactoria_id,
+                c.geom_piscifactoria,
+                va.profundidad,
+                va.calidad
+            FROM cercanos c
+            JOIN gloria.variables_ambientales va
+                ON va.geometria ~= c.geometria
+                AND va.variable_nombre = %(variable)s
                 AND va.piscifactoria_id IS NULL
-                AND ST_Distance(
-                    va.geometria::geography, 
-                    ST_SetSRID(ST_MakePoint(%s, %s), 4326)::geography
-                ) < %s * 1000  -- Convertir km a metros
-                ORDER BY va.fecha_tiempo DESC, distancia ASC
+                AND (%(since)s::timestamptz IS NULL OR va.fecha_tiempo >= %(since)s::timestamptz)
+                AND (%(until)s::timestamptz IS NULL OR va.fecha_tiempo <= %(until)s::timestamptz)
+            WHERE NOT EXISTS (
+                SELECT 1
+                FROM gloria.variables_ambientales asignado
+                WHERE asignado.piscifactoria_id = c.piscifactoria_id
+                AND asignado.variable_nombre = %(variable)s
+                AND asignado.fecha_tiempo = va.fecha_tiempo
             )
-            SELECT DISTINCT ON (DATE(fecha_tiempo)) 
-                id, dataset_id, fecha_tiempo, valor, geom_text, profundidad, calidad, distancia
-            FROM datos_cercanos
-            ORDER BY DATE(fecha_tiempo), distancia ASC
-        """, (lon, lat, variable, lon, lat, max_distance_km))
+            ORDER BY c.piscifactoria_id, DATE(va.fecha_tiempo), c.distancia ASC, va.fecha_tiempo DESC
+        """, {
+            'variable': variable,
+            'since': since,
+            'until': until,
+            'points': points,
+            'max_distance_km': max_distance_km
+        })
         
-        data = cursor.fetchall()
-        logger.info(f"Encontrados {len(data)} puntos de datos para {variable} cercanos a ({lon}, {lat})")
-        return data
-    except Exception as e:
-        logger.error(f"Error al obtener datos oficiales para {variable} en ({lon}, {lat}): {e}")
-        return []
-
-# Función para asignar datos a una piscifactoría
-def assign_official_data_to_farm(conn, farm_id, variable, data_points):
-    try:
-        cursor = conn.cursor()
-        count = 0
-        
-        # Obtener geometría de la piscifactoría
-        cursor.execute("""
-            SELECT ST_AsText(geometria) FROM gloria.piscifactorias WHERE id = %s
-        """, (farm_id,))
-        
-        farm_geom_text = cursor.fetchone()[0]
-        
-        for point in data_points:
-            _, dataset_id, fecha_tiempo, valor, _, profundidad, calidad, _ = point
-            
-            # Asignar a la piscifactoría
-            cursor.execute("""
-                INSERT INTO gloria.variables_ambientales
-                (dataset_id, variable_nombre, fecha_tiempo, valor, piscifactoria_id, geometria, profundidad, calidad)
-                VALUES (%s, %s, %s, %s, %s, %s, %s, %s)
-                ON CONFLICT (variable_nombre, fecha_tiempo, geometria) DO UPDATE
-                SET valor = EXCLUDED.valor, calidad = EXCLUDED.calidad
-            """, (
-                dataset_id,
-                variable,
-                fecha_tiempo,
-                valor,
-                farm_id,
-                farm_geom_text,
-                profundidad,
-                calidad
-            ))
-            
-            count += 1
-            
-            # Commit cada 100 registros
-            if count % 100 == 0:
-                conn.commit()
-        
-        # Commit final
+        count = cursor.rowcount
         conn.commit()
-        logger.info(f"Asignados {count} datos de {variable} a la piscifactoría ID {farm_id}")
         return count
     except Exception as e:
         conn.rollback()
-        logger.error(f"Error al asignar datos de {variable} a piscifactoría {farm_id}: {e}")
+        logger.error(f"Error al asignar datos de {variable}: {e}")
         return 0
 
 # Función principal
-def main():
+def main(since=None, until=None, points=DEFAULT_NEAREST_POINTS, max_distance_km=100):
     conn = None
     try:
         conn = get_db_connection()
         
-        # Obtener todas las piscifactorías
-        farms = get_all_farms(conn)
-        
         # Obtener las variables disponibles
         variables = get_available_variables(conn)
         
@@ -177,44 +150,18 @@ def main():
             return
         
         logger.info(f"Variables disponibles: {[v[0] for v in variables]}")
+        if since or until:
+            logger.info(f"Ventana temporal: {since or '-'} → {until or '-'}")
         
-        # Iniciar contadores
         total_assigned = 0
-        farms_processed = 0
         
-        # Procesar cada piscifactoría
-        for farm in farms:
-            farm_id, farm_name, farm_lon, farm_lat = farm
-            logger.info(f"Procesando piscifactoría: {farm_name} ({farm_id})")
-            
-            farm_total = 0
-            
-            # Procesar cada variable
-            for variable_name, _ in variables:
-                logger.info(f"Procesando variable {variable_name} para {farm_name}")
-                
-                # Obtener datos cercanos
-                data_points = get_nearest_official_data(conn, variable_name, farm_lon, farm_lat)
-                
-                # Si no hay suficientes datos, aumentar el radio de búsqueda
-                if len(data_points) < 30:
-                    data_points = get_nearest_official_data(conn, variable_name, farm_lon, farm_lat, max_distance_km=100)
-                
-                # Asignar los datos a la piscifactoría
-                if data_points:
-                    count = assign_official_data_to_farm(conn, farm_id, variable_name, data_points)
-                    farm_total += count
-                    total_assigned += count
-                    
-                    logger.info(f"Asignados {count} datos de {variable_name} a {farm_name}")
-                else:
-                    logger.warning(f"No se encontraron datos cercanos de {variable_name} para {farm_name}")
-            
-            logger.info(f"Total para {farm_name}: {farm_total} datos asignados")
-            farms_processed += 1
-            
-            # Informar progreso
-            logger.info(f"Progreso: {farms_processed}/{len(farms)} piscifactorías procesadas")
+        # Una sentencia por variable para todas las piscifactorías
+        for variable_name, _ in variables:
+            start = datetime.now()
+            count = assign_variable_to_all_farms(conn, variable_name, since, until, points, max_distance_km)
+            total_assigned += count
+            elapsed = (datetime.now() - start).total_seconds()
+            logger.info(f"Asignados {count} datos de {variable_name} en {elapsed:.1f}s")
         
         logger.info(f"Proceso completado. Total de datos asignados: {total_assigned}")
         
@@ -225,4 +172,17 @@ def main():
             conn.close()
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Asignar datos oficiales a las piscifactorías")
+    parser.add_argument('--since', help="Asignar solo datos desde esta fecha (ISO 8601)")
+    parser.add_argument('--until', help="Asignar solo datos hasta esta fecha (ISO 8601)")
+    parser.add_argument('--days', type=int, help="Asignar solo datos de los últimos N días")
+    parser.add_argument('--points', type=int, default=DEFAULT_NEAREST_POINTS,
+                        help="Puntos de datos más cercanos a considerar por piscifactoría")
+    parser.add_argument('--max-km', type=float, default=100, help="Distancia máxima en km")
+    args = parser.parse_args()
+    
+    since = args.since
+    if args.days is not None:
+        since = (datetime.now() - timedelta(days=args.days)).isoformat()
+    
+    main(since=since, until=args.until, points=args.points, max_distance_km=args.max_km)
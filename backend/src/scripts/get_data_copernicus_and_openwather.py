@@ -12,9 +12,13 @@ import os
 import sys
 import time
 import json
-import glob
+import fcntl
+import random
+import shutil
+import sqlite3
 import logging
 import hashlib
+import threading
 import copernicusmarine
 import pandas as pd
 import numpy as np
@@ -22,8 +26,9 @@ import psycopg2
 from pathlib import Path
 from dotenv import load_dotenv
 from datetime import datetime, timedelta
+from concurrent.futures import ThreadPoolExecutor, as_completed
 import urllib3
-from netCDF4 import Dataset
+from netCDF4 import Dataset, num2date
 
 class EnhancedPoolManager(urllib3.PoolManager):
     def __init__(self, *args, **kwargs):
@@ -46,25 +51,47 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
-# Capturador personalizado para los mensajes de copernicusmarine
-class CopernicusLogCapture(logging.Handler):
-    def __init__(self):
-        super().__init__()
-        self.download_path = None
-        
-    def emit(self, record):
-        # Captura la ruta del archivo descargado del mensaje de log
-        if record.levelname == "INFO" and "Successfully downloaded to" in record.getMessage():
-            self.download_path = record.getMessage().split("Successfully downloaded to ")[1].strip()
-
 # Constantes
 MAX_RETRY_ATTEMPTS = 5
-RETRY_DELAY = 180    # Segundos
+RETRY_BASE_DELAY = 15    # Segundos (se duplica en cada intento)
+RETRY_MAX_DELAY = 300    # Segundos
+MAX_PARALLEL_DOWNLOADS = int(os.getenv("COPERNICUS_MAX_PARALLEL", "4"))
+PER_DATASET_CONCURRENCY = 2   # Descargas simultáneas de un mismo dataset
+SPLIT_THRESHOLD = timedelta(days=2)   # Huecos mayores se piden en subperiodos diarios
+SPLIT_SPAN = timedelta(days=1)
+MAX_WINDOW_RETRIES = 5   # Ejecuciones en las que se reintenta un subperiodo fallido
 ROOT_DIR = Path(os.path.expanduser("~/webGIS-GlorIA"))
 DOWNLOAD_DIR = ROOT_DIR / "databases" / "copernicus_marine"
 PROCESSED_DIR = DOWNLOAD_DIR / "processed"
 FAILED_DIR = DOWNLOAD_DIR / "failed"
 METADATA_FILE = DOWNLOAD_DIR / "metadata.json"
+CHECKSUM_INDEX = DOWNLOAD_DIR / "checksums.sqlite"
+CHECKSUM_CHUNK_SIZE = 1024 * 1024      # Bloques de 1 MiB
+FINGERPRINT_HEADER_BYTES = 64 * 1024   # Cabecera usada en la huella rápida
+
+# Validación por muestreo de los archivos descargados
+VALIDATION_TIME_SAMPLES = 3      # Instantes leídos por variable (primero, central, último)
+VALIDATION_MAX_CELLS = 64        # Celdas por eje en cada hiperslab (con paso)
+
+# Esquema esperado por dataset: dimensiones espaciales obligatorias y unidades aceptadas
+SPATIAL_DIMS = ({'latitude', 'lat'}, {'longitude', 'lon'})
+EXPECTED_SCHEMAS = {
+    "cmems_mod_med_phy-cur_anfc_4.2km-2D_PT1H-m": {
+        "uo": ["m s-1", "m/s"],
+        "vo": ["m s-1", "m/s"],
+    },
+    "cmems_mod_med_phy-hflux_my_4.2km_P1D-m": {
+        "hfds": ["W m-2", "W/m2", "W/m^2"],
+        "hfls": ["W m-2", "W/m2", "W/m^2"],
+        "hfss": ["W m-2", "W/m2", "W/m^2"],
+    },
+    "med-cmcc-sal-rean-d": {
+        "so": ["1e-3", "psu", "PSU", "0.001"],
+    },
+    "med-cmcc-ssh-rean-d": {
+        "zos": ["m"],
+    },
+}
 
 # Crear directorios si no existen
 for directory in [DOWNLOAD_DIR, PROCESSED_DIR, FAILED_DIR]:
@@ -107,148 +134,339 @@ def load_metadata():
         logger.error(f"Error al cargar metadatos: {e}")
         return {}
 
-def save_metadata(metadata):
-    """Guarda los metadatos de las descargas."""
+def save_metadata(metadata, dataset_ids=None):
+    """
+    Guarda los metadatos de las descargas.
+    
+    Con dataset_ids, solo se reemplazan las entradas de esos datasets sobre el
+    archivo actual, de modo que dos ejecuciones simultáneas de datasets
+    distintos no se pisan. La lectura y la escritura se hacen bajo un flock.
+    """
     try:
-        with open(METADATA_FILE, 'w') as f:
-            json.dump(metadata, f, indent=2)
+        with open(METADATA_FILE.with_suffix('.lock'), 'w') as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            if dataset_ids is not None:
+                current = load_metadata()
+                current.update({ds: metadata[ds] for ds in dataset_ids if ds in metadata})
+                metadata = current
+            
+            # Escritura atómica: un fallo a mitad no deja el archivo truncado
+            tmp_file = METADATA_FILE.with_suffix(f'.json.{os.getpid()}.tmp')
+            with open(tmp_file, 'w') as f:
+                json.dump(metadata, f, indent=2)
+            os.replace(tmp_file, METADATA_FILE)
         logger.info(f"Metadatos guardados en {METADATA_FILE}")
     except Exception as e:
         logger.error(f"Error al guardar metadatos: {e}")
 
-def get_download_period(dataset_id, metadata, days_back=1):
+def get_ledger_last_timestamp(dataset_id):
+    """Último instante importado de un dataset según gloria.importaciones, o None."""
+    try:
+        conn = psycopg2.connect(
+            host=os.getenv("DB_HOST"),
+            port=os.getenv("DB_PORT"),
+            dbname=os.getenv("DB_NAME"),
+            user=os.getenv("DB_USER"),
+            password=os.getenv("DB_PASSWORD"),
+            connect_timeout=10
+        )
+    except Exception as e:
+        logger.warning(f"No se pudo consultar el registro de importaciones: {e}")
+        return None
+    
+    try:
+        cursor = conn.cursor()
+        cursor.execute("""
+            SELECT MAX(i.fecha_fin AT TIME ZONE 'UTC')
+            FROM gloria.importaciones i
+            JOIN gloria.datasets d ON d.id = i.dataset_id
+            WHERE d.dataset_id = %s
+            AND i.estado IN ('completado', 'parcial')
+        """, (dataset_id,))
+        return cursor.fetchone()[0]
+    except Exception as e:
+        logger.warning(f"Error al consultar el registro de importaciones de {dataset_id}: {e}")
+        return None
+    finally:
+        conn.close()
+
+def get_last_timestamp(dataset_id, metadata):
     """
-    Determina el período de descarga para obtener datos históricos.
-    Por defecto, descarga desde hace 1 días hasta hoy.
+    Último instante ya disponible de un dataset (UTC, sin zona horaria): el más
+    reciente entre el registro de importaciones y el guardado en metadata.json.
     """
-    # Obtener la fecha actual
-    hoy = datetime.today() - timedelta(days=365)
+    candidates = []
     
-    # Fecha de inicio: hace N días
-    fecha_inicio = hoy - timedelta(days=days_back)
+    ledger_last = get_ledger_last_timestamp(dataset_id)
+    if ledger_last:
+        candidates.append(ledger_last)
     
-    # Si hay datos previos, usar la última fecha para continuar incrementalmente
-    if dataset_id in metadata and 'last_download_date' in metadata[dataset_id]:
-        last_date_str = metadata[dataset_id]['last_download_date']
+    last_data_time = metadata.get(dataset_id, {}).get('last_data_time')
+    if last_data_time:
         try:
-            # Convertir string a datetime y añadir un día para evitar solapamiento
-            last_date = datetime.strptime(last_date_str, "%Y-%m-%dT%H:%M:%S")
-            if last_date > fecha_inicio:
-                fecha_inicio = last_date + timedelta(days=1)
-                logger.info(f"Descarga incremental para {dataset_id} desde {fecha_inicio.strftime('%Y-%m-%d')}")
-            else:
-                logger.info(f"Usando fecha de {days_back} días atrás para {dataset_id} ({fecha_inicio.strftime('%Y-%m-%d')})")
-        except Exception as e:
-            logger.warning(f"Error al parsear última fecha de descarga: {e}. Usando fecha de {days_back} días atrás.")
+            candidates.append(datetime.strptime(last_data_time, "%Y-%m-%dT%H:%M:%S"))
+        except ValueError as e:
+            logger.warning(f"Error al parsear último instante de {dataset_id}: {e}")
+    
+    return max(candidates) if candidates else None
+
+def get_download_period(dataset_id, metadata, days_back=1):
+    """
+    Determina el período de descarga: desde el último instante ya disponible
+    hasta ahora o, en la primera descarga, desde hace `days_back` días.
+    Devuelve (fecha_inicio, fecha_fin) como datetime UTC sin zona horaria.
+    """
+    # Fecha actual (UTC)
+    ahora = datetime.utcnow().replace(microsecond=0)
+    
+    last_timestamp = get_last_timestamp(dataset_id, metadata)
+    if last_timestamp:
+        # Continuar justo después del último instante para evitar solapamiento
+        fecha_inicio = last_timestamp + timedelta(seconds=1)
+        logger.info(f"Descarga incremental para {dataset_id} desde {fecha_inicio.isoformat()}")
     else:
+        fecha_inicio = ahora - timedelta(days=days_back)
         logger.info(f"Primera descarga para {dataset_id} desde {fecha_inicio.strftime('%Y-%m-%d')} (hace {days_back} días)")
     
-    # Formatear las fechas al formato que necesita la consulta
-    fecha_inicio_str = fecha_inicio.strftime("%Y-%m-%dT%H:%M:%S")
-    fecha_fin_str = hoy.strftime("%Y-%m-%dT%H:%M:%S")
+    return fecha_inicio, ahora
+
+def split_period(fecha_inicio, fecha_fin):
+    """Divide un período largo en subperiodos diarios que pueden descargarse en paralelo."""
+    if fecha_fin - fecha_inicio <= SPLIT_THRESHOLD:
+        return [(fecha_inicio, fecha_fin)]
     
-    return fecha_inicio_str, fecha_fin_str
+    # Subperiodos por día natural, sin solapar instantes entre ellos
+    periods = []
+    start = fecha_inicio
+    while start < fecha_fin:
+        next_start = (start + SPLIT_SPAN).replace(hour=0, minute=0, second=0, microsecond=0)
+        periods.append((start, min(next_start - timedelta(seconds=1), fecha_fin)))
+        start = next_start
+    return periods
+
+def pending_windows(metadata, dataset_id):
+    """Subperiodos fallidos de un dataset que quedan por reintentar: [(inicio, fin)]."""
+    return [(datetime.fromisoformat(w['inicio']), datetime.fromisoformat(w['fin']))
+            for w in metadata.get(dataset_id, {}).get('failed_windows', [])]
+
+def record_window(metadata, dataset_id, start, end, ok):
+    """
+    Anotar el resultado de la descarga de un subperiodo. Los fallidos se
+    guardan en los metadatos y se vuelven a pedir en las siguientes ejecuciones,
+    ya que el último instante disponible puede haber avanzado más allá de ellos.
+    """
+    windows = metadata.setdefault(dataset_id, {}).setdefault('failed_windows', [])
+    key = (start.isoformat(), end.isoformat())
+    previous = next((w for w in windows if (w['inicio'], w['fin']) == key), None)
+    if previous is not None:
+        windows.remove(previous)
+    if ok:
+        return
+
+    attempts = (previous['intentos'] if previous else 0) + 1
+    if attempts > MAX_WINDOW_RETRIES:
+        logger.error(f"Se abandona el subperiodo {key[0]} → {key[1]} de {dataset_id} tras {MAX_WINDOW_RETRIES} ejecuciones fallidas")
+        return
+    windows.append({'inicio': key[0], 'fin': key[1], 'intentos': attempts})
+    logger.warning(f"Subperiodo {key[0]} → {key[1]} de {dataset_id} pendiente de reintento ({attempts}/{MAX_WINDOW_RETRIES})")
 
 def calculate_checksum(filepath):
-    """Calcula un checksum para un archivo."""
+    """Calcula un checksum BLAKE2b de un archivo leyéndolo por bloques de 1 MiB."""
     try:
+        digest = hashlib.blake2b(digest_size=32)
+        buffer = bytearray(CHECKSUM_CHUNK_SIZE)
+        view = memoryview(buffer)
         with open(filepath, 'rb') as f:
-            return hashlib.md5(f.read()).hexdigest()
+            while True:
+                n_bytes = f.readinto(buffer)
+                if not n_bytes:
+                    break
+                digest.update(view[:n_bytes])
+        return digest.hexdigest()
     except Exception as e:
         logger.error(f"Error al calcular checksum: {e}")
         return None
 
-def is_duplicate(dataset_id, checksum, metadata):
-    """Verifica si los datos ya han sido descargados basándose en el checksum."""
-    if dataset_id in metadata and 'checksums' in metadata[dataset_id]:
-        if checksum in metadata[dataset_id]['checksums']:
-            return True
-    return False
+def calculate_fingerprint(filepath):
+    """Huella rápida de un archivo: tamaño y hash de la cabecera."""
+    with open(filepath, 'rb') as f:
+        header = f.read(FINGERPRINT_HEADER_BYTES)
+    size = os.path.getsize(filepath)
+    return f"{size}-{hashlib.blake2b(header, digest_size=16).hexdigest()}"
+
+def open_checksum_index():
+    """Abre (y crea si no existe) el índice SQLite de descargas. Una conexión por hilo."""
+    index = sqlite3.connect(CHECKSUM_INDEX, timeout=30)
+    index.execute("""
+        CREATE TABLE IF NOT EXISTS descargas (
+            dataset_id TEXT NOT NULL,
+            huella TEXT NOT NULL,
+            checksum TEXT,
+            file_path TEXT NOT NULL,
+            fecha_descarga TEXT NOT NULL
+        )
+    """)
+    index.execute("CREATE INDEX IF NOT EXISTS idx_descargas_huella ON descargas (dataset_id, huella)")
+    return index
 
-def find_last_downloaded_file(dataset_id):
+def _stored_checksum(index, rowid, file_path):
+    """Checksum de una descarga previa, calculándolo y guardándolo si aún no se conocía."""
+    for candidate in (Path(file_path), PROCESSED_DIR / Path(file_path).name):
+        if candidate.exists():
+            checksum = calculate_checksum(candidate)
+            if checksum:
+                index.execute("UPDATE descargas SET checksum = ? WHERE rowid = ?", (checksum, rowid))
+                index.commit()
+            return checksum
+    return None
+
+def is_duplicate(dataset_id, filepath):
     """
-    Encuentra el archivo más reciente descargado para un dataset.
-    Busca en el directorio de trabajo actual y en el directorio de descargas.
+    Verifica si los datos ya han sido descargados.
+    
+    Primero compara la huella rápida (tamaño + cabecera) con las descargas
+    previas del dataset; solo si coincide se calcula el checksum completo.
+    Devuelve (es_duplicado, huella, checksum o None).
+    """
+    fingerprint = calculate_fingerprint(filepath)
+    index = open_checksum_index()
+    try:
+        matches = index.execute(
+            "SELECT rowid, checksum, file_path FROM descargas WHERE dataset_id = ? AND huella = ?",
+            (dataset_id, fingerprint)
+        ).fetchall()
+        if not matches:
+            return False, fingerprint, None
+        
+        checksum = calculate_checksum(filepath)
+        for rowid, stored, file_path in matches:
+            if stored is None and Path(file_path) != Path(filepath):
+                stored = _stored_checksum(index, rowid, file_path)
+            if checksum and stored == checksum:
+                return True, fingerprint, checksum
+        return False, fingerprint, checksum
+    finally:
+        index.close()
+
+class CopernicusTransport:
+    """
+    Transporte por defecto: copernicusmarine.subset escribiendo en la ruta indicada.
+    Devuelve la ruta que informa el cliente (puede renombrar el archivo).
     """
-    # Buscar en el directorio actual
-    files = glob.glob(f"{dataset_id}*.nc")
     
-    # Si no se encuentra, buscar en el directorio de descargas
-    if not files:
-        files = glob.glob(str(DOWNLOAD_DIR / f"{dataset_id}*.nc"))
+    def fetch(self, dataset_id, variables, output_path, **subset_kwargs):
+        result = copernicusmarine.subset(
+            dataset_id=dataset_id,
+            variables=variables,
+            output_directory=str(output_path.parent),
+            output_filename=output_path.name,
+            **subset_kwargs
+        )
+        # Según la versión, el cliente devuelve la ruta o un objeto con file_path
+        file_path = getattr(result, 'file_path', result)
+        if file_path:
+            return Path(file_path)
+        if not output_path.exists():
+            raise FileNotFoundError(f"La descarga de {dataset_id} no generó {output_path}")
+        return output_path
+
+class FixtureTransport:
+    """Transporte local para pruebas: sirve archivos .nc de un directorio de fixtures."""
     
-    # Ordenar por fecha de modificación, más reciente primero
-    files.sort(key=os.path.getmtime, reverse=True)
+    def __init__(self, fixtures_dir):
+        self.fixtures_dir = Path(fixtures_dir)
     
-    if files:
-        return files[0]
-    return None
+    def fetch(self, dataset_id, variables, output_path, **subset_kwargs):
+        candidates = sorted(self.fixtures_dir.glob(f"{dataset_id}*.nc"))
+        if not candidates:
+            raise FileNotFoundError(f"No hay fixture para {dataset_id} en {self.fixtures_dir}")
+        shutil.copy2(candidates[-1], output_path)
+        return output_path
+
+def get_transport():
+    """Transporte configurado: fixtures locales si COPERNICUS_FIXTURES_DIR está definido."""
+    fixtures_dir = os.getenv("COPERNICUS_FIXTURES_DIR")
+    if fixtures_dir:
+        logger.info(f"Usando fixtures locales de {fixtures_dir}")
+        return FixtureTransport(fixtures_dir)
+    return CopernicusTransport()
 
-def download_with_retry(dataset_id, variables, min_lon, max_lon, min_lat, max_lat, min_depth=None, max_depth=None):
+# Límite de descargas simultáneas por dataset
+_dataset_slots = {}
+_dataset_slots_lock = threading.Lock()
+
+def dataset_slot(dataset_id):
+    """Semáforo que limita las descargas simultáneas de un mismo dataset."""
+    with _dataset_slots_lock:
+        if dataset_id not in _dataset_slots:
+            _dataset_slots[dataset_id] = threading.BoundedSemaphore(PER_DATASET_CONCURRENCY)
+        return _dataset_slots[dataset_id]
+
+def retry_delay(attempt):
+    """Espera exponencial con jitter antes del reintento número `attempt` (desde 1)."""
+    delay = min(RETRY_MAX_DELAY, RETRY_BASE_DELAY * 2 ** (attempt - 1))
+    return random.uniform(delay / 2, delay)
+
+def download_with_retry(dataset_id, variables, min_lon, max_lon, min_lat, max_lat, min_depth=None, max_depth=None,
+                        transport=None, start_datetime=None, end_datetime=None):
     """Descarga datos con reintentos en caso de error. Si no se especifican fechas, descarga todo el rango disponible."""
+    transport = transport or CopernicusTransport()
+    
+    # Sin guiones bajos tras el ID: process_data obtiene el dataset del nombre del archivo
+    if start_datetime and end_datetime:
+        suffix = f"{start_datetime:%Y%m%dT%H%M%S}-{end_datetime:%Y%m%dT%H%M%S}"
+    else:
+        suffix = datetime.now().strftime("%Y%m%dT%H%M%S")
+    output_path = DOWNLOAD_DIR / f"{dataset_id}_{suffix}.nc"
     attempts = 0
     
-    while attempts < MAX_RETRY_ATTEMPTS:
-        try:
-            logger.info(f"Intentando descargar {dataset_id} - Intento {attempts + 1}")
-            
-            # Registra los logs de copernicusmarine para capturar la ruta del archivo
-            log_capture = CopernicusLogCapture()
-            copernicusmarine_logger = logging.getLogger("copernicusmarine")
-            copernicusmarine_logger.addHandler(log_capture)
-            
-            # Llamada a la API de Copernicus sin especificar fechas
-            # Esto hará que se descargue todo el rango de tiempo disponible
-            copernicusmarine.subset(
-                dataset_id=dataset_id,
-                variables=variables,
-                minimum_longitude=min_lon,
-                maximum_longitude=max_lon,
-                minimum_latitude=min_lat,
-                maximum_latitude=max_lat,
-                minimum_depth=min_depth,
-                maximum_depth=max_depth,
-                # Sin start_datetime ni end_datetime
-            )
-            
-            # Elimina el capturador de logs
-            copernicusmarine_logger.removeHandler(log_capture)
-            
-            # Si capturamos la ruta del archivo, la devolvemos
-            if log_capture.download_path:
-                return log_capture.download_path
-            
-            # Si no se captura la ruta del archivo pero la descarga parece exitosa,
-            # intentamos encontrar el archivo descargado
-            downloaded_file = find_last_downloaded_file(dataset_id)
-            if downloaded_file:
-                return downloaded_file
-            
-            # Si no podemos encontrar el archivo, lanzamos una excepción
-            raise ValueError("No se pudo determinar la ruta del archivo descargado")
-            
-        except Exception as e:
-            attempts += 1
-            logger.warning(f"Error al descargar {dataset_id} (intento {attempts}): {e}")
-            
-            # Intentar encontrar el archivo por última vez
-            downloaded_file = find_last_downloaded_file(dataset_id)
-            if downloaded_file:
-                return downloaded_file
+    with dataset_slot(dataset_id):
+        while attempts < MAX_RETRY_ATTEMPTS:
+            # Un archivo de un intento anterior puede estar incompleto
+            output_path.unlink(missing_ok=True)
+            try:
+                logger.info(f"Intentando descargar {dataset_id} - Intento {attempts + 1}")
                 
-            if attempts >= MAX_RETRY_ATTEMPTS:
-                logger.error(f"No se pudo descargar {dataset_id} después de {MAX_RETRY_ATTEMPTS} intentos")
-                raise
-            
-            # Esperar antes de reintentar
-            logger.info(f"Esperando {RETRY_DELAY} segundos antes de reintentar...")
-            time.sleep(RETRY_DELAY)
+                return transport.fetch(
+                    dataset_id,
+                    variables,
+                    output_path,
+                    minimum_longitude=min_lon,
+                    maximum_longitude=max_lon,
+                    minimum_latitude=min_lat,
+                    maximum_latitude=max_lat,
+                    minimum_depth=min_depth,
+                    maximum_depth=max_depth,
+                    start_datetime=start_datetime,
+                    end_datetime=end_datetime,
+                )
+                
+            except Exception as e:
+                attempts += 1
+                logger.warning(f"Error al descargar {dataset_id} (intento {attempts}): {e}")
+                output_path.unlink(missing_ok=True)
+                
+                if attempts >= MAX_RETRY_ATTEMPTS:
+                    logger.error(f"No se pudo descargar {dataset_id} después de {MAX_RETRY_ATTEMPTS} intentos")
+                    raise
+                
+                # Esperar antes de reintentar (solo bloquea este dataset)
+                delay = retry_delay(attempts)
+                logger.info(f"Esperando {delay:.0f} segundos antes de reintentar {dataset_id}...")
+                time.sleep(delay)
 
 def download_and_save(dataset_id, variables, min_lon, max_lon, min_lat, max_lat, metadata, 
-                     min_depth=None, max_depth=None, download_all=True):
-    """Descarga y guarda datos, verifica duplicados y actualiza metadatos."""
-    # Iniciar el proceso de descarga
-    logger.info(f"Descargando todos los datos disponibles para {dataset_id}")
+                     min_depth=None, max_depth=None, transport=None, start_datetime=None, end_datetime=None):
+    """
+    Descarga y guarda datos y verifica duplicados.
+    No modifica los metadatos (se ejecuta en paralelo): devuelve el registro de
+    la descarga para record_download, None si los datos ya estaban descargados
+    (duplicado) o False si la descarga falla.
+    """
+    if start_datetime and end_datetime:
+        logger.info(f"Descargando {dataset_id} de {start_datetime.isoformat()} a {end_datetime.isoformat()}")
+    else:
+        logger.info(f"Descargando todos los datos disponibles para {dataset_id}")
     
     try:
         # Descargar los datos con reintentos
@@ -261,7 +479,9 @@ def download_and_save(dataset_id, variables, min_lon, max_lon, min_lat, max_lat,
             max_lat=max_lat,
             min_depth=min_depth,
             max_depth=max_depth,
-            # Sin parámetros de fecha
+            transport=transport,
+            start_datetime=start_datetime,
+            end_datetime=end_datetime
         )
         
         # Verificar que el archivo existe
@@ -269,144 +489,261 @@ def download_and_save(dataset_id, variables, min_lon, max_lon, min_lat, max_lat,
             logger.error(f"El archivo descargado no existe: {downloaded_file}")
             return False
             
-        # Calcular checksum
-        checksum = calculate_checksum(downloaded_file)
-        
-        # Verificar si es un duplicado
-        if checksum and is_duplicate(dataset_id, checksum, metadata):
+        # Verificar si es un duplicado (huella rápida primero, checksum solo si coincide)
+        duplicate, fingerprint, checksum = is_duplicate(dataset_id, downloaded_file)
+        if duplicate:
             logger.info(f"Datos duplicados detectados para {dataset_id}. Omitiendo guardado.")
             # Eliminamos el archivo duplicado
             os.remove(downloaded_file)
-            return False
-        
-        # Copiar el archivo a nuestro directorio de datos si es necesario
-        if not str(downloaded_file).startswith(str(DOWNLOAD_DIR)):
-            # Definir el nombre del archivo y la ruta completa
-            timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-            output_filename = DOWNLOAD_DIR / f"{dataset_id}_{timestamp}.nc"
-            
-            # Copiar el archivo
-            import shutil
-            shutil.copy2(downloaded_file, output_filename)
-            logger.info(f"Archivo copiado de {downloaded_file} a {output_filename}")
-            
-            # Usar la nueva ruta para el registro
-            downloaded_file = output_filename
-        
-        # Actualizar metadatos
-        if dataset_id not in metadata:
-            metadata[dataset_id] = {
-                'checksums': [],
-                'files': [],
-                'last_download_date': None
-            }
-        
-        if checksum:
-            metadata[dataset_id]['checksums'].append(checksum)
-        metadata[dataset_id]['files'].append(str(downloaded_file))
-        
-        # Usar la fecha actual como fecha de descarga
-        current_date = datetime.now().strftime("%Y-%m-%dT%H:%M:%S")
-        metadata[dataset_id]['last_download_date'] = current_date
+            return None
         
         logger.info(f"Datos guardados en: {downloaded_file}")
-        return downloaded_file
+        return {
+            'dataset_id': dataset_id,
+            'file_path': str(downloaded_file),
+            'fingerprint': fingerprint,
+            'checksum': checksum,
+            'download_date': datetime.now().strftime("%Y-%m-%dT%H:%M:%S"),
+            'start_datetime': start_datetime,
+            'end_datetime': end_datetime
+        }
         
     except Exception as e:
         logger.error(f"Error al procesar {dataset_id}: {e}")
         return False
 
-def verify_netcdf_content(file_path):
-    """Verifica que el archivo NetCDF tenga contenido válido."""
+def record_download(metadata, record):
+    """Incorporar a los metadatos el registro de una descarga."""
+    dataset_id = record['dataset_id']
+    if dataset_id not in metadata:
+        metadata[dataset_id] = {
+            'files': [],
+            'last_download_date': None
+        }
+    
+    # Las huellas y checksums van al índice SQLite, no a la lista de metadatos
+    index = open_checksum_index()
+    try:
+        index.execute(
+            "INSERT INTO descargas (dataset_id, huella, checksum, file_path, fecha_descarga) VALUES (?, ?, ?, ?, ?)",
+            (dataset_id, record['fingerprint'], record['checksum'], record['file_path'], record['download_date'])
+        )
+        index.commit()
+    finally:
+        index.close()
+    
+    metadata[dataset_id].setdefault('files', []).append(record['file_path'])
+    metadata[dataset_id]['last_download_date'] = record['download_date']
+
+def record_last_data_time(metadata, dataset_id, time_range):
+    """Guardar en los metadatos el último instante disponible de un dataset."""
+    if not time_range:
+        return
+    last = datetime.fromisoformat(time_range[1]).strftime("%Y-%m-%dT%H:%M:%S")
+    previous = metadata.setdefault(dataset_id, {}).get('last_data_time')
+    if previous is None or last > previous:
+        metadata[dataset_id]['last_data_time'] = last
+
+def _sample_hyperslabs(var, time_dim_index):
+    """Genera unos pocos hiperslabs con paso de una variable (sin leerla entera)."""
+    shape = var.shape
+    n_times = shape[time_dim_index] if time_dim_index is not None else 1
+    time_positions = sorted({0, n_times // 2, n_times - 1})[:VALIDATION_TIME_SAMPLES]
+    
+    for t_pos in time_positions:
+        slab = []
+        for axis, size in enumerate(shape):
+            if axis == time_dim_index:
+                slab.append(t_pos)
+            elif axis >= len(shape) - 2:
+                # Ejes espaciales: como mucho VALIDATION_MAX_CELLS celdas con paso
+                slab.append(slice(0, size, max(1, -(-size // VALIDATION_MAX_CELLS))))
+            else:
+                # Otros ejes (profundidad): solo el primer nivel
+                slab.append(0)
+        yield var[tuple(slab)]
+
+def verify_netcdf_content(file_path, dataset_id=None, start_datetime=None, end_datetime=None):
+    """
+    Verifica que el archivo NetCDF tenga contenido válido leyendo solo muestras.
+    
+    Comprueba el esquema esperado del dataset (dimensiones y unidades), que el
+    eje temporal cubra la ventana solicitada y que cada variable de datos tenga
+    valores válidos en unos pocos hiperslabs con paso.
+    Devuelve un informe: {'valid', 'file', 'time_range', 'variables', 'errors', 'warnings'}.
+    """
+    report = {
+        'valid': False,
+        'file': str(file_path),
+        'time_range': None,
+        'variables': {},
+        'errors': [],
+        'warnings': []
+    }
+    schema = EXPECTED_SCHEMAS.get(dataset_id, {})
+    
     try:
         with Dataset(file_path, 'r') as nc:
-            # Verificar que hay variables y que tienen datos
-            has_data = False
-            for var_name in nc.variables:
+            # Eje temporal: solo el primer y el último instante
+            if 'time' in nc.variables and nc.variables['time'].size > 0:
+                time_var = nc.variables['time']
+                first, last = num2date([time_var[0], time_var[-1]], time_var.units,
+                                       only_use_cftime_datetimes=False,
+                                       only_use_python_datetimes=True)
+                report['time_range'] = (first.isoformat(), last.isoformat())
+                
+                window_start = pd.Timestamp(start_datetime).to_pydatetime() if start_datetime else None
+                window_end = pd.Timestamp(end_datetime).to_pydatetime() if end_datetime else None
+                if window_start and last < window_start.replace(tzinfo=None):
+                    report['errors'].append(f"Sin datos posteriores a {start_datetime} (último instante {last})")
+                elif window_end and first > window_end.replace(tzinfo=None):
+                    report['errors'].append(f"Sin datos anteriores a {end_datetime} (primer instante {first})")
+                elif window_start and first > window_start.replace(tzinfo=None):
+                    report['warnings'].append(f"Cobertura parcial: el archivo empieza en {first}")
+            else:
+                report['errors'].append("El archivo no tiene eje temporal")
+            
+            # Variables esperadas por el esquema del dataset
+            for var_name in schema:
+                if var_name not in nc.variables:
+                    report['errors'].append(f"Falta la variable {var_name}")
+            
+            data_variables = [name for name, var in nc.variables.items()
+                              if name not in nc.dimensions and var.ndim >= 2]
+            
+            for var_name in data_variables:
                 var = nc.variables[var_name]
-                # Verificar que no es una variable de dimensión y tiene datos
-                if len(var.shape) > 0 and var.size > 0:
-                    # Intentar leer algunos datos para verificar
-                    try:
-                        sample = var[:]
-                        if np.any(~np.isnan(sample)):
-                            has_data = True
-                            break
-                    except:
-                        continue
+                dims = var.dimensions
+                units = getattr(var, 'units', None)
+                time_dim_index = dims.index('time') if 'time' in dims else None
+                
+                sampled = 0
+                valid_values = 0
+                for slab in _sample_hyperslabs(var, time_dim_index):
+                    values = np.ma.filled(np.ma.asarray(slab, dtype=np.float64), np.nan)
+                    sampled += values.size
+                    valid_values += int(np.count_nonzero(np.isfinite(values)))
+                
+                report['variables'][var_name] = {
+                    'dims': list(dims),
+                    'shape': list(var.shape),
+                    'units': units,
+                    'sampled': sampled,
+                    'valid': valid_values
+                }
+                
+                if not all(any(d in names for d in dims) for names in SPATIAL_DIMS):
+                    report['errors'].append(f"{var_name}: dimensiones inesperadas {dims}")
+                if var_name in schema and units not in schema[var_name]:
+                    report['errors'].append(f"{var_name}: unidades '{units}', se esperaba una de {schema[var_name]}")
+                if valid_values == 0:
+                    report['warnings'].append(f"{var_name}: sin valores válidos en las muestras")
             
-            return has_data
+            if not any(info['valid'] for info in report['variables'].values()):
+                report['errors'].append("Ninguna variable tiene valores válidos en las muestras")
     except Exception as e:
         logger.error(f"Error al verificar contenido de NetCDF {file_path}: {e}")
-        return False
+        report['errors'].append(str(e))
+    
+    report['valid'] = not report['errors']
+    return report
 
-def main():
-    """Función principal que coordina todo el proceso."""
-    try:
-        # Configurar entorno y credenciales
+# Lista de datasets a descargar con foco en la Comunidad Valenciana y Murcia
+DATASETS = [
+    # Corrientes (Physical - Currents)
+    {
+        "id": "cmems_mod_med_phy-cur_anfc_4.2km-2D_PT1H-m",
+        "variables": ["uo", "vo"],
+        "min_lon": -1.5,
+        "max_lon": 1.0,  # Ampliado para cubrir mejor la costa valenciana
+        "min_lat": 37.0,  # Desde Murcia
+        "max_lat": 40.5,  # Hasta norte de Valencia
+        "min_depth": 1.0182366371154785,
+        "max_depth": 1.0182366371154785,
+        "days_back": 15,  # Datos de 1 días atrás
+    },
+
+    # Heat Flux (Physical - Heat Flux)
+    {
+        "id": "cmems_mod_med_phy-hflux_my_4.2km_P1D-m",
+        "variables": ["hfds", "hfls", "hfss"],
+        "min_lon": -1.5,
+        "max_lon": 1.0,
+        "min_lat": 37.0,
+        "max_lat": 40.5,
+        "days_back": 15,
+    },
+
+    # Salinity (Physical - Salinity)
+    {
+        "id": "med-cmcc-sal-rean-d",
+        "variables": ["so"],
+        "min_lon": -1.5,
+        "max_lon": 1.0,
+        "min_lat": 37.0,
+        "max_lat": 40.5,
+        "min_depth": 1.0182366371154785,
+        "max_depth": 1.0182366371154785,
+        "days_back": 15,
+    },
+
+    # Sea Surface Height (Physical - SSH)
+    {
+        "id": "med-cmcc-ssh-rean-d",
+        "variables": ["zos"],
+        "min_lon": -1.5,
+        "max_lon": 1.0,
+        "min_lat": 37.0,
+        "max_lat": 40.5,
+        "days_back": 15,
+    },
+
+]
+
+def prepare_transport():
+    """Obtiene el transporte de descarga y configura el entorno que necesita."""
+    transport = get_transport()
+    if isinstance(transport, CopernicusTransport):
         setup_environment()
-        
-        # Cargar metadatos existentes
-        metadata = load_metadata()
-        
-        # Lista de datasets a descargar con foco en la Comunidad Valenciana y Murcia
-        datasets = [
-            # Corrientes (Physical - Currents)
-            {
-                "id": "cmems_mod_med_phy-cur_anfc_4.2km-2D_PT1H-m",
-                "variables": ["uo", "vo"],
-                "min_lon": -1.5,
-                "max_lon": 1.0,  # Ampliado para cubrir mejor la costa valenciana
-                "min_lat": 37.0,  # Desde Murcia
-                "max_lat": 40.5,  # Hasta norte de Valencia
-                "min_depth": 1.0182366371154785,
-                "max_depth": 1.0182366371154785,
-                "days_back": 15,  # Datos de 1 días atrás
-            },
-            
-            # Heat Flux (Physical - Heat Flux)
-            {
-                "id": "cmems_mod_med_phy-hflux_my_4.2km_P1D-m",
-                "variables": ["hfds", "hfls", "hfss"],
-                "min_lon": -1.5,
-                "max_lon": 1.0,
-                "min_lat": 37.0,
-                "max_lat": 40.5,
-                "days_back": 15,
-            },
-            
-            # Salinity (Physical - Salinity)
-            {
-                "id": "med-cmcc-sal-rean-d",
-                "variables": ["so"],
-                "min_lon": -1.5,
-                "max_lon": 1.0,
-                "min_lat": 37.0,
-                "max_lat": 40.5,
-                "min_depth": 1.0182366371154785,
-                "max_depth": 1.0182366371154785,
-                "days_back": 15,
-            },
-            
-            # Sea Surface Height (Physical - SSH)
-            {
-                "id": "med-cmcc-ssh-rean-d",
-                "variables": ["zos"],
-                "min_lon": -1.5,
-                "max_lon": 1.0,
-                "min_lat": 37.0,
-                "max_lat": 40.5,
-                "days_back": 15,
-            },
+    else:
+        # Con fixtures locales no hace falta iniciar sesión en Copernicus
+        load_dotenv(dotenv_path=ROOT_DIR / '.env')
+    return transport
+
+def download_datasets(metadata, transport=None, datasets=DATASETS):
+    """
+    Descarga en paralelo el período pendiente de cada dataset.
+    Devuelve los registros de las descargas nuevas (ya incorporados a los metadatos).
+    """
+    transport = transport or CopernicusTransport()
     
-        ]
+    # Subperiodos fallidos en ejecuciones anteriores y el período sin descargar
+    # de cada dataset (los huecos largos en subperiodos diarios)
+    requests = []
+    for dataset in datasets:
+        retries = pending_windows(metadata, dataset["id"])
+        if retries:
+            logger.info(f"Reintentando {len(retries)} subperiodos fallidos de {dataset['id']}")
+        requests.extend((dataset, start, end) for start, end in retries)
         
-        # Lista para guardar los archivos descargados correctamente
-        downloaded_files = []
-        
-        # Llamada a la función de descarga para cada dataset
-        for dataset in datasets:
-            result = download_and_save(
+        fecha_inicio, fecha_fin = get_download_period(dataset["id"], metadata, dataset.get("days_back", 1))
+        if fecha_inicio >= fecha_fin:
+            logger.info(f"Sin datos nuevos que descargar para {dataset['id']}")
+            continue
+        for start, end in split_period(fecha_inicio, fecha_fin):
+            if (start, end) not in retries:
+                requests.append((dataset, start, end))
+    
+    logger.info(f"{len(requests)} descargas programadas para {len(datasets)} datasets")
+    records = []
+    if not requests:
+        return records
+    
+    # Descargar en paralelo: el tiempo total es el del dataset más lento
+    with ThreadPoolExecutor(max_workers=max(1, min(MAX_PARALLEL_DOWNLOADS, len(requests)))) as executor:
+        futures = {
+            executor.submit(
+                download_and_save,
                 dataset_id=dataset["id"],
                 variables=dataset["variables"],
                 min_lon=dataset.get("min_lon"),
@@ -415,42 +752,83 @@ def main():
                 max_lat=dataset.get("max_lat"),
                 metadata=metadata,
                 min_depth=dataset.get("min_depth"),
-                max_depth=dataset.get("max_depth")
-                # Sin parámetros de fecha
-            )
-            
-            if result:
-                # Verificar que el archivo tiene contenido válido
-                if verify_netcdf_content(result):
-                    downloaded_files.append({
-                        "file_path": result,
-                        "dataset_id": dataset["id"],
-                        "variables": dataset["variables"]
-                    })
-                    logger.info(f"Archivo válido: {result}")
-                else:
-                    logger.warning(f"Archivo sin datos válidos: {result}")
-                    # Mover a directorio de fallidos
-                    import shutil
-                    failure_dest = FAILED_DIR / os.path.basename(result)
-                    shutil.move(result, failure_dest)
-                    logger.info(f"Archivo movido a {failure_dest}")
+                max_depth=dataset.get("max_depth"),
+                transport=transport,
+                start_datetime=start,
+                end_datetime=end
+            ): (dataset, start, end)
+            for dataset, start, end in requests
+        }
         
-        # Guardar metadatos actualizados
-        save_metadata(metadata)
-        
-        logger.info(f"Proceso completado. Archivos descargados: {len(downloaded_files)}/{len(datasets)}")
+        # Los metadatos se actualizan en este hilo según terminan las descargas
+        for future in as_completed(futures):
+            dataset, start, end = futures[future]
+            record = future.result()
+            if record is False:
+                record_window(metadata, dataset["id"], start, end, ok=False)
+            elif record is None:
+                record_window(metadata, dataset["id"], start, end, ok=True)
+            else:
+                # El subperiodo queda resuelto al validar el archivo
+                record['variables'] = dataset["variables"]
+                record_download(metadata, record)
+                records.append(record)
+    
+    logger.info(f"Descargas completadas: {len(records)}/{len(requests)}")
+    return records
+
+def validate_downloads(records, metadata):
+    """
+    Verifica por muestreo los archivos descargados. Los no válidos se mueven a
+    FAILED_DIR. Devuelve la lista de archivos válidos.
+    """
+    downloaded_files = []
+    
+    for record in records:
+        result = record['file_path']
+        report = verify_netcdf_content(result, dataset_id=record['dataset_id'],
+                                       start_datetime=record.get('start_datetime'),
+                                       end_datetime=record.get('end_datetime'))
+        for warning in report['warnings']:
+            logger.warning(f"{os.path.basename(result)}: {warning}")
         
-        # Si hay archivos descargados, proceder con el procesamiento
-        if downloaded_files:
-            logger.info("Iniciando el procesamiento de datos...")
-            # Llamar al script de procesamiento
-            process_command = f"{sys.executable} {ROOT_DIR}/backend/src/scripts/process_data.py"
-            os.system(process_command)
+        if record.get('start_datetime') and record.get('end_datetime'):
+            record_window(metadata, record['dataset_id'], record['start_datetime'], record['end_datetime'],
+                          ok=report['valid'])
         
-    except Exception as e:
-        logger.error(f"Error en el proceso principal: {e}")
+        if report['valid']:
+            record_last_data_time(metadata, record['dataset_id'], report['time_range'])
+            downloaded_files.append({
+                "file_path": result,
+                "dataset_id": record['dataset_id'],
+                "variables": record.get('variables', [])
+            })
+            logger.info(f"Archivo válido: {result}")
+        else:
+            logger.warning(f"Archivo sin datos válidos: {result} ({'; '.join(report['errors'])})")
+            # Mover a directorio de fallidos
+            failure_dest = FAILED_DIR / os.path.basename(result)
+            shutil.move(result, failure_dest)
+            logger.info(f"Archivo movido a {failure_dest}")
+    
+    return downloaded_files
+
+def main():
+    """
+    Función principal: descarga y valida el período pendiente de cada dataset.
+    La cadena completa (extracción, carga, asignación, predicción y refresco)
+    se ejecuta con pipeline.py, que usa las funciones de este módulo.
+    """
+    transport = prepare_transport()
+    metadata = load_metadata()
+    records = download_datasets(metadata, transport)
+    downloaded_files = validate_downloads(records, metadata)
+    save_metadata(metadata)
+    
+    logger.info(f"{len(downloaded_files)} archivos válidos en {DOWNLOAD_DIR}. "
+                f"Para procesarlos: python pipeline.py --from-stage extract")
+    if len(downloaded_files) < len(records):
         sys.exit(1)
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
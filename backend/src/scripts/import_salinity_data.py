@@ -2,15 +2,18 @@
 import os
 import sys
 import logging
-import numpy as np
 import copernicusmarine
 import psycopg2
-from psycopg2.extras import execute_values
 from pathlib import Path
 from dotenv import load_dotenv
 from datetime import datetime, timedelta
 from netCDF4 import Dataset
 
+# Librería compartida con python-services (motor de ingesta)
+sys.path.insert(0, str(Path(__file__).resolve().parents[3] / "python-services"))
+from app.ingest import get_spec, ingest_file, PostgresSink
+from app.query_profiler import connect_kwargs
+
 # Configuración de logging
 logging.basicConfig(
     level=logging.INFO,
@@ -62,7 +65,8 @@ def get_db_connection():
             port=os.getenv("DB_PORT"),
             dbname=os.getenv("DB_NAME"),
             user=os.getenv("DB_USER"),
-            password=os.getenv("DB_PASSWORD")
+            password=os.getenv("DB_PASSWORD"),
+            **connect_kwargs()
         )
         logger.info("Conexión con la base de datos establecida correctamente")
         return conn
@@ -179,6 +183,10 @@ def get_or_create_dataset(conn, dataset_name, dataset_id, variables):
         logger.error(f"Error al obtener/crear dataset en la base de datos: {e}")
         raise
 
+def salinity_spec():
+    """Especificación de ingesta (ver app.ingest) de los archivos de salinidad."""
+    return get_spec('salinidad')
+
 def process_salinity_file(file_path, conn):
     """Procesa el archivo NetCDF de salinidad y carga los datos en la base de datos."""
     try:
@@ -199,99 +207,21 @@ def process_salinity_file(file_path, conn):
             dataset_id = "cmems_mod_med_phy-sal_anfc_4.2km_P1D-m"
             variables = ["salinidad"]
             dataset_db_id = get_or_create_dataset(conn, dataset_name, dataset_id, variables)
-            
-            # Obtener coordenadas
-            lat_var_name = 'latitude' if 'latitude' in nc.variables else 'lat'
-            lon_var_name = 'longitude' if 'longitude' in nc.variables else 'lon'
-            time_var_name = 'time'
-            
-            lats = nc.variables[lat_var_name][:]
-            lons = nc.variables[lon_var_name][:]
-            times = nc.variables[time_var_name][:]
-            time_units = nc.variables[time_var_name].units
-            
-            # Convertir tiempos a fechas
-            import netCDF4
-            dates = netCDF4.num2date(times, time_units)
-            
-            # Obtener datos de salinidad
-            salinity_data = nc.variables['so'][:]
-            
-            # Imprimir latitudes y longitudes
-            print("Latitudes:", nc.variables['latitude'][:])
-            print("Longitudes:", nc.variables['longitude'][:])
-            
-            # Preparar cursor para inserciones
-            cursor = conn.cursor()
-            
-            # Contador de registros insertados
-            inserted_count = 0
-            values_to_insert = []
-            
-            # Procesar los datos
-            for t_idx, date in enumerate(dates):
-                date_str = date.strftime('%Y-%m-%dT%H:%M:%S')
-                
-                for y_idx, lat in enumerate(lats):
-                    for x_idx, lon in enumerate(lons):
-                        try:
-                            # Acceder al valor con manejo seguro
-                            value = float(salinity_data[t_idx, y_idx, x_idx])
-                            
-                            # Validar el valor
-                            if np.isnan(value) or value < 0 or value > 50:
-                                continue
-                            
-                            # Preparar punto geográfico
-                            geom = f"SRID=4326;POINT({lon} {lat})"
-                            
-                            # Añadir a la lista para inserción
-                            values_to_insert.append((
-                                dataset_db_id,
-                                'salinidad',
-                                date_str,
-                                value,
-                                None,  # No hay piscifactoría asociada
-                                geom,
-                                None,  # No hay profundidad
-                                90  # Calidad por defecto
-                            ))
-                        except Exception as e:
-                            logger.debug(f"Error al procesar valor: {e}")
-                            continue
-            
-            if not values_to_insert:
-                logger.warning("No se encontraron datos válidos para insertar.")
-                return False
-            
-            # Insertar valores en la base de datos
-            if values_to_insert:
-                logger.info(f"Insertando {len(values_to_insert)} registros de salinidad")
-                
-                # Insertar en lotes
-                batch_size = 1000
-                for i in range(0, len(values_to_insert), batch_size):
-                    batch = values_to_insert[i:i+batch_size]
-                    try:
-                        execute_values(cursor, """
-                            INSERT INTO gloria.variables_ambientales
-                            (dataset_id, variable_nombre, fecha_tiempo, valor, piscifactoria_id, geometria, profundidad, calidad)
-                            VALUES %s
-                            ON CONFLICT (variable_nombre, fecha_tiempo, geometria) DO UPDATE
-                            SET valor = EXCLUDED.valor, calidad = EXCLUDED.calidad
-                        """, batch, template="(%s, %s, %s, %s, %s, %s, %s, %s)")
-                        
-                        conn.commit()
-                        inserted_count += len(batch)
-                        logger.info(f"Insertados {len(batch)} registros (total: {inserted_count})")
-                    except Exception as e:
-                        conn.rollback()
-                        logger.error(f"Error al insertar lote: {e}")
-            
-            logger.info(f"Procesamiento completado. {inserted_count} registros insertados.")
-            return inserted_count > 0
+        
+        # Lectura por bloques, filtrado de rango y carga por COPY (ver app.ingest);
+        # la geometría se construye en el servidor a partir de lon/lat
+        result = ingest_file(file_path, salinity_spec(), [PostgresSink(conn, dataset_db_id)])
+        inserted_count = sum(result['counts'].values())
+        
+        if inserted_count == 0:
+            logger.warning("No se encontraron datos válidos para insertar.")
+            return False
+        
+        logger.info(f"Procesamiento completado. {inserted_count} registros insertados.")
+        return True
     
     except Exception as e:
+        conn.rollback()
         logger.error(f"Error al procesar archivo de salinidad: {e}")
         return False
 
@@ -5,12 +5,17 @@ import logging
 import numpy as np
 import copernicusmarine
 import psycopg2
-from psycopg2.extras import execute_values
 from pathlib import Path
 from dotenv import load_dotenv
 from datetime import datetime, timedelta
 from netCDF4 import Dataset
 
+# Librería compartida con python-services (motor de ingesta)
+sys.path.insert(0, str(Path(__file__).resolve().parents[3] / "python-services"))
+from app.ingest import get_spec, ingest_file, PostgresSink
+from app.query_profiler import connect_kwargs
+from app.time_axis import read_time_axis
+
 # Configuración de logging
 logging.basicConfig(
     level=logging.INFO,
@@ -28,6 +33,9 @@ DOWNLOAD_DIR = ROOT_DIR / "databases" / "copernicus_marine"
 PROCESSED_DIR = DOWNLOAD_DIR / "processed"
 FAILED_DIR = DOWNLOAD_DIR / "failed"
 
+# Valores por bloque de lectura (tiempo × profundidad × lat × lon); limita la memoria
+SLAB_VALUES = int(os.getenv("TEMPERATURE_SLAB_VALUES", "2000000"))
+
 # Crear directorios si no existen
 for directory in [DOWNLOAD_DIR, PROCESSED_DIR, FAILED_DIR]:
     directory.mkdir(parents=True, exist_ok=True)
@@ -62,7 +70,8 @@ def get_db_connection():
             port=os.getenv("DB_PORT"),
             dbname=os.getenv("DB_NAME"),
             user=os.getenv("DB_USER"),
-            password=os.getenv("DB_PASSWORD")
+            password=os.getenv("DB_PASSWORD"),
+            **connect_kwargs()
         )
         logger.info("Conexión con la base de datos establecida correctamente")
         return conn
@@ -183,44 +192,55 @@ def find_closest_piscifactoria(conn, lon, lat, max_distance_km=20.0):
     """Encuentra la piscifactoría más cercana a las coordenadas dadas."""
     try:
         cursor = conn.cursor()
-        
-        # Consulta para encontrar piscifactoría más cercana
         cursor.execute(
-            """
-            SELECT id, ST_Distance(
-                geometria::geography, 
-                ST_SetSRID(ST_MakePoint(%s, %s), 4326)::geography
-            ) as distance_meters,
-            CASE 
-                WHEN geom_area IS NOT NULL THEN 
-                  ST_Contains(geom_area, ST_SetSRID(ST_MakePoint(%s, %s), 4326))
-                ELSE false
-            END as dentro_del_area
-            FROM gloria.piscifactorias
-            WHERE ST_DWithin(
-                geometria::geography, 
-                ST_SetSRID(ST_MakePoint(%s, %s), 4326)::geography, 
-                %s * 1000  -- Convertir km a metros
-            )
-            ORDER BY dentro_del_area DESC, distance_meters ASC
-            LIMIT 1
-            """,
-            (lon, lat, lon, lat, lon, lat, max_distance_km)
+            "SELECT gloria.farm_for_point(%s, %s, %s)",
+            (lon, lat, max_distance_km)
         )
-        
-        result = cursor.fetchone()
-        
-        if result:
-            piscifactoria_id, distance, dentro_area = result
-            return piscifactoria_id
-        else:
-            return None
+        return cursor.fetchone()[0]
     except Exception as e:
+        conn.rollback()
         logger.error(f"Error al buscar piscifactoría cercana: {e}")
         return None
 
-def process_temperature_file(file_path, conn):
-    """Procesa el archivo NetCDF de temperatura y carga los datos en la base de datos."""
+def find_closest_piscifactorias(conn, lat_values, lon_values, max_distance_km=20.0):
+    """Piscifactoría más cercana de cada punto de una malla: {(lat, lon): ID o None}."""
+    points = [(float(lat), float(lon)) for lat in lat_values for lon in lon_values]
+    if not points:
+        return {}
+    try:
+        cursor = conn.cursor()
+        cursor.execute(
+            "SELECT gloria.farms_for_points(%s::float8[], %s::float8[], %s)",
+            ([lon for _, lon in points], [lat for lat, _ in points], max_distance_km)
+        )
+        return dict(zip(points, cursor.fetchone()[0]))
+    except Exception as e:
+        conn.rollback()
+        logger.error(f"Error al buscar piscifactorías cercanas: {e}")
+        return {}
+
+def temperature_spec(nc, depth_levels=None):
+    """
+    Especificación de ingesta (ver app.ingest) de un archivo de temperatura
+    abierto: todos los instantes de los niveles pedidos y un muestreo espacial
+    de unos 500 puntos por nivel.
+    """
+    n_lats = len(nc.variables['latitude' if 'latitude' in nc.variables else 'lat'])
+    n_lons = len(nc.variables['longitude' if 'longitude' in nc.variables else 'lon'])
+    sample_factor = max(1, int(np.sqrt(n_lats * n_lons / 500)))
+    return get_spec('temperatura', target='temperatura', depth=depth_levels,
+                    bbox=None, stride=sample_factor)
+
+def process_temperature_file(file_path, conn, depth_levels=None, slab_values=SLAB_VALUES):
+    """
+    Procesa el archivo NetCDF de temperatura y carga los datos en la base de datos.
+    
+    - depth_levels: profundidades (m) a importar; se usa el nivel más cercano a
+      cada una. Por defecto, todos los niveles del archivo.
+    - slab_values: tamaño máximo de cada bloque leído del archivo, en valores.
+      Cada bloque se filtra con operaciones vectorizadas y se carga con COPY,
+      de modo que la memoria no depende del tamaño del archivo.
+    """
     try:
         logger.info(f"Procesando archivo de temperatura: {file_path}")
         
@@ -234,330 +254,129 @@ def process_temperature_file(file_path, conn):
                 logger.error("No se encontró variable de temperatura en el archivo")
                 return False
             
-            # Determinar qué variable usar
-            temp_var_name = 'thetao' if 'thetao' in nc.variables else 'bottomT'
-            
-            # Obtener o crear dataset en la base de datos
-            dataset_name = "Temperatura Mediterráneo"
-            dataset_id = "cmems_mod_med_phy-tem_anfc_4.2km_P1D-m"
-            variables = ["temperatura"]
-            dataset_db_id = get_or_create_dataset(conn, dataset_name, dataset_id, variables)
-            
-            # Obtener coordenadas
-            lat_var_name = 'latitude' if 'latitude' in nc.variables else 'lat'
-            lon_var_name = 'longitude' if 'longitude' in nc.variables else 'lon'
-            time_var_name = 'time'
-            
-            lats = nc.variables[lat_var_name][:]
-            lons = nc.variables[lon_var_name][:]
-            times = nc.variables[time_var_name][:]
-            time_units = nc.variables[time_var_name].units
-            
-            # Convertir tiempos a fechas
-            import netCDF4
-            dates = netCDF4.num2date(times, time_units)
-            
-            # Verificar si hay dimensión de profundidad
-            has_depth = 'depth' in nc.variables
-            depths = nc.variables['depth'][:] if has_depth else [None]
-            
-            # Obtener datos de temperatura
-            temp_data = nc.variables[temp_var_name][:]
-            
-            # Preparar cursor para inserciones
+            spec = temperature_spec(nc, depth_levels)
+        
+        # Obtener o crear dataset en la base de datos
+        dataset_name = "Temperatura Mediterráneo"
+        dataset_id = "cmems_mod_med_phy-tem_anfc_4.2km_P1D-m"
+        variables = ["temperatura"]
+        dataset_db_id = get_or_create_dataset(conn, dataset_name, dataset_id, variables)
+        
+        # Lectura por bloques de los niveles pedidos, conversión de Kelvin y
+        # filtrado de rango vectorizados, y carga por COPY (ver app.ingest)
+        # Piscifactoría de cada punto muestreado, en una sola consulta
+        sink = PostgresSink(conn, dataset_db_id,
+                            farm_lookup=lambda lats, lons: find_closest_piscifactorias(conn, lats, lons))
+        result = ingest_file(file_path, spec, [sink], slab_values=slab_values)
+        inserted_count = sum(result['counts'].values())
+        
+        # Registrar la importación
+        if inserted_count > 0:
             cursor = conn.cursor()
-            
-            # Contador de registros insertados
-            inserted_count = 0
-            values_to_insert = []
-            
-            # Procesar los datos
-            # Determinar la estructura de los datos
-            temp_shape = temp_data.shape
-            logger.info(f"Forma de los datos de temperatura: {temp_shape}")
-            
-            # Para limitar la cantidad de datos, muestreamos los puntos
-            # Incluimos todos los tiempos, pero muestreamos espacialmente
-            sample_factor = max(1, int(np.sqrt(len(lats) * len(lons) / 500)))
-            lat_indices = list(range(0, len(lats), sample_factor))
-            lon_indices = list(range(0, len(lons), sample_factor))
-            
-            if len(temp_shape) == 4:  # [tiempo, profundidad, lat, lon]
-                for t_idx, date in enumerate(dates):
-                    date_str = date.strftime('%Y-%m-%dT%H:%M:%S')
-                    
-                    for d_idx, depth in enumerate(depths):
-                        for y_idx in lat_indices:
-                            for x_idx in lon_indices:
-                                try:
-                                    # Acceder al valor con manejo seguro
-                                    value_mask = temp_data[t_idx, d_idx, y_idx, x_idx]
-                                    
-                                    # Para arreglos enmascarados
-                                    if hasattr(value_mask, 'mask') and value_mask.mask:
-                                        continue
-                                    
-                                    # Convertir a valor Python nativo
-                                    if hasattr(value_mask, 'item'):
-                                        value = value_mask.item()
-                                    else:
-                                        value = float(value_mask)
-                                    
-                                    # Validar el valor - Convertir de Kelvin a Celsius si es necesario
-                                    if value > 200:  # Probablemente Kelvin
-                                        value -= 273.15
-                                    
-                                    if np.isnan(value) or value < -10 or value > 40:
-                                        continue
-                                    
-                                    # Obtener coordenadas
-                                    lat = float(lats[y_idx])
-                                    lon = float(lons[x_idx])
-                                    
-                                    # Buscar piscifactoría cercana
-                                    piscifactoria_id = find_closest_piscifactoria(conn, lon, lat)
-                                    
-                                    # Preparar punto geográfico
-                                    geom = f"SRID=4326;POINT({lon} {lat})"
-                                    
-                                    # Añadir a la lista para inserción
-                                    values_to_insert.append((
-                                        dataset_db_id,
-                                        'temperatura',
-                                        date_str,
-                                        value,
-                                        piscifactoria_id,
-                                        geom,
-                                        float(depth) if depth is not None else None,
-                                        90  # Calidad por defecto
-                                    ))
-                                except Exception as e:
-                                    logger.debug(f"Error al procesar valor: {e}")
-                                    continue
-            
-            elif len(temp_shape) == 3:  # [tiempo, lat, lon]
-                for t_idx, date in enumerate(dates):
-                    date_str = date.strftime('%Y-%m-%dT%H:%M:%S')
-                    
-                    for y_idx in lat_indices:
-                        for x_idx in lon_indices:
-                            try:
-                                # Acceder al valor con manejo seguro
-                                value_mask = temp_data[t_idx, y_idx, x_idx]
-                                
-                                # Para arreglos enmascarados
-                                if hasattr(value_mask, 'mask') and value_mask.mask:
-                                    continue
-                                
-                                # Convertir a valor Python nativo
-                                if hasattr(value_mask, 'item'):
-                                    value = value_mask.item()
-                                else:
-                                    value = float(value_mask)
-                                
-                                # Validar el valor - Convertir de Kelvin a Celsius si es necesario
-                                if value > 200:  # Probablemente Kelvin
-                                    value -= 273.15
-                                
-                                if np.isnan(value) or value < -10 or value > 40:
-                                    continue
-                                
-                                # Obtener coordenadas
-                                lat = float(lats[y_idx])
-                                lon = float(lons[x_idx])
-                                
-                                # Buscar piscifactoría cercana
-                                piscifactoria_id = find_closest_piscifactoria(conn, lon, lat)
-                                
-                                # Preparar punto geográfico
-                                geom = f"SRID=4326;POINT({lon} {lat})"
-                                
-                                # Añadir a la lista para inserción
-                                values_to_insert.append((
-                                    dataset_db_id,
-                                    'temperatura',
-                                    date_str,
-                                    value,
-                                    piscifactoria_id,
-                                    geom,
-                                    None,  # No hay profundidad
-                                    90  # Calidad por defecto
-                                ))
-                            except Exception as e:
-                                logger.debug(f"Error al procesar valor: {e}")
-                                continue
-            
-            # Insertar valores en la base de datos
-            if values_to_insert:
-                logger.info(f"Insertando {len(values_to_insert)} registros de temperatura")
-                
-                # Insertar en lotes
-                batch_size = 1000
-                for i in range(0, len(values_to_insert), batch_size):
-                    batch = values_to_insert[i:i+batch_size]
-                    try:
-                        execute_values(cursor, """
-                            INSERT INTO gloria.variables_ambientales
-                            (dataset_id, variable_nombre, fecha_tiempo, valor, piscifactoria_id, geometria, profundidad, calidad)
-                            VALUES %s
-                            ON CONFLICT (variable_nombre, fecha_tiempo, geometria) DO UPDATE
-                            SET valor = EXCLUDED.valor, calidad = EXCLUDED.calidad
-                        """, batch, template="(%s, %s, %s, %s, %s, %s, %s, %s)")
-                        
-                        conn.commit()
-                        inserted_count += len(batch)
-                        logger.info(f"Insertados {len(batch)} registros (total: {inserted_count})")
-                    except Exception as e:
-                        conn.rollback()
-                        logger.error(f"Error al insertar lote: {e}")
-            
-            # Registrar la importación
-            if inserted_count > 0:
-                try:
-                    cursor.execute("""
-                        INSERT INTO gloria.importaciones
-                        (dataset_id, fecha_inicio, fecha_fin, fecha_importacion, cantidad_registros, estado, mensaje)
-                        VALUES (%s, %s, %s, NOW(), %s, %s, %s)
-                    """, (
-                        dataset_db_id,
-                        dates[0].strftime('%Y-%m-%dT%H:%M:%S'),
-                        dates[-1].strftime('%Y-%m-%dT%H:%M:%S'),
-                        inserted_count,
-                        'completado',
-                        f'Archivo: {os.path.basename(file_path)}'
-                    ))
-                    conn.commit()
-                except Exception as e:
-                    conn.rollback()
-                    logger.error(f"Error al registrar importación: {e}")
-            
-            logger.info(f"Procesamiento completado. {inserted_count} registros insertados.")
-            return inserted_count > 0
+            try:
+                cursor.execute("""
+                    INSERT INTO gloria.importaciones
+                    (dataset_id, fecha_inicio, fecha_fin, fecha_importacion, cantidad_registros, estado, mensaje)
+                    VALUES (%s, %s, %s, NOW(), %s, %s, %s)
+                """, (
+                    dataset_db_id,
+                    result['start'].item(),
+                    result['end'].item(),
+                    inserted_count,
+                    'completado',
+                    f'Archivo: {os.path.basename(file_path)}'
+                ))
+                conn.commit()
+            except Exception as e:
+                conn.rollback()
+                logger.error(f"Error al registrar importación: {e}")
+        
+        logger.info(f"Procesamiento completado. {inserted_count} registros insertados.")
+        return inserted_count > 0
     
     except Exception as e:
+        conn.rollback()
         logger.error(f"Error al procesar archivo de temperatura: {e}")
         return False
 
-def assign_temp_data_to_farms(conn):
-    """Asigna datos de temperatura a todas las piscifactorías."""
+def file_time_window(file_path):
+    """Devuelve el primer y el último instante (datetime) de un archivo NetCDF."""
+    with Dataset(file_path, 'r') as nc:
+        times = read_time_axis(nc.variables['time'])
+    return times.min().item(), times.max().item()
+
+def assign_temp_data_to_farms(conn, max_distance_km=50, rebuild_mapping=False, since=None, until=None):
+    """
+    Asigna datos de temperatura a todas las piscifactorías con una sola sentencia.
+    
+    Cada piscifactoría toma la serie de su punto de malla más cercano, calculado
+    una vez en gloria.piscifactoria_punto_malla (ver 06-farm-grid-points.sql).
+    Solo se copian los instantes posteriores al último valor ya asignado a cada
+    piscifactoría y, por instante, el nivel menos profundo.
+    
+    - since/until: ventana temporal del archivo importado. Dentro de ella se
+      copian además los instantes que falten (rellenos de fechas anteriores),
+      de modo que la búsqueda de huecos no recorre toda la serie.
+    """
     try:
         cursor = conn.cursor()
         
-        # Verificar que existan datos de temperatura
-        cursor.execute("""
-            SELECT COUNT(*) FROM gloria.variables_ambientales 
-            WHERE variable_nombre = 'temperatura'
-        """)
-        
-        temp_count = cursor.fetchone()[0]
-        if temp_count == 0:
-            logger.error("No hay datos de temperatura disponibles para asignar")
-            return False
+        # Puntos de malla de las piscifactorías que aún no lo tienen
+        cursor.execute(
+            "SELECT gloria.map_farms_to_grid_points('temperatura', %s, %s)",
+            (max_distance_km, rebuild_mapping)
+        )
+        mapped = cursor.fetchone()[0]
+        conn.commit()
+        if mapped:
+            logger.info(f"Calculado el punto de malla de {mapped} piscifactorías")
         
-        # Obtener todas las piscifactorías
         cursor.execute("""
-            SELECT id, nombre, ST_X(geometria) AS lon, ST_Y(geometria) AS lat
-            FROM gloria.piscifactorias
-            ORDER BY id
-        """)
-        
-        farms = cursor.fetchall()
-        logger.info(f"Encontradas {len(farms)} piscifactorías para asignar datos de temperatura")
-        
-        # Para cada piscifactoría sin datos de temperatura
-        for farm_id, farm_name, farm_lon, farm_lat in farms:
-            # Verificar si ya tiene datos de temperatura
-            cursor.execute("""
-                SELECT COUNT(*) FROM gloria.variables_ambientales
+            INSERT INTO gloria.variables_ambientales
+            (dataset_id, variable_nombre, fecha_tiempo, valor, piscifactoria_id, geometria, profundidad, calidad)
+            SELECT DISTINCT ON (m.piscifactoria_id, va.fecha_tiempo)
+                va.dataset_id, 'temperatura', va.fecha_tiempo, va.valor,
+                m.piscifactoria_id, p.geometria, va.profundidad, 90
+            FROM gloria.piscifactoria_punto_malla m
+            JOIN gloria.piscifactorias p ON p.id = m.piscifactoria_id
+            CROSS JOIN LATERAL (
+                SELECT MAX(fecha_tiempo) AS ultima
+                FROM gloria.variables_ambientales
                 WHERE variable_nombre = 'temperatura'
-                AND piscifactoria_id = %s
-            """, (farm_id,))
-            
-            farm_temp_count = cursor.fetchone()[0]
-            
-            if farm_temp_count > 0:
-                logger.info(f"La piscifactoría {farm_name} ya tiene {farm_temp_count} datos de temperatura")
-                continue
-            
-            # Buscar datos de temperatura cercanos
-            cursor.execute("""
-                WITH datos_cercanos AS (
-                    SELECT 
-                        va.id,
-                        va.dataset_id,
-                        va.fecha_tiempo,
-                        va.valor,
-                        ST_Distance(
-                            va.geometria::geography, 
-                            ST_SetSRID(ST_MakePoint(%s, %s), 4326)::geography
-                        ) as distancia
-                    FROM gloria.variables_ambientales va
-                    WHERE va.variable_nombre = 'temperatura'
-                    AND ST_Distance(
-                        va.geometria::geography, 
-                        ST_SetSRID(ST_MakePoint(%s, %s), 4326)::geography
-                    ) < 50000  -- 50 km
-                    ORDER BY va.fecha_tiempo DESC, distancia ASC
+                AND piscifactoria_id = m.piscifactoria_id
+                AND geometria ~= p.geometria
+            ) asignado
+            JOIN gloria.variables_ambientales va
+                ON va.variable_nombre = 'temperatura'
+                AND va.dataset_id = m.dataset_id
+                AND va.geometria ~= m.geometria
+            WHERE m.variable_nombre = 'temperatura'
+            AND (
+                va.fecha_tiempo > COALESCE(asignado.ultima, '-infinity'::timestamptz)
+                -- Huecos solo dentro de la ventana del archivo importado
+                OR (
+                    va.fecha_tiempo BETWEEN %(since)s AND %(until)s
+                    AND NOT EXISTS (
+                        SELECT 1
+                        FROM gloria.variables_ambientales previo
+                        WHERE previo.piscifactoria_id = m.piscifactoria_id
+                        AND previo.variable_nombre = 'temperatura'
+                        AND previo.fecha_tiempo = va.fecha_tiempo
+                        AND previo.geometria ~= p.geometria
+                    )
                 )
-                SELECT DISTINCT ON (DATE(fecha_tiempo)) 
-                    id, dataset_id, fecha_tiempo, valor, distancia
-                FROM datos_cercanos
-                ORDER BY DATE(fecha_tiempo), distancia ASC
-                LIMIT 90  -- Aproximadamente 3 meses de datos diarios
-            """, (farm_lon, farm_lat, farm_lon, farm_lat))
-            
-            temp_data = cursor.fetchall()
-            
-            if not temp_data:
-                logger.warning(f"No se encontraron datos de temperatura cercanos para {farm_name}")
-                continue
-            
-            logger.info(f"Encontrados {len(temp_data)} datos de temperatura para {farm_name}")
-            
-            # Obtener geometría de la piscifactoría
-            cursor.execute("""
-                SELECT ST_AsText(geometria) FROM gloria.piscifactorias WHERE id = %s
-            """, (farm_id,))
-            
-            farm_geom_text = cursor.fetchone()[0]
-            
-            # Insertar datos de temperatura para esta piscifactoría
-            count = 0
-            for temp_id, dataset_id, fecha_tiempo, valor, _ in temp_data:
-                try:
-                    cursor.execute("""
-                        INSERT INTO gloria.variables_ambientales
-                        (dataset_id, variable_nombre, fecha_tiempo, valor, piscifactoria_id, geometria, profundidad, calidad)
-                        VALUES (%s, %s, %s, %s, %s, %s, %s, %s)
-                        ON CONFLICT (variable_nombre, fecha_tiempo, geometria) DO UPDATE
-                        SET valor = EXCLUDED.valor, calidad = EXCLUDED.calidad
-                    """, (
-                        dataset_id,
-                        'temperatura',
-                        fecha_tiempo,
-                        valor,
-                        farm_id,
-                        farm_geom_text,
-                        None,  # No hay profundidad
-                        90  # Calidad por defecto
-                    ))
-                    
-                    count += 1
-                    
-                    # Commit cada 20 registros
-                    if count % 20 == 0:
-                        conn.commit()
-                except Exception as e:
-                    conn.rollback()
-                    logger.error(f"Error al insertar dato de temperatura para {farm_name}: {e}")
-            
-            # Commit final
-            conn.commit()
-            logger.info(f"Asignados {count} datos de temperatura a {farm_name}")
+            )
+            ORDER BY m.piscifactoria_id, va.fecha_tiempo, va.profundidad ASC NULLS FIRST
+        """, {'since': since, 'until': until})
+        count = cursor.rowcount
+        conn.commit()
+        cursor.close()
         
+        logger.info(f"Asignados {count} datos de temperatura a las piscifactorías")
         return True
     
     except Exception as e:
+        conn.rollback()
         logger.error(f"Error al asignar datos de temperatura a piscifactorías: {e}")
         return False
 
@@ -573,6 +392,9 @@ def main():
         # Descargar datos de temperatura
         temp_file = download_temperature_data()
         
+        # Ventana temporal del archivo, para rellenar huecos al asignar
+        since, until = file_time_window(temp_file)
+        
         # Procesar archivo de temperatura
         success = process_temperature_file(temp_file, conn)
         
@@ -584,7 +406,7 @@ def main():
             logger.info(f"Archivo movido a {processed_path}")
             
             # Asignar datos a todas las piscifactorías
-            assign_temp_data_to_farms(conn)
+            assign_temp_data_to_farms(conn, since=since, until=until)
         else:
             # Mover a directorio de fallidos
             import shutil
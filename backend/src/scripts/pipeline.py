@@ -0,0 +1,288 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Cadena completa de actualización de datos en un solo proceso.
+
+Etapas, en orden:
+1. download: descarga en paralelo del período pendiente de cada dataset
+2. validate: verificación por muestreo de los archivos descargados
+3. extract: incorporación de los campos al cubo de datos local
+4. load: carga de los archivos en gloria.variables_ambientales
+5. assign: asignación de datos a las piscifactorías
+6. predict: predicciones de riesgo de escape
+7. refresh: refresco de las vistas materializadas
+
+Las etapas comparten un pool de conexiones y el índice de piscifactorías, y
+cada una recibe solo los archivos producidos por la anterior. Las etapas que
+actúan sobre todas las piscifactorías (assign, predict, refresh) se ejecutan
+bajo un bloqueo exclusivo, ya que pueden coincidir ejecuciones simultáneas de
+datasets distintos (ver app.jobs). Si se empieza
+en una etapa posterior a la validación, se usan los archivos pendientes en el
+directorio de descargas (o los indicados con --files).
+
+Uso:
+    python pipeline.py
+    python pipeline.py --from-stage load
+    python pipeline.py --only assign --only refresh
+    python pipeline.py --datasets med-cmcc-sal-rean-d
+
+Proyecto: WebGIS GlorIA
+"""
+
+import os
+import sys
+import glob
+import time
+import fcntl
+import logging
+import argparse
+from contextlib import contextmanager, nullcontext
+
+import psycopg2
+from psycopg2.pool import ThreadedConnectionPool
+
+# Configuración de logging (antes de importar los scripts de cada etapa)
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
+    handlers=[
+        logging.FileHandler("pipeline.log"),
+        logging.StreamHandler()
+    ]
+)
+logger = logging.getLogger("pipeline")
+
+import process_data  # Añade python-services al sys.path (paquete app)
+import get_data_copernicus_and_openwather as downloader
+from assign_official_data import get_available_variables, assign_variable_to_all_farms
+from scape_prediction import generate_predictions_for_all_farms
+from app.data_cube import append_netcdf_to_cube
+from app.farm_sampler import get_farms, assign_grid_fields_to_farms
+from app.metrics import STAGE_DURATION, export_batch_metrics
+from app.query_profiler import connect_kwargs
+
+STAGES = ['download', 'validate', 'extract', 'load', 'assign', 'predict', 'refresh']
+
+# Conexiones simultáneas del pool compartido por las etapas
+POOL_MAX_CONNECTIONS = 4
+
+# Etapas sobre todas las piscifactorías, que no dependen de los datasets de la
+# ejecución. Se serializan entre procesos con un flock en el directorio de
+# bloqueos de los trabajos (app.jobs); no se usa el bloqueo '_todos', que el
+# trabajo que lanza este proceso ya tiene en modo compartido.
+GLOBAL_STAGES = ('assign', 'predict', 'refresh')
+GLOBAL_STAGES_LOCK = os.path.join(os.getenv('JOBS_DIR', '/tmp/gloria-jobs'), 'locks', '_etapas_globales.lock')
+
+
+class PipelineContext:
+    """Estado compartido entre etapas: pool de conexiones, metadatos y archivos."""
+
+    def __init__(self, files=None, datasets=None):
+        self.pool = None
+        self.datasets = datasets
+        self.metadata = None
+        self.records = []
+        self.files = files
+        self.since = None
+        self.timings = {}
+        self._farms = None
+
+    @contextmanager
+    def connection(self):
+        """Conexión del pool compartido (se crea en el primer uso)."""
+        if self.pool is None:
+            process_data.setup_environment()
+            self.pool = ThreadedConnectionPool(
+                1, POOL_MAX_CONNECTIONS,
+                host=os.getenv("DB_HOST"),
+                port=os.getenv("DB_PORT"),
+                dbname=os.getenv("DB_NAME"),
+                user=os.getenv("DB_USER"),
+                password=os.getenv("DB_PASSWORD"),
+                **connect_kwargs()
+            )
+        conn = self.pool.getconn()
+        try:
+            yield conn
+        finally:
+            self.pool.putconn(conn)
+
+    def farms(self, conn):
+        """Índice de piscifactorías (ids, lons, lats), leído una sola vez por ejecución."""
+        if self._farms is None:
+            self._farms = get_farms(conn)
+        return self._farms
+
+    def pending_files(self):
+        """Archivos a procesar cuando no vienen de una etapa anterior."""
+        if self.files is None:
+            self.files = sorted(glob.glob(str(process_data.DOWNLOAD_DIR / "*.nc")))
+            logger.info(f"Usando {len(self.files)} archivos pendientes en {process_data.DOWNLOAD_DIR}")
+        return self.files
+
+    def close(self):
+        if self.pool is not None:
+            self.pool.closeall()
+
+
+@contextmanager
+def global_stage_lock():
+    """Bloqueo exclusivo de las etapas globales (bloqueante)."""
+    os.makedirs(os.path.dirname(GLOBAL_STAGES_LOCK), exist_ok=True)
+    with open(GLOBAL_STAGES_LOCK, 'w') as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        yield
+
+
+def selected_datasets(ctx):
+    """Datasets configurados de la ejecución (todos si no se indica --datasets)."""
+    if ctx.datasets:
+        return [d for d in downloader.DATASETS if d["id"] in ctx.datasets]
+    return downloader.DATASETS
+
+
+def stage_download(ctx):
+    transport = downloader.prepare_transport()
+    ctx.metadata = downloader.load_metadata()
+    datasets = selected_datasets(ctx)
+    ctx.records = downloader.download_datasets(ctx.metadata, transport, datasets)
+
+    # Los datos nuevos empiezan en el inicio del período descargado más antiguo
+    starts = [r['start_datetime'] for r in ctx.records if r.get('start_datetime')]
+    ctx.since = min(starts) if starts else None
+
+
+def stage_validate(ctx):
+    if ctx.metadata is None:
+        ctx.metadata = downloader.load_metadata()
+    valid = downloader.validate_downloads(ctx.records, ctx.metadata)
+    # Solo se escriben las entradas de los datasets de esta ejecución
+    downloader.save_metadata(ctx.metadata, [d["id"] for d in selected_datasets(ctx)])
+    ctx.files = [item['file_path'] for item in valid]
+
+
+def stage_extract(ctx):
+    for file_path in ctx.pending_files():
+        try:
+            append_netcdf_to_cube(file_path, root=process_data.CUBE_DIR)
+        except Exception as e:
+            logger.warning(f"No se pudo actualizar el cubo con {file_path}: {e}")
+
+
+def stage_load(ctx):
+    files = ctx.pending_files()
+    if not files:
+        logger.info("No hay archivos nuevos para cargar")
+        return
+    with ctx.connection() as conn:
+        ctx.files = process_data.process_files(conn, files, update_cube=False)
+    logger.info(f"{len(ctx.files)}/{len(files)} archivos cargados correctamente")
+
+
+def stage_assign(ctx):
+    with ctx.connection() as conn:
+        # Interpolación de los campos en malla (gloria.campos_grid o cubo) en todas las piscifactorías
+        try:
+            count = assign_grid_fields_to_farms(conn, fecha_inicio=ctx.since, farms=ctx.farms(conn),
+                                                cube_root=process_data.CUBE_DIR)
+            logger.info(f"Interpolados {count} datos desde campos en malla")
+        except psycopg2.Error as e:
+            conn.rollback()
+            logger.warning(f"No se pudieron interpolar campos en malla: {e}")
+
+        # Datos regionales por punto: una sentencia KNN por variable
+        for variable_name, _ in get_available_variables(conn):
+            count = assign_variable_to_all_farms(conn, variable_name, since=ctx.since)
+            logger.info(f"Asignados {count} datos de {variable_name}")
+
+
+def stage_predict(ctx):
+    with ctx.connection() as conn:
+        predictions = generate_predictions_for_all_farms(conn)
+    logger.info(f"Generadas {len(predictions)} predicciones")
+
+
+def stage_refresh(ctx):
+    with ctx.connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute("SELECT gloria.refresh_materialized_views()")
+        conn.commit()
+        cursor.close()
+
+
+STAGE_FUNCTIONS = {
+    'download': stage_download,
+    'validate': stage_validate,
+    'extract': stage_extract,
+    'load': stage_load,
+    'assign': stage_assign,
+    'predict': stage_predict,
+    'refresh': stage_refresh,
+}
+
+
+def select_stages(from_stage=None, only=None):
+    """Etapas a ejecutar, en orden, según --from-stage y --only."""
+    if only:
+        return [stage for stage in STAGES if stage in only]
+    start = STAGES.index(from_stage) if from_stage else 0
+    return STAGES[start:]
+
+
+def run_pipeline(from_stage=None, only=None, files=None, datasets=None):
+    """
+    Ejecutar las etapas seleccionadas. Se detiene en la primera que falla, ya
+    que las siguientes dependen de su resultado. Devuelve True si todas terminan.
+    """
+    stages = select_stages(from_stage, only)
+    ctx = PipelineContext(files=files, datasets=datasets)
+    datasets_label = ','.join(sorted(datasets)) if datasets else 'todos'
+    success = True
+    pipeline_start = time.perf_counter()
+
+    logger.info(f"Iniciando cadena: {' → '.join(stages)}")
+    try:
+        for stage in stages:
+            stage_start = time.perf_counter()
+            try:
+                with global_stage_lock() if stage in GLOBAL_STAGES else nullcontext():
+                    STAGE_FUNCTIONS[stage](ctx)
+            except Exception as e:
+                logger.error(f"❌ Error en la etapa {stage}: {e}")
+                success = False
+            finally:
+                ctx.timings[stage] = time.perf_counter() - stage_start
+                STAGE_DURATION.labels(stage=f"pipeline_{stage}", dataset=datasets_label).observe(ctx.timings[stage])
+                logger.info(f"⏱️  Etapa {stage}: {ctx.timings[stage]:.1f}s")
+            if not success:
+                break
+    finally:
+        ctx.close()
+
+    total = time.perf_counter() - pipeline_start
+    summary = ', '.join(f"{stage}={seconds:.1f}s" for stage, seconds in ctx.timings.items())
+    logger.info(f"Cadena {'completada' if success else 'interrumpida'} en {total:.1f}s ({summary})")
+    export_batch_metrics('pipeline')
+    return success
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Cadena de actualización de datos de GlorIA")
+    parser.add_argument('--from-stage', choices=STAGES, help="Empezar en esta etapa")
+    parser.add_argument('--only', choices=STAGES, action='append',
+                        help="Ejecutar solo esta etapa (se puede repetir)")
+    parser.add_argument('--files', nargs='+',
+                        help="Archivos NetCDF para las etapas extract/load (por defecto, los pendientes)")
+    parser.add_argument('--datasets', nargs='+',
+                        help="Descargar solo estos datasets (por defecto, todos los configurados)")
+    args = parser.parse_args()
+
+    if args.from_stage and args.only:
+        parser.error("--from-stage y --only son incompatibles")
+
+    if not run_pipeline(args.from_stage, args.only, args.files, args.datasets):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
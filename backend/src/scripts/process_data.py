@@ -17,17 +17,20 @@ import os
 import sys
 import glob
 import logging
-import json
-import hashlib
+import argparse
 import shutil
 import psycopg2
-import pandas as pd
-import numpy as np
 from pathlib import Path
 from dotenv import load_dotenv
-from datetime import datetime, timedelta
 from netCDF4 import Dataset
-from psycopg2.extras import execute_values
+
+# Librería compartida con python-services (cubo de datos local)
+sys.path.insert(0, str(Path(__file__).resolve().parents[3] / "python-services"))
+from app.data_cube import append_netcdf_to_cube
+from app.ingest import ingest_file, PostgresSink
+from app.metrics import export_batch_metrics
+from app.query_profiler import connect_kwargs
+from app.profiling import add_profile_arguments, profiler_from_args, profiled
 
 # Configuración de logging
 logging.basicConfig(
@@ -45,6 +48,7 @@ ROOT_DIR = Path(os.path.expanduser("~/webGIS-GlorIA"))
 DOWNLOAD_DIR = ROOT_DIR / "databases" / "copernicus_marine"
 PROCESSED_DIR = DOWNLOAD_DIR / "processed"
 FAILED_DIR = DOWNLOAD_DIR / "failed"
+CUBE_DIR = Path(os.getenv("DATA_CUBE_DIR", ROOT_DIR / "data" / "cube"))
 
 # Variables principales a procesar - PRIORIZAR ESTAS
 PRIORITY_VARIABLES = ['temperatura', 'temperature', 'temp', 'uo', 'vo', 'so', 'salinity', 'currents']
@@ -78,7 +82,8 @@ def get_db_connection():
             port=os.getenv("DB_PORT"),
             dbname=os.getenv("DB_NAME"),
             user=os.getenv("DB_USER"),
-            password=os.getenv("DB_PASSWORD")
+            password=os.getenv("DB_PASSWORD"),
+            **connect_kwargs()
         )
         logger.info("Conexión con la base de datos establecida correctamente")
         return conn
@@ -147,52 +152,46 @@ def get_or_create_dataset(conn, dataset_name, dataset_id, variables, source="Cop
 def find_closest_piscifactoria(conn, lon, lat, max_distance_km=10.0):
     """
     Encuentra la piscifactoría más cercana a las coordenadas dadas,
-    dentro de una distancia máxima.
+    dentro de una distancia máxima (gloria.farm_for_point, búsqueda KNN).
     Devuelve el ID de la piscifactoría o None si no hay ninguna cercana.
     """
     try:
         cursor = conn.cursor()
-        
-        # Consulta para encontrar la piscifactoría más cercana dentro de una distancia máxima
         cursor.execute(
-            """
-            SELECT id, ST_Distance(
-                geometria::geography, 
-                ST_SetSRID(ST_MakePoint(%s, %s), 4326)::geography
-            ) as distance_meters,
-            CASE 
-                WHEN geom_area IS NOT NULL THEN 
-                  ST_Contains(geom_area, ST_SetSRID(ST_MakePoint(%s, %s), 4326))
-                ELSE false
-            END as dentro_del_area
-            FROM gloria.piscifactorias
-            WHERE ST_DWithin(
-                geometria::geography, 
-                ST_SetSRID(ST_MakePoint(%s, %s), 4326)::geography, 
-                %s * 1000  -- Convertir km a metros
-            )
-            ORDER BY dentro_del_area DESC, distance_meters ASC
-            LIMIT 1
-            """,
-            (lon, lat, lon, lat, lon, lat, max_distance_km)
+            "SELECT gloria.farm_for_point(%s, %s, %s)",
+            (lon, lat, max_distance_km)
         )
+        piscifactoria_id = cursor.fetchone()[0]
         
-        result = cursor.fetchone()
-        
-        if result:
-            piscifactoria_id, distance, dentro_area = result
-            if dentro_area:
-                logger.debug(f"Punto dentro del área de piscifactoría ID: {piscifactoria_id}")
-            else:
-                logger.debug(f"Piscifactoría más cercana (ID: {piscifactoria_id}) a {distance:.2f} metros")
-            return piscifactoria_id
-        else:
+        if piscifactoria_id is None:
             logger.debug(f"No se encontró piscifactoría cercana para coordenadas ({lon}, {lat})")
-            return None
+        return piscifactoria_id
     except Exception as e:
+        conn.rollback()
         logger.error(f"Error al buscar piscifactoría cercana: {e}")
         return None
 
+def find_closest_piscifactorias(conn, lat_values, lon_values, max_distance_km=10.0):
+    """
+    Versión por lotes de find_closest_piscifactoria para una malla.
+    Devuelve un diccionario {(lat, lon): ID o None} con una sola consulta.
+    """
+    points = [(float(lat), float(lon)) for lat in lat_values for lon in lon_values]
+    if not points:
+        return {}
+    try:
+        cursor = conn.cursor()
+        cursor.execute(
+            "SELECT gloria.farms_for_points(%s::float8[], %s::float8[], %s)",
+            ([lon for _, lon in points], [lat for lat, _ in points], max_distance_km)
+        )
+        farm_ids = cursor.fetchone()[0]
+        return dict(zip(points, farm_ids))
+    except Exception as e:
+        conn.rollback()
+        logger.error(f"Error al buscar piscifactorías cercanas: {e}")
+        return {}
+
 def normalize_variable_name(var_name):
     """Normaliza los nombres de variables a un formato estándar."""
     var_mapping = {
@@ -219,6 +218,39 @@ def normalize_variable_name(var_name):
     
     return var_mapping.get(var_name.lower(), var_name.lower())
 
+def build_ingest_spec(nc):
+    """
+    Especificación de ingesta (ver app.ingest) para un archivo genérico: las
+    variables prioritarias (o todas si no hay ninguna), todas las profundidades
+    y un muestreo espacial que limita el número de puntos.
+    """
+    coordinates = ['time', 'lat', 'lon', 'latitude', 'longitude', 'depth', 'level', 'height']
+    all_variables = [var for var in nc.variables
+                     if var not in coordinates and nc.variables[var].ndim >= 3]
+    
+    # Mapear y filtrar variables prioritarias
+    priority = [normalize_variable_name(v) for v in PRIORITY_VARIABLES]
+    variables = [var for var in all_variables
+                 if normalize_variable_name(var) in priority or len(all_variables) <= 3]
+    
+    # Si no hay variables prioritarias, usar todas
+    if not variables:
+        variables = all_variables
+        logger.warning("No se encontraron variables prioritarias. Procesando todas las variables.")
+    else:
+        logger.info(f"Procesando variables prioritarias: {variables}")
+    
+    return {
+        'variables': [
+            {'target': normalize_variable_name(var), 'aliases': [var], 'valid_range': (-9990, None)}
+            for var in variables
+        ],
+        'depth': None,
+        'bbox': None,
+        'stride': 'auto',
+        'max_points': 100000,
+    }
+
 def process_netcdf_file(file_path, dataset_db_id, conn):
     """
     Procesa un archivo NetCDF y carga sus datos en la base de datos.
@@ -226,313 +258,44 @@ def process_netcdf_file(file_path, dataset_db_id, conn):
     try:
         logger.info(f"Procesando archivo: {file_path}")
         
-        # Abrir el archivo NetCDF con modo de manejo de memoria eficiente
-        with Dataset(file_path, 'r', diskless=False, persist=False) as nc:
-            # Inspeccionar estructura detallada del archivo
-            logger.info(f"Estructura del archivo NetCDF:")
+        # Inspeccionar estructura del archivo
+        with Dataset(file_path, 'r') as nc:
             logger.info(f"Dimensiones: {nc.dimensions.keys()}")
             logger.info(f"Variables: {nc.variables.keys()}")
-            logger.info(f"Atributos globales: {nc.ncattrs()}")
-            
-            # Obtener las variables y filtrar las que no son datos (coordenadas, etc.)
-            all_variables = [var for var in nc.variables 
-                             if var not in ['time', 'lat', 'lon', 'latitude', 'longitude', 
-                                           'depth', 'level', 'height']]
-            
-            # Identificar variables de coordenadas
-            lat_var_name = next((v for v in nc.variables if v.lower() in ['latitude', 'lat']), None)
-            lon_var_name = next((v for v in nc.variables if v.lower() in ['longitude', 'lon']), None)
-            time_var_name = next((v for v in nc.variables if v.lower() in ['time', 't']), None)
-            depth_var_name = next((v for v in nc.variables if v.lower() in ['depth', 'deptht', 'level']), None)
-            
-            if not all([lat_var_name, lon_var_name, time_var_name]):
-                logger.error(f"No se pudieron identificar las variables de coordenadas básicas en {file_path}")
-                return False
-            
-            # Obtener las coordenadas
-            lats = nc.variables[lat_var_name][:]
-            lons = nc.variables[lon_var_name][:]
-            
-            # Obtener los tiempos
-            times = nc.variables[time_var_name][:]
-            time_units = nc.variables[time_var_name].units
-            
-            # Convertir tiempos a fechas
-            import netCDF4
-            dates = netCDF4.num2date(times, time_units)
-            
-            # Verificar si hay dimensión de profundidad
-            has_depth = depth_var_name is not None
-            depths = nc.variables[depth_var_name][:] if has_depth else [None]
-            
-            # Para los archivos grandes, reducir el número de puntos
-            max_points = 100000  # Limitar el número máximo de puntos
-            
-            # Calcular factores de muestreo para no exceder max_points
-            total_points = len(lats) * len(lons) * len(dates) * (len(depths) if has_depth else 1)
-            logger.info(f"Archivo contiene {total_points} puntos potenciales")
-            
-            sample_factor = max(1, int(np.sqrt(total_points / max_points)))
-            
-            if sample_factor > 1:
-                logger.info(f"Aplicando factor de muestreo {sample_factor} para reducir puntos")
-            
-            # Subconjunto de índices para coordenadas
-            lat_indices = list(range(0, len(lats), sample_factor))
-            lon_indices = list(range(0, len(lons), sample_factor))
-            time_indices = list(range(len(dates)))
-            depth_indices = list(range(len(depths))) if has_depth else [0]
-            
-            # Mapear y filtrar variables prioritarias
-            variables = []
-            for var in all_variables:
-                # Normalizar nombre
-                norm_var = normalize_variable_name(var)
-                
-                # Añadir la variable si es prioritaria o hay pocas variables
-                if norm_var in [normalize_variable_name(v) for v in PRIORITY_VARIABLES] or len(all_variables) <= 3:
-                    variables.append((var, norm_var))
-            
-            # Si no hay variables prioritarias, usar todas
-            if not variables:
-                variables = [(var, normalize_variable_name(var)) for var in all_variables]
-                logger.warning(f"No se encontraron variables prioritarias en {file_path}. Procesando todas las variables.")
-            else:
-                logger.info(f"Procesando variables prioritarias: {[v[0] for v in variables]}")
-            
-            # Preparar cursor para inserciones masivas
+            spec = build_ingest_spec(nc)
+        
+        # Piscifactoría de cada punto de la malla muestreada, en una sola consulta por malla
+        sink = PostgresSink(
+            conn, dataset_db_id,
+            farm_lookup=lambda lats, lons: find_closest_piscifactorias(conn, lats, lons, max_distance_km=20.0)
+        )
+        result = ingest_file(file_path, spec, [sink])
+        inserted_count = sum(result['counts'].values())
+        
+        logger.info(f"Proceso completado para {file_path}. {inserted_count} registros insertados.")
+        
+        # Registrar la importación
+        if inserted_count > 0:
             cursor = conn.cursor()
-            
-            # Contador total de registros
-            inserted_count = 0
-            
-            # Para cada variable
-            for var_name, db_var_name in variables:
-                logger.info(f"Procesando variable: {var_name} -> {db_var_name}")
-                
-                # Lista para valores a insertar de esta variable
-                values_to_insert = []
-                
-                # Obtener los datos de la variable con manejo específico para masked arrays
-                var = nc.variables[var_name]
-                
-                # Determinar la estructura de los datos
-                var_shape = var.shape
-                
-                # Procesar según la forma de los datos
-                if len(var_shape) == 4:  # [tiempo, profundidad, lat, lon]
-                    # Contar puntos procesados para mostrar progreso
-                    processed = 0
-                    total = len(time_indices) * len(depth_indices) * len(lat_indices) * len(lon_indices)
-                    
-                    for t_idx in time_indices:
-                        date = dates[t_idx]
-                        date_str = date.strftime('%Y-%m-%dT%H:%M:%S')
-                        
-                        for d_idx in depth_indices:
-                            depth = depths[d_idx] if has_depth else None
-                            
-                            # Procesar por bloques para cada combinación de tiempo y profundidad
-                            chunk_values = []
-                            
-                            for y_idx in lat_indices:
-                                lat = lats[y_idx]
-                                
-                                for x_idx in lon_indices:
-                                    lon = lons[x_idx]
-                                    processed += 1
-                                    
-                                    # Mostrar progreso cada 10%
-                                    if processed % max(1, int(total * 0.1)) == 0:
-                                        progress = processed / total * 100
-                                        logger.info(f"Progreso: {progress:.1f}% ({processed}/{total})")
-                                    
-                                    try:
-                                        # Acceder al valor con manejo seguro
-                                        value_mask = var[t_idx, d_idx, y_idx, x_idx] if has_depth else var[t_idx, y_idx, x_idx]
-                                        
-                                        # Para arreglos enmascarados
-                                        if hasattr(value_mask, 'mask') and value_mask.mask:
-                                            continue
-                                        
-                                        # Convertir a valor Python nativo si es un tipo NumPy
-                                        value = np.asscalar(value_mask) if hasattr(value_mask, 'item') else float(value_mask)
-                                        
-                                        # Validar el valor
-                                        if np.isnan(value) or value < -9990:
-                                            continue
-                                        
-                                        # Buscar piscifactoría cercana
-                                        piscifactoria_id = find_closest_piscifactoria(conn, float(lon), float(lat), max_distance_km=20.0)
-                                        
-                                        # Preparar punto geográfico
-                                        geom = f"SRID=4326;POINT({float(lon)} {float(lat)})"
-                                        
-                                        # Añadir a la lista para inserción
-                                        chunk_values.append((
-                                            dataset_db_id,
-                                            db_var_name,
-                                            date_str,
-                                            value,
-                                            piscifactoria_id,
-                                            geom,
-                                            float(depth) if depth is not None else None,
-                                            90  # Calidad por defecto
-                                        ))
-                                    except Exception as e:
-                                        # Registrar error pero continuar con el siguiente punto
-                                        continue
-                            
-                            # Añadir valores de este chunk a la lista principal
-                            values_to_insert.extend(chunk_values)
-                            
-                            # Insertar cada chunk de inmediato para liberar memoria
-                            if len(values_to_insert) >= 1000:
-                                try:
-                                    execute_values(cursor, """
-                                        INSERT INTO gloria.variables_ambientales
-                                        (dataset_id, variable_nombre, fecha_tiempo, valor, piscifactoria_id, geometria, profundidad, calidad)
-                                        VALUES %s
-                                        ON CONFLICT (variable_nombre, fecha_tiempo, geometria) DO UPDATE
-                                        SET valor = EXCLUDED.valor, calidad = EXCLUDED.calidad
-                                    """, values_to_insert, template="(%s, %s, %s, %s, %s, %s, %s, %s)")
-                                    
-                                    conn.commit()
-                                    inserted_count += len(values_to_insert)
-                                    logger.info(f"Insertados {len(values_to_insert)} registros (total: {inserted_count})")
-                                    values_to_insert = []  # Liberar memoria
-                                except Exception as e:
-                                    conn.rollback()
-                                    logger.error(f"Error al insertar lote: {e}")
-                                    values_to_insert = []  # Liberar memoria aunque haya error
-                
-                elif len(var_shape) == 3:  # [tiempo, lat, lon]
-                    # Contar puntos procesados para mostrar progreso
-                    processed = 0
-                    total = len(time_indices) * len(lat_indices) * len(lon_indices)
-                    
-                    for t_idx in time_indices:
-                        date = dates[t_idx]
-                        date_str = date.strftime('%Y-%m-%dT%H:%M:%S')
-                        
-                        # Procesar por bloques para cada momento del tiempo
-                        chunk_values = []
-                        
-                        for y_idx in lat_indices:
-                            lat = lats[y_idx]
-                            
-                            for x_idx in lon_indices:
-                                lon = lons[x_idx]
-                                processed += 1
-                                
-                                # Mostrar progreso cada 10%
-                                if processed % max(1, int(total * 0.1)) == 0:
-                                    progress = processed / total * 100
-                                    logger.info(f"Progreso: {progress:.1f}% ({processed}/{total})")
-                                
-                                try:
-                                    # Acceder al valor con manejo seguro
-                                    value_mask = var[t_idx, y_idx, x_idx]
-                                    
-                                    # Para arreglos enmascarados
-                                    if hasattr(value_mask, 'mask') and value_mask.mask:
-                                        continue
-                                    
-                                    # Convertir a valor Python nativo si es un tipo NumPy
-                                    if hasattr(value_mask, 'item'):
-                                        value = value_mask.item()
-                                    else:
-                                        value = float(value_mask)
-                                    
-                                    # Validar el valor
-                                    if np.isnan(value) or value < -9990:
-                                        continue
-                                    
-                                    # Buscar piscifactoría cercana
-                                    piscifactoria_id = find_closest_piscifactoria(conn, float(lon), float(lat), max_distance_km=20.0)
-                                    
-                                    # Preparar punto geográfico
-                                    geom = f"SRID=4326;POINT({float(lon)} {float(lat)})"
-                                    
-                                    # Añadir a la lista para inserción
-                                    chunk_values.append((
-                                        dataset_db_id,
-                                        db_var_name,
-                                        date_str,
-                                        value,
-                                        piscifactoria_id,
-                                        geom,
-                                        None,  # No hay profundidad
-                                        90  # Calidad por defecto
-                                    ))
-                                except Exception as e:
-                                    # Registrar error pero continuar con el siguiente punto
-                                    continue
-                        
-                        # Añadir valores de este chunk a la lista principal
-                        values_to_insert.extend(chunk_values)
-                        
-                        # Insertar cada chunk de inmediato para liberar memoria
-                        if len(values_to_insert) >= 1000:
-                            try:
-                                execute_values(cursor, """
-                                    INSERT INTO gloria.variables_ambientales
-                                    (dataset_id, variable_nombre, fecha_tiempo, valor, piscifactoria_id, geometria, profundidad, calidad)
-                                    VALUES %s
-                                    ON CONFLICT (variable_nombre, fecha_tiempo, geometria) DO UPDATE
-                                    SET valor = EXCLUDED.valor, calidad = EXCLUDED.calidad
-                                """, values_to_insert, template="(%s, %s, %s, %s, %s, %s, %s, %s)")
-                                
-                                conn.commit()
-                                inserted_count += len(values_to_insert)
-                                logger.info(f"Insertados {len(values_to_insert)} registros (total: {inserted_count})")
-                                values_to_insert = []  # Liberar memoria
-                            except Exception as e:
-                                conn.rollback()
-                                logger.error(f"Error al insertar lote: {e}")
-                                values_to_insert = []  # Liberar memoria aunque haya error
-                
-                # Insertar los valores restantes
-                if values_to_insert:
-                    try:
-                        execute_values(cursor, """
-                            INSERT INTO gloria.variables_ambientales
-                            (dataset_id, variable_nombre, fecha_tiempo, valor, piscifactoria_id, geometria, profundidad, calidad)
-                            VALUES %s
-                            ON CONFLICT (variable_nombre, fecha_tiempo, geometria) DO UPDATE
-                            SET valor = EXCLUDED.valor, calidad = EXCLUDED.calidad
-                        """, values_to_insert, template="(%s, %s, %s, %s, %s, %s, %s, %s)")
-                        
-                        conn.commit()
-                        inserted_count += len(values_to_insert)
-                        logger.info(f"Insertados {len(values_to_insert)} registros finales (total: {inserted_count})")
-                    except Exception as e:
-                        conn.rollback()
-                        logger.error(f"Error al insertar lote final: {e}")
-            
-            logger.info(f"Proceso completado para {file_path}. {inserted_count} registros insertados.")
-            
-            # Registrar la importación
-            if inserted_count > 0:
-                try:
-                    cursor.execute("""
-                        INSERT INTO gloria.importaciones
-                        (dataset_id, fecha_inicio, fecha_fin, fecha_importacion, cantidad_registros, estado, mensaje)
-                        VALUES (%s, %s, %s, NOW(), %s, %s, %s)
-                    """, (
-                        dataset_db_id,
-                        dates[0].strftime('%Y-%m-%dT%H:%M:%S'),
-                        dates[-1].strftime('%Y-%m-%dT%H:%M:%S'),
-                        inserted_count,
-                        'completado',
-                        f'Archivo: {os.path.basename(file_path)}'
-                    ))
-                    conn.commit()
-                except Exception as e:
-                    conn.rollback()
-                    logger.error(f"Error al registrar importación: {e}")
-            
-            return inserted_count > 0
+            try:
+                cursor.execute("""
+                    INSERT INTO gloria.importaciones
+                    (dataset_id, fecha_inicio, fecha_fin, fecha_importacion, cantidad_registros, estado, mensaje)
+                    VALUES (%s, %s, %s, NOW(), %s, %s, %s)
+                """, (
+                    dataset_db_id,
+                    result['start'].item(),
+                    result['end'].item(),
+                    inserted_count,
+                    'completado',
+                    f'Archivo: {os.path.basename(file_path)}'
+                ))
+                conn.commit()
+            except Exception as e:
+                conn.rollback()
+                logger.error(f"Error al registrar importación: {e}")
+        
+        return inserted_count > 0
             
     except Exception as e:
         conn.rollback()
@@ -662,71 +425,99 @@ def detect_variable_thresholds(conn):
         conn.rollback()
         logger.error(f"Error al detectar umbrales: {e}")
 
-def main():
-    """Función principal para el procesamiento de datos."""
-    try:
-        # Configurar entorno
-        setup_environment()
-        
-        # Establecer conexión con la base de datos
-        conn = get_db_connection()
-        
-        # Buscar archivos NetCDF para procesar
-        nc_files = glob.glob(str(DOWNLOAD_DIR / "*.nc"))
-        
-        if not nc_files:
-            logger.info("No hay archivos nuevos para procesar")
-            return
-        
-        logger.info(f"Encontrados {len(nc_files)} archivos para procesar")
-        
-        # Procesar cada archivo
-        successfully_processed = 0
-        
-        for file_path in nc_files:
-            try:
+def process_files(conn, nc_files, update_cube=True, profiler=None):
+    """
+    Procesa una lista de archivos NetCDF: los carga en la base de datos, los
+    incorpora al cubo local (si update_cube) y los mueve a procesados o fallidos.
+    Con un profiler (app.profiling.RunProfiler) se perfila cada archivo.
+    Devuelve las rutas finales de los archivos procesados correctamente.
+    """
+    processed_files = []
+    
+    for file_path in nc_files:
+        try:
+            with profiled(profiler, file_path):
                 # Obtener información del dataset a partir del nombre de archivo
                 dataset_name, dataset_id, variables = get_dataset_info_from_filename(file_path)
-                
+            
                 # Obtener o crear el dataset en la base de datos
                 dataset_db_id = get_or_create_dataset(conn, dataset_name, dataset_id, variables)
-                
+            
                 # Procesar el archivo
                 success = process_netcdf_file(file_path, dataset_db_id, conn)
-                
+            
                 if success:
+                    # Incorporar el archivo al cubo de datos local
+                    if update_cube:
+                        try:
+                            append_netcdf_to_cube(file_path, root=CUBE_DIR)
+                        except Exception as e:
+                            logger.warning(f"No se pudo actualizar el cubo con {file_path}: {e}")
+                
                     # Mover a directorio de procesados
                     processed_path = PROCESSED_DIR / os.path.basename(file_path)
                     shutil.move(file_path, processed_path)
                     logger.info(f"Archivo movido a {processed_path}")
-                    successfully_processed += 1
+                    processed_files.append(str(processed_path))
                 else:
                     # Mover a directorio de fallidos
                     failed_path = FAILED_DIR / os.path.basename(file_path)
                     shutil.move(file_path, failed_path)
                     logger.warning(f"Archivo movido a {failed_path} debido a errores")
-            except Exception as e:
-                logger.error(f"Error al procesar archivo {file_path}: {e}")
-                # Intentar mover a directorio de fallidos
-                try:
-                    failed_path = FAILED_DIR / os.path.basename(file_path)
-                    shutil.move(file_path, failed_path)
-                    logger.warning(f"Archivo movido a {failed_path} debido a errores")
-                except:
-                    pass
+        except Exception as e:
+            logger.error(f"Error al procesar archivo {file_path}: {e}")
+            # Intentar mover a directorio de fallidos
+            try:
+                failed_path = FAILED_DIR / os.path.basename(file_path)
+                shutil.move(file_path, failed_path)
+                logger.warning(f"Archivo movido a {failed_path} debido a errores")
+            except:
+                pass
+    
+    # Actualizar umbrales para las variables
+    if processed_files:
+        detect_variable_thresholds(conn)
+    
+    return processed_files
+
+def main(profiler=None):
+    """Función principal para el procesamiento de datos."""
+    try:
+        # Configurar entorno
+        setup_environment()
         
-        # Actualizar umbrales para las variables
-        if successfully_processed > 0:
-            detect_variable_thresholds(conn)
+        # Establecer conexión con la base de datos
+        conn = get_db_connection()
+        
+        # Buscar archivos NetCDF para procesar
+        nc_files = sorted(glob.glob(str(DOWNLOAD_DIR / "*.nc")))
+        
+        if not nc_files:
+            logger.info("No hay archivos nuevos para procesar")
+            return
         
-        logger.info(f"Proceso completado. {successfully_processed}/{len(nc_files)} archivos procesados correctamente")
+        logger.info(f"Encontrados {len(nc_files)} archivos para procesar")
+        
+        # Procesar cada archivo
+        processed_files = process_files(conn, nc_files, profiler=profiler)
+        
+        logger.info(f"Proceso completado. {len(processed_files)}/{len(nc_files)} archivos procesados correctamente")
         
         # Cerrar conexión
         conn.close()
         
+        if profiler is not None:
+            profiler.log_report()
+        
+        export_batch_metrics('process_data')
+        
     except Exception as e:
         logger.error(f"Error en el proceso principal: {e}")
         sys.exit(1)
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Procesar los archivos NetCDF descargados de Copernicus Marine")
+    add_profile_arguments(parser)
+    args = parser.parse_args()
+    
+    main(profiler_from_args(args, 'process_data'))
@@ -23,6 +23,10 @@ from pathlib import Path
 from dotenv import load_dotenv
 from datetime import datetime, timedelta
 
+# Librería compartida con python-services (perfilado de consultas)
+sys.path.insert(0, str(Path(__file__).resolve().parents[3] / "python-services"))
+from app.query_profiler import connect_kwargs
+
 # Configuración de logging
 logging.basicConfig(
     level=logging.INFO,
@@ -58,7 +62,8 @@ def get_db_connection():
             port=os.getenv("DB_PORT"),
             dbname=os.getenv("DB_NAME"),
             user=os.getenv("DB_USER"),
-            password=os.getenv("DB_PASSWORD")
+            password=os.getenv("DB_PASSWORD"),
+            **connect_kwargs()
         )
         logger.info("Conexión con la base de datos establecida correctamente")
         return conn
@@ -0,0 +1 @@
+"""Banco de pruebas de la ingesta (ver benchmarks/run.py)."""
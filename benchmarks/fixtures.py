@@ -0,0 +1,208 @@
+"""
+Archivos NetCDF sintéticos con la estructura de los productos de Copernicus Marine.
+
+- oleaje (HCMR WAVE-MEDWAM4): VHM0, VMDR, VTM10 con dimensiones (time, latitude, longitude)
+- rfvl (CMCC RFVL-MFSeas9): uo, vo, thetao con dimensiones (time, depth, latitude, longitude)
+- temperatura (CMCC TEMP-MFSeas9): thetao con profundidad, para el extractor de temperatura
+- salinidad (cmems_mod_med_phy-sal): so con profundidad, diaria
+
+Los campos son deterministas (semilla fija): mismas dimensiones y valores en
+cada ejecución, con tierra enmascarada (_FillValue), compresión zlib como los
+archivos originales y una región que contiene el bounding box de interés, de
+modo que el recorte y el muestreo de los importadores se ejercitan igual.
+"""
+
+import json
+from pathlib import Path
+
+import netCDF4 as nc
+import numpy as np
+
+# Región de las mallas sintéticas (contiene app.ingest.INTEREST_BBOX)
+DOMAIN = {'lon_min': -6.0, 'lon_max': 6.0, 'lat_min': 35.0, 'lat_max': 44.0}
+
+FILL_VALUE = np.float32(1e20)
+
+# Niveles de profundidad (m) de los productos físicos del Mediterráneo
+DEPTH_LEVELS = [1.0182, 3.1657, 5.4649, 7.9203, 10.5364, 13.3181, 16.2716, 19.4033,
+                22.7206, 26.2313, 29.9432, 33.8646, 38.0037, 42.3691, 46.9694, 51.8136]
+
+# Tamaños predefinidos: instantes, resolución (grados) y niveles de profundidad
+SIZES = {
+    'small': {'times': 24, 'resolution': 1 / 12, 'depths': 4, 'days': 7},
+    'medium': {'times': 72, 'resolution': 1 / 24, 'depths': 8, 'days': 30},
+    'large': {'times': 240, 'resolution': 1 / 24, 'depths': 16, 'days': 90},
+}
+
+# Nombres de archivo como los de las descargas reales (los importadores los reconocen por el nombre)
+FILE_NAMES = {
+    'oleaje': '2025110600_h-HCMR--WAVE-MEDWAM4-MEDATL-b20251104_fc00-sv09.00.nc',
+    'rfvl': '20251013_2dh-CMCC--RFVL-MFSeas9-MEDATL-b20251028_an-sv10.00.nc',
+    'temperatura': '20251013_d-CMCC--TEMP-MFSeas9-MEDATL-b20251028_an-sv10.00.nc',
+    'salinidad': 'cmems_mod_med_phy-sal_anfc_4.2km_P1D-m_20250413_112846.nc',
+}
+
+MANIFEST_FILE = 'fixtures.json'
+
+
+def grid(resolution):
+    """Coordenadas (lons, lats) de la malla a la resolución dada."""
+    lons = np.arange(DOMAIN['lon_min'], DOMAIN['lon_max'] + resolution / 2, resolution)
+    lats = np.arange(DOMAIN['lat_min'], DOMAIN['lat_max'] + resolution / 2, resolution)
+    return lons, lats
+
+
+def land_mask(lons, lats):
+    """Máscara de tierra aproximada: costa peninsular ondulada y una isla al este."""
+    lon2d, lat2d = np.meshgrid(lons, lats)
+    coast = -0.6 + 0.5 * np.sin(np.radians(lat2d - 35.0) * 40.0) + 0.15 * (lat2d - 38.0)
+    island = ((lon2d - 2.8) / 1.1) ** 2 + ((lat2d - 39.6) / 0.5) ** 2 < 1.0
+    return (lon2d < coast) | island
+
+
+def _create_file(path, lons, lats, depths=None):
+    ds = nc.Dataset(path, 'w', format='NETCDF4')
+    ds.createDimension('time', None)
+    if depths is not None:
+        ds.createDimension('depth', len(depths))
+    ds.createDimension('latitude', len(lats))
+    ds.createDimension('longitude', len(lons))
+
+    lon_var = ds.createVariable('longitude', 'f4', ('longitude',))
+    lon_var.units = 'degrees_east'
+    lon_var[:] = lons
+    lat_var = ds.createVariable('latitude', 'f4', ('latitude',))
+    lat_var.units = 'degrees_north'
+    lat_var[:] = lats
+    if depths is not None:
+        depth_var = ds.createVariable('depth', 'f4', ('depth',))
+        depth_var.units = 'm'
+        depth_var.positive = 'down'
+        depth_var[:] = depths
+    return ds
+
+
+def _field_variable(ds, name, units, dims):
+    shape = [len(ds.dimensions[d]) if d != 'time' else 1 for d in dims]
+    var = ds.createVariable(name, 'f4', dims, zlib=True, complevel=1,
+                            fill_value=FILL_VALUE, chunksizes=shape)
+    var.units = units
+    return var
+
+
+def _masked(values, mask):
+    return np.where(mask, FILL_VALUE, values).astype(np.float32)
+
+
+def write_wave_file(path, n_times, resolution, seed=0):
+    """Archivo de oleaje MEDWAM4: horario, 'seconds since 1970-01-01'."""
+    rng = np.random.default_rng(seed)
+    lons, lats = grid(resolution)
+    mask = land_mask(lons, lats)
+    lon2d, lat2d = np.meshgrid(lons, lats)
+
+    with _create_file(path, lons, lats) as ds:
+        time_var = ds.createVariable('time', 'f8', ('time',))
+        time_var.units = 'seconds since 1970-01-01 00:00:00'
+        time_var.calendar = 'gregorian'
+        dims = ('time', 'latitude', 'longitude')
+        hm0 = _field_variable(ds, 'VHM0', 'm', dims)
+        mdr = _field_variable(ds, 'VMDR', 'degree', dims)
+        tm10 = _field_variable(ds, 'VTM10', 's', dims)
+
+        start = np.datetime64('2025-11-06T00:00:00', 's').astype(np.int64)
+        for t in range(n_times):
+            phase = 2 * np.pi * t / 48.0
+            height = 1.4 + 1.1 * np.sin(np.radians(lon2d * 30) + phase) * np.cos(np.radians(lat2d * 20))
+            height += rng.gamma(2.0, 0.15, size=height.shape)
+            hm0[t] = _masked(np.clip(height, 0.05, None), mask)
+            mdr[t] = _masked((200 + 60 * np.sin(phase + lat2d) + rng.normal(0, 10, height.shape)) % 360, mask)
+            tm10[t] = _masked(3.5 + 1.6 * height + rng.normal(0, 0.3, height.shape), mask)
+            time_var[t] = start + t * 3600
+    return path
+
+
+def write_ocean_file(path, variables, n_times, n_depths, resolution, time_step_hours, seed=0):
+    """
+    Archivo de física oceánica con profundidad: 'hours since 1900-01-01'.
+    `variables` es una lista de nombres entre uo, vo, thetao y so.
+    """
+    rng = np.random.default_rng(seed)
+    lons, lats = grid(resolution)
+    depths = np.asarray(DEPTH_LEVELS[:n_depths], dtype=np.float32)
+    mask = land_mask(lons, lats)
+    lon2d, lat2d = np.meshgrid(lons, lats)
+    units = {'uo': 'm s-1', 'vo': 'm s-1', 'thetao': 'degrees_C', 'so': '1e-3'}
+
+    with _create_file(path, lons, lats, depths) as ds:
+        time_var = ds.createVariable('time', 'f8', ('time',))
+        time_var.units = 'hours since 1900-01-01'
+        time_var.calendar = 'standard'
+        dims = ('time', 'depth', 'latitude', 'longitude')
+        fields = {name: _field_variable(ds, name, units[name], dims) for name in variables}
+
+        start = (np.datetime64('2025-10-13T00:00:00', 'h') - np.datetime64('1900-01-01T00:00:00', 'h')).astype(np.int64)
+        for t in range(n_times):
+            phase = 2 * np.pi * t * time_step_hours / 24.0
+            for d, depth in enumerate(depths):
+                decay = np.exp(-depth / 40.0)
+                noise = rng.normal(0, 1, size=mask.shape)
+                if 'uo' in fields:
+                    fields['uo'][t, d] = _masked(decay * (0.25 * np.sin(np.radians(lat2d * 60) + phase) + 0.05 * noise), mask)
+                if 'vo' in fields:
+                    fields['vo'][t, d] = _masked(decay * (0.2 * np.cos(np.radians(lon2d * 45) + phase) + 0.05 * noise), mask)
+                if 'thetao' in fields:
+                    fields['thetao'][t, d] = _masked(
+                        14.0 + 8.0 * decay + 1.5 * (44.0 - lat2d) / 9.0 + 0.4 * np.sin(phase) + 0.1 * noise, mask)
+                if 'so' in fields:
+                    fields['so'][t, d] = _masked(37.6 + 0.3 * (lon2d / 6.0) + 0.2 * (1 - decay) + 0.05 * noise, mask)
+            time_var[t] = start + t * time_step_hours
+    return path
+
+
+def build_fixtures(directory, size='small', times=None, resolution=None, depths=None):
+    """
+    Generar (o reutilizar, si coinciden los parámetros) los archivos de prueba.
+    Devuelve {tipo: Path} y deja un manifiesto con las dimensiones de cada archivo.
+    """
+    params = dict(SIZES[size])
+    if times:
+        params['times'] = times
+    if resolution:
+        params['resolution'] = resolution
+    if depths:
+        params['depths'] = depths
+    params['depths'] = min(params['depths'], len(DEPTH_LEVELS))
+
+    directory = Path(directory)
+    directory.mkdir(parents=True, exist_ok=True)
+    manifest_path = directory / MANIFEST_FILE
+    files = {kind: directory / name for kind, name in FILE_NAMES.items()}
+
+    if manifest_path.exists() and all(path.exists() for path in files.values()):
+        with open(manifest_path, 'r') as f:
+            if json.load(f).get('params') == params:
+                return files
+
+    write_wave_file(files['oleaje'], params['times'], params['resolution'], seed=1)
+    write_ocean_file(files['rfvl'], ['uo', 'vo', 'thetao'], params['times'], params['depths'],
+                     params['resolution'], time_step_hours=1, seed=2)
+    write_ocean_file(files['temperatura'], ['thetao'], params['days'], params['depths'],
+                     params['resolution'], time_step_hours=24, seed=3)
+    write_ocean_file(files['salinidad'], ['so'], params['days'], params['depths'],
+                     params['resolution'], time_step_hours=24, seed=4)
+
+    lons, lats = grid(params['resolution'])
+    with open(manifest_path, 'w') as f:
+        json.dump({
+            'params': params,
+            'grid': {'nx': len(lons), 'ny': len(lats)},
+            'files': {kind: {'name': path.name, 'bytes': path.stat().st_size} for kind, path in files.items()},
+        }, f, indent=2)
+    return files
+
+
+def describe(directory):
+    """Manifiesto de los archivos generados (parámetros, malla y tamaños)."""
+    with open(Path(directory) / MANIFEST_FILE, 'r') as f:
+        return json.load(f)
@@ -0,0 +1,234 @@
+#!/usr/bin/env python3
+"""
+Pruebas de carga del servicio de riesgo (/risk/{id} y /predict/{id}).
+
+Genera peticiones concurrentes con httpx (asyncio) contra piscifactorías al
+azar durante un tiempo fijo y resume, por endpoint, la latencia (p50/p95/p99),
+el rendimiento (peticiones/s) y la tasa de errores. Puede arrancar el servicio
+con uvicorn para cada número de workers, de modo que una ejecución compara
+una matriz de configuraciones: workers × concurrencia del cliente × tamaño del
+pool de conexiones HTTP. El servicio abre una conexión a la base de datos por
+petición, así que la concurrencia del cliente es también la de PostgreSQL.
+
+Los datos se preparan con benchmarks/seed_data.py; por defecto se usan las
+piscifactorías sintéticas que encuentre en DB_*.
+
+Uso (desde la raíz del repositorio):
+    python -m benchmarks.seed_data --farms 200 --days 90
+    python -m benchmarks.load_test --workers 1 4 --concurrency 8 32 --duration 30
+    python -m benchmarks.load_test --url http://localhost:8000 --farm-ids 1 2 3
+"""
+
+import os
+import sys
+import json
+import time
+import random
+import socket
+import asyncio
+import argparse
+import subprocess
+from pathlib import Path
+from datetime import datetime
+
+import httpx
+import numpy as np
+
+ROOT_DIR = Path(__file__).resolve().parents[1]
+SERVICE_DIR = ROOT_DIR / 'python-services'
+RESULTS_DIR = ROOT_DIR / 'benchmarks' / 'results'
+
+ENDPOINTS = {
+    'risk': '/risk/{id}',
+    'predict': '/predict/{id}',
+}
+
+# Objetivo de latencia por defecto (p95, milisegundos)
+SLO_P95_MS = 500
+
+# Espera máxima al arranque del servicio
+STARTUP_TIMEOUT = 60
+
+
+def _free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def start_service(workers, port, env=None):
+    """Arrancar el servicio con uvicorn y esperar a que responda."""
+    process = subprocess.Popen(
+        [sys.executable, '-m', 'uvicorn', 'app.main:app', '--host', '127.0.0.1',
+         '--port', str(port), '--workers', str(workers), '--log-level', 'warning'],
+        cwd=SERVICE_DIR,
+        env={**os.environ, **(env or {})}
+    )
+    url = f"http://127.0.0.1:{port}"
+    deadline = time.monotonic() + STARTUP_TIMEOUT
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"El servicio terminó al arrancar (código {process.returncode})")
+        try:
+            if httpx.get(f"{url}/openapi.json", timeout=1).status_code == 200:
+                return process, url
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.5)
+    stop_service(process)
+    raise RuntimeError(f"El servicio no respondió en {STARTUP_TIMEOUT}s")
+
+
+def stop_service(process):
+    process.terminate()
+    try:
+        process.wait(timeout=10)
+    except subprocess.TimeoutExpired:
+        process.kill()
+        process.wait()
+
+
+async def _user(client, deadline, farm_ids, endpoints, samples, rng):
+    """Usuario simulado: peticiones seguidas hasta el final de la prueba."""
+    while time.perf_counter() < deadline:
+        name = rng.choice(endpoints)
+        path = ENDPOINTS[name].format(id=rng.choice(farm_ids))
+        start = time.perf_counter()
+        try:
+            response = await client.get(path)
+            status = response.status_code
+        except httpx.HTTPError:
+            status = None
+        samples[name].append((time.perf_counter() - start, status))
+
+
+async def run_load(url, farm_ids, endpoints, concurrency, pool_size, duration, warmup=2.0, timeout=30.0):
+    """
+    Lanzar `concurrency` usuarios durante `duration` segundos (tras `warmup`
+    segundos que no se cuentan). Devuelve {endpoint: [(segundos, estado)]}.
+    """
+    limits = httpx.Limits(max_connections=pool_size, max_keepalive_connections=pool_size)
+    async with httpx.AsyncClient(base_url=url, limits=limits, timeout=timeout) as client:
+        if warmup:
+            discarded = {name: [] for name in endpoints}
+            await asyncio.gather(*[
+                _user(client, time.perf_counter() + warmup, farm_ids, endpoints, discarded, random.Random(i))
+                for i in range(concurrency)
+            ])
+
+        samples = {name: [] for name in endpoints}
+        deadline = time.perf_counter() + duration
+        await asyncio.gather(*[
+            _user(client, deadline, farm_ids, endpoints, samples, random.Random(1000 + i))
+            for i in range(concurrency)
+        ])
+    return samples
+
+
+def summarize(samples, duration, slo_p95_ms=SLO_P95_MS):
+    """Percentiles de latencia, rendimiento y errores por endpoint y en total."""
+    summary = {}
+    everything = [sample for endpoint_samples in samples.values() for sample in endpoint_samples]
+    for name, endpoint_samples in list(samples.items()) + [('total', everything)]:
+        if not endpoint_samples:
+            continue
+        latencies = np.array([seconds for seconds, _ in endpoint_samples]) * 1000
+        errors = sum(1 for _, status in endpoint_samples if status is None or status >= 400)
+        p50, p95, p99 = np.percentile(latencies, [50, 95, 99])
+        summary[name] = {
+            'requests': len(endpoint_samples),
+            'throughput_rps': round(len(endpoint_samples) / duration, 1),
+            'error_rate': round(errors / len(endpoint_samples), 4),
+            'p50_ms': round(float(p50), 1),
+            'p95_ms': round(float(p95), 1),
+            'p99_ms': round(float(p99), 1),
+            'mean_ms': round(float(latencies.mean()), 1),
+            'max_ms': round(float(latencies.max()), 1),
+            'slo_ok': bool(p95 <= slo_p95_ms and errors == 0),
+        }
+    return summary
+
+
+def _load_farm_ids():
+    """IDs de las piscifactorías sintéticas de benchmarks/seed_data.py."""
+    import psycopg2
+    from .seed_data import seeded_farm_ids
+    from app.import_netcdf_data import DB_CONFIG
+
+    conn = psycopg2.connect(**DB_CONFIG)
+    try:
+        return seeded_farm_ids(conn)
+    finally:
+        conn.close()
+
+
+def _print_row(config, name, stats):
+    print(f"{config:<24}{name:<9}{stats['requests']:>8}{stats['throughput_rps']:>9}"
+          f"{stats['p50_ms']:>9}{stats['p95_ms']:>9}{stats['p99_ms']:>9}{stats['error_rate']:>9.2%}"
+          f"{'' if stats['slo_ok'] else '  ⚠️'}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Pruebas de carga de /risk y /predict")
+    parser.add_argument('--url', help="Servicio ya arrancado (si no, se arranca con uvicorn por cada --workers)")
+    parser.add_argument('--workers', type=int, nargs='+', default=[1], help="Workers de uvicorn a comparar")
+    parser.add_argument('--concurrency', type=int, nargs='+', default=[16], help="Usuarios simultáneos a comparar")
+    parser.add_argument('--pool-size', type=int, nargs='+',
+                        help="Conexiones HTTP máximas del cliente (por defecto, igual a la concurrencia)")
+    parser.add_argument('--endpoints', nargs='+', choices=ENDPOINTS, default=list(ENDPOINTS))
+    parser.add_argument('--duration', type=float, default=30, help="Segundos medidos por configuración")
+    parser.add_argument('--warmup', type=float, default=2, help="Segundos de calentamiento sin medir")
+    parser.add_argument('--farm-ids', type=int, nargs='+',
+                        help="Piscifactorías a consultar (por defecto, las de seed_data en DB_*)")
+    parser.add_argument('--slo-p95-ms', type=float, default=SLO_P95_MS, help="Objetivo de latencia p95 (ms)")
+    parser.add_argument('--output', type=Path, help="Archivo JSON de resultados")
+    args = parser.parse_args()
+
+    sys.path.insert(0, str(SERVICE_DIR))
+    farm_ids = args.farm_ids or _load_farm_ids()
+    if not farm_ids:
+        parser.error("No hay piscifactorías: ejecutar benchmarks.seed_data o indicar --farm-ids")
+
+    report = {
+        'created': datetime.now().isoformat(),
+        'farms': len(farm_ids),
+        'duration': args.duration,
+        'slo_p95_ms': args.slo_p95_ms,
+        'runs': [],
+    }
+    print(f"{'configuración':<24}{'endpoint':<9}{'pet.':>8}{'pet./s':>9}{'p50':>9}{'p95':>9}{'p99':>9}{'errores':>9}")
+
+    for workers in ([None] if args.url else args.workers):
+        process = None
+        url = args.url
+        if url is None:
+            process, url = start_service(workers, _free_port())
+        try:
+            for concurrency in args.concurrency:
+                for pool_size in args.pool_size or [concurrency]:
+                    samples = asyncio.run(run_load(url, farm_ids, args.endpoints, concurrency,
+                                                   pool_size, args.duration, args.warmup))
+                    summary = summarize(samples, args.duration, args.slo_p95_ms)
+                    config = {'workers': workers, 'concurrency': concurrency, 'pool_size': pool_size}
+                    report['runs'].append({**config, 'endpoints': summary})
+
+                    label = f"w={workers or '-'} c={concurrency} pool={pool_size}"
+                    for name, stats in summary.items():
+                        _print_row(label, name, stats)
+        finally:
+            if process is not None:
+                stop_service(process)
+
+    output = args.output or RESULTS_DIR / f"load-{datetime.now():%Y%m%d-%H%M%S}.json"
+    output.parent.mkdir(parents=True, exist_ok=True)
+    with open(output, 'w') as f:
+        json.dump(report, f, indent=2)
+    print(f"✅ Resultados guardados en {output}")
+
+    if not all(run['endpoints']['total']['slo_ok'] for run in report['runs'] if 'total' in run['endpoints']):
+        print(f"⚠️  Alguna configuración no cumple p95 ≤ {args.slo_p95_ms:.0f} ms sin errores")
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
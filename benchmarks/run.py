@@ -0,0 +1,471 @@
+#!/usr/bin/env python3
+"""
+Banco de pruebas de la ingesta de NetCDF.
+
+Mide, sobre los archivos sintéticos de benchmarks/fixtures.py, los importadores
+(import_netcdf_data.process_wave_file, process_data.process_netcdf_file,
+process_salinity_file, process_temperature_file), los extractores a JSON, la
+carga al cubo y la carga por COPY, y guarda los resultados en JSON para
+comparar entre commits.
+
+Modos:
+- db: contra la base de datos de DB_* (p. ej. el contenedor postgres de
+  docker-compose, con el esquema cargado). Escribe datos: usar una base
+  desechable. Las idas y vueltas se cuentan en la conexión (sentencias, COPY,
+  commits) y las filas en los INSERT.
+- fake: sin base de datos. Cada caso toma la especificación de ingesta del
+  propio importador (product_spec, build_ingest_spec, salinity_spec,
+  temperature_spec) y la ejecuta hacia un destino que codifica el COPY binario
+  y lo descarta; las idas y vueltas son las sentencias que emitiría PostgresSink.
+
+Cada caso se ejecuta en un proceso nuevo, de modo que el pico de memoria (RSS)
+es el del caso y no el de los anteriores.
+
+Uso (desde la raíz del repositorio):
+    python -m benchmarks.run run --size small --mode fake
+    python -m benchmarks.run run --size medium --mode db --repeat 3 --cases wave_import copy_load
+    python -m benchmarks.run compare benchmarks/results/a.json benchmarks/results/b.json
+"""
+
+import os
+import sys
+import json
+import time
+import shutil
+import logging
+import argparse
+import platform
+import resource
+import statistics
+import subprocess
+import multiprocessing
+from pathlib import Path
+from datetime import datetime
+
+import numpy as np
+
+from . import fixtures
+
+ROOT_DIR = Path(__file__).resolve().parents[1]
+RESULTS_DIR = ROOT_DIR / 'benchmarks' / 'results'
+WORK_DIR = Path(os.getenv('BENCHMARK_WORK_DIR', '/tmp/gloria-bench'))
+
+# Filas de la carga por COPY sin archivo de origen, por tamaño
+COPY_LOAD_ROWS = {'small': 200000, 'medium': 1000000, 'large': 5000000}
+
+# Variable con la que se marcan las filas de copy_load (se borran al terminar)
+BENCHMARK_VARIABLE = 'benchmark_carga'
+
+# Cambio de filas/s a partir del cual compare marca una regresión
+REGRESSION_THRESHOLD = 0.10
+
+for path in (ROOT_DIR / 'python-services', ROOT_DIR / 'backend' / 'src' / 'scripts'):
+    if str(path) not in sys.path:
+        sys.path.insert(0, str(path))
+
+
+# ----------------------------------------------------------------------
+# Conexión con recuento de idas y vueltas (modo db)
+# ----------------------------------------------------------------------
+
+def connect_counting():
+    """Conexión a DB_* que cuenta sentencias, COPY y commits, y las filas insertadas."""
+    import psycopg2
+    import psycopg2.extensions
+    from app.import_netcdf_data import DB_CONFIG
+
+    class CountingCursor(psycopg2.extensions.cursor):
+        def execute(self, query, vars=None):
+            self.connection.round_trips += 1
+            result = super().execute(query, vars)
+            if isinstance(query, str) and query.lstrip().upper().startswith('INSERT') and self.rowcount > 0:
+                self.connection.rows_written += self.rowcount
+            return result
+
+        def executemany(self, query, vars_list):
+            self.connection.round_trips += 1
+            return super().executemany(query, vars_list)
+
+        def copy_expert(self, sql, file, size=8192):
+            self.connection.round_trips += 1
+            return super().copy_expert(sql, file, size)
+
+    class CountingConnection(psycopg2.extensions.connection):
+        round_trips = 0
+        rows_written = 0
+
+        def commit(self):
+            self.round_trips += 1
+            return super().commit()
+
+        def rollback(self):
+            self.round_trips += 1
+            return super().rollback()
+
+    return psycopg2.connect(**DB_CONFIG, connection_factory=CountingConnection,
+                            cursor_factory=CountingCursor)
+
+
+class CopyBufferSink:
+    """
+    Destino sin base de datos: codifica las filas en COPY binario igual que
+    PostgresSink (por lotes de COPY_BATCH_ROWS) y descarta el buffer.
+    """
+
+    def __init__(self, dataset_id=1, calidad=90):
+        self.dataset_id = dataset_id
+        self.calidad = calidad
+        self.round_trips = 0
+        self.bytes = 0
+
+    def write(self, slab):
+        from app.bulk_load import COPY_BATCH_ROWS, encode_rows, to_pg_microseconds
+
+        t_idx, iy, ix = slab.points()
+        if len(t_idx) == 0:
+            return 0
+        microseconds = to_pg_microseconds(slab.times[t_idx])
+        values = slab.values[t_idx, iy, ix].astype(np.float64)
+        lons, lats = slab.lons[ix], slab.lats[iy]
+
+        # Tabla temporal + DELETE de las claves del lote; COPY + INSERT + commit por lote
+        self.round_trips += 2
+        for start in range(0, len(values), COPY_BATCH_ROWS):
+            batch = slice(start, start + COPY_BATCH_ROWS)
+            buffer = encode_rows(self.dataset_id, slab.target, microseconds[batch], values[batch],
+                                 0, lons[batch], lats[batch], slab.depth, self.calidad)
+            self.bytes += buffer.getbuffer().nbytes
+            self.round_trips += 3
+        return len(values)
+
+    def close(self):
+        pass
+
+
+def _ingest_fake(file_path, spec):
+    from app.ingest import ingest_file
+
+    sink = CopyBufferSink()
+    result = ingest_file(file_path, spec, [sink])
+    return {'rows': sum(result['counts'].values()), 'round_trips': sink.round_trips, 'copy_bytes': sink.bytes}
+
+
+def _timed_db(conn, function, *args):
+    """Ejecutar `function` con la conexión contando idas y vueltas y filas insertadas."""
+    conn.round_trips = conn.rows_written = 0
+    function(*args)
+    return {'rows': conn.rows_written, 'round_trips': conn.round_trips}
+
+
+# ----------------------------------------------------------------------
+# Casos: cada uno devuelve (preparar, medir); solo se cronometra `medir`
+# ----------------------------------------------------------------------
+
+def case_wave_import(ctx):
+    from app import import_netcdf_data
+
+    path = ctx['files']['oleaje']
+    if ctx['mode'] == 'fake':
+        return lambda: _ingest_fake(path, import_netcdf_data.product_spec('oleaje'))
+
+    conn = ctx['conn']
+    dataset_id = import_netcdf_data.get_or_create_dataset(conn, 'oleaje')
+    return lambda: _timed_db(conn, import_netcdf_data.process_wave_file, path, conn, dataset_id)
+
+
+def case_netcdf_process(ctx):
+    from netCDF4 import Dataset
+    import process_data
+
+    path = ctx['files']['rfvl']
+    if ctx['mode'] == 'fake':
+        with Dataset(path, 'r') as ds:
+            spec = process_data.build_ingest_spec(ds)
+        return lambda: _ingest_fake(path, spec)
+
+    conn = ctx['conn']
+    name, dataset_id, variables = process_data.get_dataset_info_from_filename(path.name)
+    dataset_db_id = process_data.get_or_create_dataset(conn, name, dataset_id, variables)
+    return lambda: _timed_db(conn, process_data.process_netcdf_file, str(path), dataset_db_id, conn)
+
+
+def case_salinity_import(ctx):
+    import import_salinity_data
+
+    path = ctx['files']['salinidad']
+    if ctx['mode'] == 'fake':
+        return lambda: _ingest_fake(path, import_salinity_data.salinity_spec())
+
+    conn = ctx['conn']
+    return lambda: _timed_db(conn, import_salinity_data.process_salinity_file, str(path), conn)
+
+
+def case_temperature_import(ctx):
+    from netCDF4 import Dataset
+    import import_temperature_data
+
+    path = ctx['files']['temperatura']
+    if ctx['mode'] == 'fake':
+        with Dataset(path, 'r') as ds:
+            spec = import_temperature_data.temperature_spec(ds)
+        return lambda: _ingest_fake(path, spec)
+
+    conn = ctx['conn']
+    return lambda: _timed_db(conn, import_temperature_data.process_temperature_file, str(path), conn)
+
+
+def _extractor_case(module_name, function_name):
+    def case(ctx):
+        import importlib
+        extract = getattr(importlib.import_module(module_name), function_name)
+        output = ctx['work_dir'] / f"{function_name}.json"
+
+        def measure():
+            sink = extract(output_file=output, data_dir=ctx['files']['oleaje'].parent)
+            sink.close()
+            return {'rows': len(sink.points), 'round_trips': 0, 'output_bytes': output.stat().st_size}
+        return measure
+    return case
+
+
+def case_cube_append(ctx):
+    from app.data_cube import append_netcdf_to_cube
+
+    root = ctx['work_dir'] / 'cubo'
+    shutil.rmtree(root, ignore_errors=True)
+
+    def measure():
+        written = {}
+        for kind in ('oleaje', 'rfvl'):
+            written.update(append_netcdf_to_cube(ctx['files'][kind], root=root))
+        cells = 0
+        for name, n_times in written.items():
+            with open(root / name / 'meta.json', 'r') as f:
+                meta = json.load(f)
+            cells += n_times * len(meta['latitudes']) * len(meta['longitudes'])
+        return {'rows': cells, 'round_trips': 0}
+    return measure
+
+
+def case_copy_load(ctx):
+    from app.bulk_load import COPY_BATCH_ROWS, encode_rows, to_pg_microseconds, copy_variables_ambientales
+
+    rng = np.random.default_rng(0)
+    n_rows = COPY_LOAD_ROWS[ctx['size']]
+    times = np.datetime64('2025-01-01T00:00:00', 'us') + np.arange(n_rows).astype('timedelta64[h]') // 1000
+    values = rng.gamma(2.0, 0.7, n_rows)
+    lons = rng.uniform(-1.5, 0.7, n_rows)
+    lats = rng.uniform(37.5, 40.5, n_rows)
+
+    if ctx['mode'] == 'fake':
+        def measure():
+            microseconds = to_pg_microseconds(times)
+            copy_bytes = 0
+            for start in range(0, n_rows, COPY_BATCH_ROWS):
+                batch = slice(start, start + COPY_BATCH_ROWS)
+                copy_bytes += encode_rows(1, BENCHMARK_VARIABLE, microseconds[batch], values[batch],
+                                          0, lons[batch], lats[batch]).getbuffer().nbytes
+            return {'rows': n_rows, 'round_trips': 2 + 3 * -(-n_rows // COPY_BATCH_ROWS), 'copy_bytes': copy_bytes}
+        return measure
+
+    from app.import_netcdf_data import get_or_create_dataset
+    conn = ctx['conn']
+    dataset_id = get_or_create_dataset(conn, 'oleaje')
+
+    def measure():
+        try:
+            return _timed_db(conn, copy_variables_ambientales, conn, dataset_id, BENCHMARK_VARIABLE,
+                             times, values, 0, lons, lats)
+        finally:
+            cursor = conn.cursor()
+            cursor.execute("DELETE FROM gloria.variables_ambientales WHERE variable_nombre = %s",
+                           (BENCHMARK_VARIABLE,))
+            conn.commit()
+            cursor.close()
+    return measure
+
+
+CASES = {
+    'wave_import': case_wave_import,
+    'netcdf_process': case_netcdf_process,
+    'salinity_import': case_salinity_import,
+    'temperature_import': case_temperature_import,
+    'extract_waves': _extractor_case('extract_to_json', 'extract_wave_data'),
+    'extract_currents': _extractor_case('extract_currents_to_json', 'extract_current_data'),
+    'extract_temperature': _extractor_case('extract_temp_to_json', 'extract_temperature_data'),
+    'cube_append': case_cube_append,
+    'copy_load': case_copy_load,
+}
+
+
+# ----------------------------------------------------------------------
+# Ejecución
+# ----------------------------------------------------------------------
+
+def _max_rss_mb():
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def _run_case(name, ctx, queue):
+    """Ejecutar un caso en este proceso (hijo) y enviar el resultado por la cola."""
+    logging.disable(logging.INFO)
+    sys.stdout = open(os.devnull, 'w')  # Salida de progreso de los extractores
+    try:
+        os.chdir(ctx['work_dir'])  # Los scripts escriben sus logs en el directorio actual
+        if ctx['mode'] == 'db':
+            ctx['conn'] = connect_counting()
+        measure = CASES[name](ctx)
+        rss_before = _max_rss_mb()
+
+        start = time.perf_counter()
+        result = measure()
+        result['seconds'] = time.perf_counter() - start
+
+        result['rss_before_mb'] = round(rss_before, 1)
+        result['peak_rss_mb'] = round(_max_rss_mb(), 1)
+        if ctx.get('conn') is not None:
+            ctx['conn'].close()
+        queue.put(result)
+    except Exception as e:
+        queue.put({'error': f"{type(e).__name__}: {e}"})
+
+
+def run_case(name, ctx, repeat=1):
+    """Ejecutar un caso `repeat` veces, cada una en un proceso nuevo."""
+    mp = multiprocessing.get_context('spawn')
+    runs = []
+    for _ in range(repeat):
+        queue = mp.Queue()
+        process = mp.Process(target=_run_case, args=(name, ctx, queue))
+        process.start()
+        result = queue.get()
+        process.join()
+        if 'error' in result:
+            return result
+        runs.append(result)
+
+    seconds = [r['seconds'] for r in runs]
+    summary = {key: value for key, value in runs[-1].items() if key not in ('seconds', 'rss_before_mb', 'peak_rss_mb')}
+    best = min(seconds)
+    summary.update({
+        'seconds': round(statistics.median(seconds), 4),
+        'seconds_min': round(best, 4),
+        'seconds_all': [round(s, 4) for s in seconds],
+        'rows_per_second': round(summary['rows'] / best, 1) if best > 0 else None,
+        'rss_before_mb': max(r['rss_before_mb'] for r in runs),
+        'peak_rss_mb': max(r['peak_rss_mb'] for r in runs),
+    })
+    return summary
+
+
+def _git_commit():
+    try:
+        commit = subprocess.check_output(['git', 'rev-parse', 'HEAD'], cwd=ROOT_DIR, text=True).strip()
+        dirty = bool(subprocess.check_output(['git', 'status', '--porcelain', '--untracked-files=no'],
+                                             cwd=ROOT_DIR, text=True).strip())
+        return commit, dirty
+    except (OSError, subprocess.CalledProcessError):
+        return None, None
+
+
+def run_benchmarks(size='small', mode='fake', cases=None, repeat=1, times=None, resolution=None, depths=None):
+    """Generar los archivos de prueba, ejecutar los casos y devolver el informe."""
+    work_dir = WORK_DIR / size
+    files = fixtures.build_fixtures(work_dir / 'data', size, times, resolution, depths)
+    manifest = fixtures.describe(work_dir / 'data')
+    ctx = {'files': files, 'mode': mode, 'size': size, 'params': manifest['params'], 'work_dir': work_dir}
+
+    commit, dirty = _git_commit()
+    report = {
+        'commit': commit,
+        'dirty': dirty,
+        'created': datetime.now().isoformat(),
+        'mode': mode,
+        'size': size,
+        'fixtures': manifest,
+        'environment': {
+            'python': platform.python_version(),
+            'numpy': np.__version__,
+            'platform': platform.platform(),
+            'cpus': os.cpu_count(),
+        },
+        'cases': {},
+    }
+
+    for name in cases or CASES:
+        print(f"⏱️  {name}...", end=' ', flush=True)
+        result = run_case(name, ctx, repeat)
+        report['cases'][name] = result
+        if 'error' in result:
+            print(f"❌ {result['error']}")
+        else:
+            print(f"{result['rows']} filas en {result['seconds']:.3f}s "
+                  f"({result['rows_per_second']} filas/s, {result['round_trips']} idas y vueltas, "
+                  f"pico {result['peak_rss_mb']} MB)")
+    return report
+
+
+def compare(base_path, new_path, threshold=REGRESSION_THRESHOLD):
+    """Comparar filas/s y memoria de dos informes. Devuelve True si no hay regresiones."""
+    with open(base_path, 'r') as f:
+        base = json.load(f)
+    with open(new_path, 'r') as f:
+        new = json.load(f)
+
+    print(f"Base:  {(base.get('commit') or '?')[:10]} ({base['mode']}, {base['size']})")
+    print(f"Nuevo: {(new.get('commit') or '?')[:10]} ({new['mode']}, {new['size']})")
+    print(f"{'caso':<22}{'filas/s base':>15}{'filas/s nuevo':>15}{'cambio':>10}{'RSS base':>10}{'RSS nuevo':>10}")
+
+    ok = True
+    for name, result in new['cases'].items():
+        previous = base['cases'].get(name)
+        if not previous or 'error' in previous or 'error' in result or not previous.get('rows_per_second'):
+            print(f"{name:<22}{'-':>15}{result.get('rows_per_second', '-'):>15}")
+            continue
+        change = result['rows_per_second'] / previous['rows_per_second'] - 1
+        regression = change < -threshold
+        ok = ok and not regression
+        print(f"{name:<22}{previous['rows_per_second']:>15.0f}{result['rows_per_second']:>15.0f}"
+              f"{change:>+10.1%}{previous['peak_rss_mb']:>10.0f}{result['peak_rss_mb']:>10.0f}"
+              f"{'  ⚠️' if regression else ''}")
+    return ok
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Banco de pruebas de la ingesta de NetCDF")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    run_parser = subparsers.add_parser('run', help="Ejecutar los casos y guardar el informe JSON")
+    run_parser.add_argument('--size', choices=fixtures.SIZES, default='small')
+    run_parser.add_argument('--mode', choices=['fake', 'db'], default='fake')
+    run_parser.add_argument('--cases', nargs='+', choices=CASES, help="Casos a ejecutar (por defecto, todos)")
+    run_parser.add_argument('--repeat', type=int, default=1, help="Repeticiones por caso (se usa la mediana)")
+    run_parser.add_argument('--times', type=int, help="Instantes por archivo (sustituye al tamaño)")
+    run_parser.add_argument('--resolution', type=float, help="Resolución de la malla en grados")
+    run_parser.add_argument('--depths', type=int, help="Niveles de profundidad")
+    run_parser.add_argument('--output', type=Path, help="Archivo JSON de resultados")
+
+    compare_parser = subparsers.add_parser('compare', help="Comparar dos informes")
+    compare_parser.add_argument('base', type=Path)
+    compare_parser.add_argument('new', type=Path)
+    compare_parser.add_argument('--threshold', type=float, default=REGRESSION_THRESHOLD,
+                                help="Pérdida de filas/s considerada regresión (fracción)")
+
+    args = parser.parse_args()
+
+    if args.command == 'compare':
+        if not compare(args.base, args.new, args.threshold):
+            sys.exit(1)
+        return
+
+    report = run_benchmarks(args.size, args.mode, args.cases, args.repeat,
+                            args.times, args.resolution, args.depths)
+    output = args.output or RESULTS_DIR / f"{(report['commit'] or 'local')[:10]}-{args.size}-{args.mode}.json"
+    output.parent.mkdir(parents=True, exist_ok=True)
+    with open(output, 'w') as f:
+        json.dump(report, f, indent=2)
+    print(f"✅ Resultados guardados en {output}")
+
+
+if __name__ == '__main__':
+    main()
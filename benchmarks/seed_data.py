@@ -0,0 +1,210 @@
+#!/usr/bin/env python3
+"""
+Datos sintéticos para las pruebas de carga del servicio de riesgo.
+
+Crea piscifactorías ('Carga 0001', 'Carga 0002'...) en la región de interés y
+su histórico en gloria.variables_ambientales (uo, vo, wave_height y
+temperature, las variables que consultan /risk y /predict), más una malla de
+valores regionales sin piscifactoría, de modo que el hypertable tenga un
+volumen realista y los planes de consulta lentos se noten.
+
+Todo se asocia a un dataset propio y se puede borrar con --clean. Si ya hay
+datos sintéticos no se vuelve a sembrar (el histórico termina en la hora
+actual y se solaparía con el anterior): primero hay que ejecutar --clean.
+
+Uso (desde la raíz del repositorio, variables DB_*):
+    python -m benchmarks.seed_data --farms 200 --days 90
+    python -m benchmarks.seed_data --clean
+"""
+
+import sys
+import time
+import argparse
+from pathlib import Path
+
+import numpy as np
+
+ROOT_DIR = Path(__file__).resolve().parents[1]
+if str(ROOT_DIR / 'python-services') not in sys.path:
+    sys.path.insert(0, str(ROOT_DIR / 'python-services'))
+
+from app.bulk_load import copy_variables_ambientales
+from app.ingest import INTEREST_BBOX
+
+SEED_DATASET = {'nombre': 'Carga sintética', 'fuente': 'benchmark', 'dataset_id': 'benchmark-carga'}
+FARM_PREFIX = 'Carga '
+
+# Variables por piscifactoría: (nombre, media, amplitud diaria, ruido)
+FARM_VARIABLES = [
+    ('wave_height', 1.2, 0.6, 0.25),
+    ('temperature', 19.0, 1.5, 0.3),
+    ('uo', 0.0, 0.15, 0.05),
+    ('vo', 0.0, 0.12, 0.05),
+]
+
+# Variable de los puntos regionales (sin piscifactoría)
+REGIONAL_VARIABLE = 'oleaje_altura'
+
+
+def get_seed_dataset(conn):
+    """ID del dataset de los datos sintéticos (se crea si no existe)."""
+    cursor = conn.cursor()
+    cursor.execute("""
+        INSERT INTO gloria.datasets (nombre, fuente, dataset_id, variables, formato, frecuencia_actualizacion)
+        VALUES (%s, %s, %s, %s, 'sintético', 'horaria')
+        ON CONFLICT (fuente, dataset_id) DO UPDATE SET nombre = EXCLUDED.nombre
+        RETURNING id
+    """, (SEED_DATASET['nombre'], SEED_DATASET['fuente'], SEED_DATASET['dataset_id'],
+          [name for name, *_ in FARM_VARIABLES] + [REGIONAL_VARIABLE]))
+    dataset_id = cursor.fetchone()[0]
+    conn.commit()
+    cursor.close()
+    return dataset_id
+
+
+def seeded_farm_ids(conn):
+    """IDs de las piscifactorías sintéticas."""
+    cursor = conn.cursor()
+    cursor.execute("SELECT id FROM gloria.piscifactorias WHERE nombre LIKE %s ORDER BY id", (FARM_PREFIX + '%',))
+    ids = [row[0] for row in cursor.fetchall()]
+    cursor.close()
+    return ids
+
+
+def has_seeded_data(conn, dataset_id):
+    """Si el dataset sintético ya tiene histórico."""
+    cursor = conn.cursor()
+    cursor.execute("SELECT EXISTS (SELECT 1 FROM gloria.variables_ambientales WHERE dataset_id = %s)",
+                   (dataset_id,))
+    exists = cursor.fetchone()[0]
+    cursor.close()
+    return exists
+
+
+def create_farms(conn, n_farms, rng):
+    """Crear las piscifactorías que falten hasta n_farms. Devuelve sus IDs."""
+    lon_min, lat_min, lon_max, lat_max = INTEREST_BBOX
+    names = [f"{FARM_PREFIX}{i:04d}" for i in range(1, n_farms + 1)]
+    lons = rng.uniform(lon_min, lon_max, n_farms)
+    lats = rng.uniform(lat_min, lat_max, n_farms)
+
+    cursor = conn.cursor()
+    cursor.execute("""
+        INSERT INTO gloria.piscifactorias (nombre, tipo, especies, provincia, geometria)
+        SELECT s.nombre, 'marina', ARRAY['Dorada', 'Lubina'], 'Sintética',
+               ST_SetSRID(ST_MakePoint(s.lon, s.lat), 4326)
+        FROM unnest(%s::text[], %s::float8[], %s::float8[]) AS s(nombre, lon, lat)
+        ON CONFLICT (nombre) DO NOTHING
+    """, (names, lons.tolist(), lats.tolist()))
+    conn.commit()
+    cursor.close()
+    return seeded_farm_ids(conn)[:n_farms]
+
+
+def _series(rng, n_series, times, mean, amplitude, noise):
+    """Series (n_series, n_times) con ciclo diario y ruido."""
+    hours = (times - times[0]).astype('timedelta64[h]').astype(np.float64)
+    phase = rng.uniform(0, 2 * np.pi, (n_series, 1))
+    values = mean + amplitude * np.sin(2 * np.pi * hours[None, :] / 24.0 + phase)
+    return values + rng.normal(0, noise, (n_series, len(times)))
+
+
+def seed(conn, n_farms=200, days=90, step_hours=1, regional_points=500, seed_value=0):
+    """
+    Crear piscifactorías y su histórico. Devuelve {variable: filas cargadas}.
+    El histórico termina en la hora actual para que las consultas de "último
+    valor" recorran los chunks recientes como en producción.
+    Falla con RuntimeError si ya hay datos sintéticos (usar clean antes).
+    """
+    rng = np.random.default_rng(seed_value)
+    dataset_id = get_seed_dataset(conn)
+    if has_seeded_data(conn, dataset_id):
+        raise RuntimeError("Ya hay datos sintéticos: borrarlos antes con --clean")
+    farm_ids = np.asarray(create_farms(conn, n_farms, rng), dtype=np.int64)
+
+    end = np.datetime64('now', 'h').astype('datetime64[us]')
+    times = end - np.arange(days * 24 // step_hours)[::-1].astype('timedelta64[h]') * step_hours
+    counts = {}
+
+    for name, mean, amplitude, noise in FARM_VARIABLES:
+        values = _series(rng, len(farm_ids), times, mean, amplitude, noise)
+        if name == 'wave_height':
+            values = np.clip(values, 0.05, None)
+        counts[name] = copy_variables_ambientales(
+            conn, dataset_id, name,
+            times=np.tile(times, len(farm_ids)),
+            values=values.ravel(),
+            farm_ids=np.repeat(farm_ids, len(times)),
+            replace=False
+        )
+
+    if regional_points:
+        lon_min, lat_min, lon_max, lat_max = INTEREST_BBOX
+        lons = rng.uniform(lon_min, lon_max, regional_points)
+        lats = rng.uniform(lat_min, lat_max, regional_points)
+        values = np.clip(_series(rng, regional_points, times, 1.2, 0.6, 0.25), 0.05, None)
+        counts[REGIONAL_VARIABLE] = copy_variables_ambientales(
+            conn, dataset_id, REGIONAL_VARIABLE,
+            times=np.tile(times, regional_points),
+            values=values.ravel(),
+            lons=np.repeat(lons, len(times)),
+            lats=np.repeat(lats, len(times)),
+            replace=False
+        )
+
+    cursor = conn.cursor()
+    cursor.execute("ANALYZE gloria.variables_ambientales")
+    cursor.execute("ANALYZE gloria.piscifactorias")
+    conn.commit()
+    cursor.close()
+    return counts
+
+
+def clean(conn):
+    """Borrar el histórico y las piscifactorías sintéticas."""
+    cursor = conn.cursor()
+    cursor.execute("""
+        DELETE FROM gloria.variables_ambientales
+        WHERE dataset_id IN (SELECT id FROM gloria.datasets WHERE fuente = %s AND dataset_id = %s)
+    """, (SEED_DATASET['fuente'], SEED_DATASET['dataset_id']))
+    rows = cursor.rowcount
+    cursor.execute("DELETE FROM gloria.piscifactorias WHERE nombre LIKE %s", (FARM_PREFIX + '%',))
+    farms = cursor.rowcount
+    conn.commit()
+    cursor.close()
+    return rows, farms
+
+
+def main():
+    import psycopg2
+    from app.import_netcdf_data import DB_CONFIG
+
+    parser = argparse.ArgumentParser(description="Datos sintéticos para las pruebas de carga")
+    parser.add_argument('--farms', type=int, default=200, help="Piscifactorías sintéticas")
+    parser.add_argument('--days', type=int, default=90, help="Días de histórico")
+    parser.add_argument('--step-hours', type=int, default=1, help="Paso del histórico en horas")
+    parser.add_argument('--regional-points', type=int, default=500,
+                        help="Puntos regionales (sin piscifactoría) con el mismo histórico")
+    parser.add_argument('--clean', action='store_true', help="Borrar los datos sintéticos y salir")
+    args = parser.parse_args()
+
+    conn = psycopg2.connect(**DB_CONFIG)
+    try:
+        if args.clean:
+            rows, farms = clean(conn)
+            print(f"🗑️  Borradas {rows} filas y {farms} piscifactorías sintéticas")
+            return
+
+        start = time.perf_counter()
+        try:
+            counts = seed(conn, args.farms, args.days, args.step_hours, args.regional_points)
+        except RuntimeError as e:
+            print(f"❌ {e}")
+            sys.exit(1)
+        print(f"✅ Cargadas {sum(counts.values())} filas en {time.perf_counter() - start:.1f}s: {counts}")
+    finally:
+        conn.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,63 @@
+-- ======================================================================
+-- Almacenamiento compacto de campos en malla (grid)
+-- Un registro por (dataset, variable, instante, malla) con todos los
+-- valores de la malla en un array float4, en lugar de una fila con su
+-- propio punto PostGIS por cada celda.
+-- ======================================================================
+
+-- Mallas: vectores de coordenadas compartidos por todos los campos
+CREATE TABLE IF NOT EXISTS gloria.grids (
+    id SERIAL PRIMARY KEY,
+    huella CHAR(32) NOT NULL,           -- MD5 de los vectores de coordenadas
+    nx INTEGER NOT NULL,                -- Número de longitudes
+    ny INTEGER NOT NULL,                -- Número de latitudes
+    longitudes FLOAT8[] NOT NULL,
+    latitudes FLOAT8[] NOT NULL,
+    bbox_geom GEOMETRY(POLYGON, 4326),
+    fecha_registro TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP,
+    CONSTRAINT grids_huella_unica UNIQUE (huella)
+);
+
+-- Campos en malla: valores en orden fila-mayor (lat, lon), NaN en tierra
+CREATE TABLE IF NOT EXISTS gloria.campos_grid (
+    dataset_id INTEGER NOT NULL REFERENCES gloria.datasets(id),
+    variable VARCHAR(50) NOT NULL,
+    fecha_tiempo TIMESTAMP WITH TIME ZONE NOT NULL,
+    grid_id INTEGER NOT NULL REFERENCES gloria.grids(id),
+    valores REAL[] NOT NULL,
+    PRIMARY KEY (dataset_id, variable, fecha_tiempo, grid_id)
+);
+
+SELECT create_hypertable('gloria.campos_grid', 'fecha_tiempo', if_not_exists => TRUE);
+
+CREATE INDEX IF NOT EXISTS idx_campos_grid_variable_fecha
+ON gloria.campos_grid (variable, fecha_tiempo DESC);
+
+CREATE INDEX IF NOT EXISTS idx_grids_bbox
+ON gloria.grids USING GIST(bbox_geom);
+
+-- Función para obtener el valor de una celda a partir de sus índices
+CREATE OR REPLACE FUNCTION gloria.valor_celda(
+    _valores REAL[],
+    _nx INTEGER,
+    _iy INTEGER,
+    _ix INTEGER
+)
+RETURNS REAL AS $$
+    SELECT _valores[_iy * _nx + _ix + 1];
+$$ LANGUAGE sql IMMUTABLE;
+
+COMMENT ON TABLE gloria.grids IS
+'Vectores de coordenadas de las mallas regulares usadas por gloria.campos_grid';
+
+COMMENT ON TABLE gloria.campos_grid IS
+'Campos ambientales en malla: un array float4 por dataset, variable e instante. Las series por piscifactoría siguen en gloria.variables_ambientales';
+
+COMMENT ON FUNCTION gloria.valor_celda(REAL[], INTEGER, INTEGER, INTEGER) IS
+'Retorna el valor de la celda (iy, ix) de un campo en malla con nx longitudes';
+
+-- Log de finalización
+DO $$
+BEGIN
+    RAISE NOTICE '✅ Almacenamiento de campos en malla configurado correctamente';
+END $$;
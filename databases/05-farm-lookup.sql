@@ -0,0 +1,69 @@
+-- ======================================================================
+-- Búsqueda de la piscifactoría más cercana a un punto
+-- Usa la ordenación KNN (<->) del índice GIST sobre una columna geography
+-- en lugar de calcular ST_Distance para cada candidata.
+-- ======================================================================
+
+-- Ubicación de la piscifactoría como geography (mantenida por PostgreSQL)
+ALTER TABLE gloria.piscifactorias
+ADD COLUMN IF NOT EXISTS geografia GEOGRAPHY(POINT, 4326)
+GENERATED ALWAYS AS (geometria::geography) STORED;
+
+CREATE INDEX IF NOT EXISTS idx_piscifactorias_geografia
+ON gloria.piscifactorias USING GIST(geografia);
+
+-- Piscifactoría asignada a un punto: la que lo contiene en su área o,
+-- si no hay ninguna, la más cercana dentro de _max_km
+CREATE OR REPLACE FUNCTION gloria.farm_for_point(
+    _lon DOUBLE PRECISION,
+    _lat DOUBLE PRECISION,
+    _max_km DOUBLE PRECISION DEFAULT 20
+)
+RETURNS INTEGER AS $$
+    WITH punto AS (
+        SELECT ST_SetSRID(ST_MakePoint(_lon, _lat), 4326) AS geom
+    )
+    SELECT id FROM (
+        (
+            SELECT p.id, 0 AS prioridad
+            FROM gloria.piscifactorias p, punto
+            WHERE p.geom_area IS NOT NULL
+            AND ST_Contains(p.geom_area, punto.geom)
+            AND ST_DWithin(p.geografia, punto.geom::geography, _max_km * 1000)
+            LIMIT 1
+        )
+        UNION ALL
+        (
+            SELECT p.id, 1 AS prioridad
+            FROM gloria.piscifactorias p, punto
+            WHERE ST_DWithin(p.geografia, punto.geom::geography, _max_km * 1000)
+            ORDER BY p.geografia <-> punto.geom::geography
+            LIMIT 1
+        )
+    ) candidatas
+    ORDER BY prioridad
+    LIMIT 1;
+$$ LANGUAGE sql STABLE;
+
+-- Variante por lotes: un array de IDs (NULL si no hay ninguna) alineado con los puntos
+CREATE OR REPLACE FUNCTION gloria.farms_for_points(
+    _lons DOUBLE PRECISION[],
+    _lats DOUBLE PRECISION[],
+    _max_km DOUBLE PRECISION DEFAULT 20
+)
+RETURNS INTEGER[] AS $$
+    SELECT COALESCE(array_agg(gloria.farm_for_point(p.lon, p.lat, _max_km) ORDER BY p.orden), '{}')
+    FROM unnest(_lons, _lats) WITH ORDINALITY AS p(lon, lat, orden);
+$$ LANGUAGE sql STABLE;
+
+COMMENT ON FUNCTION gloria.farm_for_point(DOUBLE PRECISION, DOUBLE PRECISION, DOUBLE PRECISION) IS
+'Retorna la piscifactoría cuyo área contiene el punto o la más cercana dentro de _max_km (NULL si no hay ninguna)';
+
+COMMENT ON FUNCTION gloria.farms_for_points(DOUBLE PRECISION[], DOUBLE PRECISION[], DOUBLE PRECISION) IS
+'Versión por lotes de gloria.farm_for_point: un ID por punto, en el mismo orden';
+
+-- Log de finalización
+DO $$
+BEGIN
+    RAISE NOTICE '✅ Búsqueda de piscifactorías por punto configurada correctamente';
+END $$;
@@ -0,0 +1,71 @@
+-- ======================================================================
+-- Punto de malla asignado a cada piscifactoría
+-- Se calcula una vez por (piscifactoría, variable) con la ordenación KNN del
+-- índice GIST, de modo que la asignación de series a las piscifactorías es
+-- un único INSERT ... SELECT que une por geometría.
+-- ======================================================================
+
+CREATE TABLE IF NOT EXISTS gloria.piscifactoria_punto_malla (
+    piscifactoria_id INTEGER NOT NULL REFERENCES gloria.piscifactorias(id) ON DELETE CASCADE,
+    variable_nombre VARCHAR(50) NOT NULL,
+    dataset_id INTEGER NOT NULL REFERENCES gloria.datasets(id),
+    geometria GEOMETRY(POINT, 4326) NOT NULL,  -- Punto de malla de origen
+    distancia_m FLOAT NOT NULL,
+    fecha_calculo TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (piscifactoria_id, variable_nombre)
+);
+
+-- Calcular el punto de malla más cercano (dentro de _max_km) de las
+-- piscifactorías que aún no lo tienen para _variable. Con _rebuild se
+-- recalcula para todas. Retorna el número de piscifactorías asignadas.
+CREATE OR REPLACE FUNCTION gloria.map_farms_to_grid_points(
+    _variable VARCHAR,
+    _max_km DOUBLE PRECISION DEFAULT 50,
+    _rebuild BOOLEAN DEFAULT FALSE
+)
+RETURNS INTEGER AS $$
+DECLARE
+    _count INTEGER;
+BEGIN
+    IF _rebuild THEN
+        DELETE FROM gloria.piscifactoria_punto_malla WHERE variable_nombre = _variable;
+    END IF;
+
+    INSERT INTO gloria.piscifactoria_punto_malla
+        (piscifactoria_id, variable_nombre, dataset_id, geometria, distancia_m)
+    SELECT p.id, _variable, punto.dataset_id, punto.geometria,
+           ST_Distance(punto.geometria::geography, p.geografia)
+    FROM gloria.piscifactorias p
+    CROSS JOIN LATERAL (
+        -- Solo puntos de malla: se excluyen las series ya asignadas a piscifactorías
+        SELECT va.dataset_id, va.geometria
+        FROM gloria.variables_ambientales va
+        WHERE va.variable_nombre = _variable
+        AND NOT EXISTS (
+            SELECT 1 FROM gloria.piscifactorias q WHERE q.geometria ~= va.geometria
+        )
+        ORDER BY va.geometria <-> p.geometria
+        LIMIT 1
+    ) punto
+    WHERE NOT EXISTS (
+        SELECT 1 FROM gloria.piscifactoria_punto_malla m
+        WHERE m.piscifactoria_id = p.id AND m.variable_nombre = _variable
+    )
+    AND ST_DWithin(punto.geometria::geography, p.geografia, _max_km * 1000);
+
+    GET DIAGNOSTICS _count = ROW_COUNT;
+    RETURN _count;
+END;
+$$ LANGUAGE plpgsql;
+
+COMMENT ON TABLE gloria.piscifactoria_punto_malla IS
+'Punto de malla más cercano a cada piscifactoría por variable, origen de sus series asignadas';
+
+COMMENT ON FUNCTION gloria.map_farms_to_grid_points(VARCHAR, DOUBLE PRECISION, BOOLEAN) IS
+'Calcula el punto de malla más cercano de las piscifactorías sin asignar (o de todas con _rebuild)';
+
+-- Log de finalización
+DO $$
+BEGIN
+    RAISE NOTICE '✅ Asignación de puntos de malla a piscifactorías configurada correctamente';
+END $$;
@@ -0,0 +1,36 @@
+-- ======================================================================
+-- Puntos distintos con datos regionales (sin piscifactoría) por variable
+-- gloria.variables_ambientales repite cada punto en cada instante, así que
+-- la búsqueda KNN de los puntos más cercanos a una piscifactoría se hace
+-- sobre esta tabla (un registro por punto, con su índice GIST) y después se
+-- une por geometría con las series completas.
+-- La mantiene app.bulk_load al cargar lotes regionales.
+-- ======================================================================
+
+CREATE TABLE IF NOT EXISTS gloria.puntos_regionales (
+    variable_nombre VARCHAR(50) NOT NULL,
+    geometria GEOMETRY(POINT, 4326) NOT NULL,
+    fecha_registro TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP,
+    CONSTRAINT puntos_regionales_unico UNIQUE (variable_nombre, geometria)
+);
+
+CREATE INDEX IF NOT EXISTS idx_puntos_regionales_geometria
+ON gloria.puntos_regionales USING GIST(geometria);
+
+-- Puntos de los datos ya cargados
+INSERT INTO gloria.puntos_regionales (variable_nombre, geometria)
+SELECT DISTINCT va.variable_nombre, va.geometria
+FROM gloria.variables_ambientales va
+WHERE va.piscifactoria_id IS NULL
+ON CONFLICT DO NOTHING;
+
+ANALYZE gloria.puntos_regionales;
+
+COMMENT ON TABLE gloria.puntos_regionales IS
+'Puntos distintos con datos regionales por variable, para la búsqueda KNN de assign_official_data';
+
+-- Log de finalización
+DO $$
+BEGIN
+    RAISE NOTICE '✅ Puntos regionales configurados correctamente';
+END $$;
@@ -0,0 +1,48 @@
+-- ======================================================================
+-- Registro de refrescos de las vistas materializadas
+-- Las teselas vectoriales (app.vector_tiles) leen de las vistas, que solo
+-- cambian al refrescarse, y de gloria.piscifactorias; el ID del último
+-- registro sirve de ETag y de clave de la caché de teselas.
+-- ======================================================================
+
+CREATE TABLE IF NOT EXISTS gloria.refrescos_vistas (
+    id SERIAL PRIMARY KEY,
+    fecha_refresco TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP
+);
+
+-- Función de refresco (ver 03-wave-config.sql) que además registra el refresco
+CREATE OR REPLACE FUNCTION gloria.refresh_materialized_views()
+RETURNS void AS $$
+BEGIN
+    REFRESH MATERIALIZED VIEW CONCURRENTLY gloria.ultimas_lecturas;
+    REFRESH MATERIALIZED VIEW CONCURRENTLY gloria.estadisticas_diarias;
+    REFRESH MATERIALIZED VIEW CONCURRENTLY gloria.alertas_activas;
+    REFRESH MATERIALIZED VIEW CONCURRENTLY gloria.estadisticas_oleaje;
+    INSERT INTO gloria.refrescos_vistas DEFAULT VALUES;
+END;
+$$ LANGUAGE plpgsql;
+
+-- La capa de piscifactorías lee la tabla directamente: sus cambios también
+-- cuentan como refresco de las teselas
+CREATE OR REPLACE FUNCTION gloria.registrar_refresco_vistas()
+RETURNS TRIGGER AS $$
+BEGIN
+    INSERT INTO gloria.refrescos_vistas DEFAULT VALUES;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS piscifactorias_refresco_vistas ON gloria.piscifactorias;
+CREATE TRIGGER piscifactorias_refresco_vistas
+AFTER INSERT OR UPDATE OR DELETE ON gloria.piscifactorias
+FOR EACH STATEMENT
+EXECUTE FUNCTION gloria.registrar_refresco_vistas();
+
+COMMENT ON TABLE gloria.refrescos_vistas IS
+'Un registro por refresco de las vistas materializadas o cambio de piscifactorías (ETag de las teselas vectoriales)';
+
+-- Log de finalización
+DO $$
+BEGIN
+    RAISE NOTICE '✅ Registro de refrescos de vistas configurado correctamente';
+END $$;
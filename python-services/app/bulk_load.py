@@ -0,0 +1,225 @@
+"""
+Carga masiva en gloria.variables_ambientales mediante COPY binario.
+
+Las filas se codifican como un array estructurado de NumPy de tamaño fijo, de
+modo que un lote de millones de valores se serializa en una sola operación
+vectorizada. Los datos pasan por una tabla temporal y la geometría se construye
+en el servidor a partir de columnas float (o se toma de la piscifactoría).
+"""
+
+import io
+import struct
+import logging
+from datetime import timezone
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# Cabecera y fin de un COPY binario de PostgreSQL
+PGCOPY_HEADER = b'PGCOPY\n\xff\r\n\x00' + struct.pack('>ii', 0, 0)
+PGCOPY_TRAILER = struct.pack('>h', -1)
+
+# Época de PostgreSQL para timestamptz en formato binario
+PG_EPOCH = np.datetime64('2000-01-01T00:00:00', 'us')
+
+# Tamaño máximo de cada COPY (filas)
+COPY_BATCH_ROWS = 500000
+
+
+def to_pg_microseconds(times):
+    """Convertir instantes (datetime o datetime64) a microsegundos desde 2000-01-01 UTC."""
+    times = np.asarray(times)
+    if times.dtype == object:
+        times = np.array([
+            t.astimezone(timezone.utc).replace(tzinfo=None) if t.tzinfo else t
+            for t in times
+        ], dtype='datetime64[us]')
+    return (times.astype('datetime64[us]') - PG_EPOCH).astype(np.int64)
+
+
+def _row_dtype(variable_bytes):
+    """Estructura binaria de una fila de la tabla temporal de carga."""
+    return np.dtype([
+        ('n_fields', '>i2'),
+        ('len_dataset', '>i4'), ('dataset_id', '>i4'),
+        ('len_variable', '>i4'), ('variable', f'S{len(variable_bytes)}'),
+        ('len_fecha', '>i4'), ('fecha_tiempo', '>i8'),
+        ('len_valor', '>i4'), ('valor', '>f8'),
+        ('len_piscifactoria', '>i4'), ('piscifactoria_id', '>i4'),
+        ('len_lon', '>i4'), ('lon', '>f8'),
+        ('len_lat', '>i4'), ('lat', '>f8'),
+        ('len_profundidad', '>i4'), ('profundidad', '>f8'),
+        ('len_calidad', '>i4'), ('calidad', '>i4'),
+    ])
+
+
+def encode_rows(dataset_id, variable_nombre, microseconds, values, farm_ids=0,
+                lons=np.nan, lats=np.nan, depths=np.nan, calidad=90):
+    """
+    Codificar filas para la tabla temporal como un buffer COPY binario.
+
+    Todos los argumentos array se difunden (broadcast) a la longitud de `values`.
+    piscifactoria_id 0 y profundidad NaN se cargan como NULL.
+    """
+    values = np.asarray(values, dtype=np.float64)
+    variable_bytes = variable_nombre.encode('utf-8')
+    rows = np.empty(len(values), dtype=_row_dtype(variable_bytes))
+
+    rows['n_fields'] = 9
+    rows['len_dataset'] = 4
+    rows['dataset_id'] = dataset_id
+    rows['len_variable'] = len(variable_bytes)
+    rows['variable'] = variable_bytes
+    rows['len_fecha'] = 8
+    rows['fecha_tiempo'] = microseconds
+    rows['len_valor'] = 8
+    rows['valor'] = values
+    rows['len_piscifactoria'] = 4
+    rows['piscifactoria_id'] = farm_ids
+    rows['len_lon'] = 8
+    rows['lon'] = lons
+    rows['len_lat'] = 8
+    rows['lat'] = lats
+    rows['len_profundidad'] = 8
+    rows['profundidad'] = depths
+    rows['len_calidad'] = 4
+    rows['calidad'] = calidad
+
+    buffer = io.BytesIO()
+    buffer.write(PGCOPY_HEADER)
+    buffer.write(rows.tobytes())
+    buffer.write(PGCOPY_TRAILER)
+    buffer.seek(0)
+    return buffer
+
+
+def _create_staging(cursor):
+    """Crear (una vez por sesión) la tabla temporal de carga."""
+    cursor.execute("""
+        CREATE TEMP TABLE IF NOT EXISTS variables_ambientales_staging (
+            dataset_id INTEGER,
+            variable_nombre VARCHAR(50),
+            fecha_tiempo TIMESTAMP WITH TIME ZONE,
+            valor FLOAT,
+            piscifactoria_id INTEGER,
+            lon FLOAT,
+            lat FLOAT,
+            profundidad FLOAT,
+            calidad INTEGER
+        ) ON COMMIT DELETE ROWS
+    """)
+
+
+def _register_regional_points(cursor, variable_nombre, lons, lats):
+    """Añadir a gloria.puntos_regionales los puntos distintos de un lote regional."""
+    points = np.column_stack([lons, lats])
+    points = np.unique(points[np.isfinite(points).all(axis=1)], axis=0)
+    if len(points) == 0:
+        return
+    cursor.execute("""
+        INSERT INTO gloria.puntos_regionales (variable_nombre, geometria)
+        SELECT %s, ST_SetSRID(ST_MakePoint(s.lon, s.lat), 4326)
+        FROM unnest(%s::float8[], %s::float8[]) AS s(lon, lat)
+        ON CONFLICT DO NOTHING
+    """, (variable_nombre, points[:, 0].tolist(), points[:, 1].tolist()))
+
+
+def copy_variables_ambientales(conn, dataset_id, variable_nombre, times, values, farm_ids=0,
+                               lons=np.nan, lats=np.nan, depths=np.nan, calidad=90, replace=True):
+    """
+    Cargar un lote de valores en gloria.variables_ambientales con COPY binario.
+
+    - dataset_id: ID del dataset (escalar o por fila)
+    - times: datetime64 o datetime por fila (o microsegundos PG ya calculados, int64)
+    - farm_ids: ID de piscifactoría por fila (0 = valor regional). Si no se dan
+      lons/lats, la geometría se toma de la piscifactoría.
+    - replace: borrar antes las filas existentes con la misma
+      (dataset, variable, fecha, piscifactoría, profundidad), ya que la tabla no
+      tiene clave única. Con lons/lats no se borran las filas situadas en la
+      propia piscifactoría (series asignadas a partir de la malla).
+
+    Los puntos distintos de las filas regionales (con lons/lats y sin
+    piscifactoría) se registran en gloria.puntos_regionales.
+
+    Devuelve el número de filas insertadas.
+    """
+    values = np.asarray(values, dtype=np.float64)
+    times = np.asarray(times)
+    microseconds = times if times.dtype == np.int64 else to_pg_microseconds(times)
+
+    n_rows = len(values)
+    if n_rows == 0:
+        return 0
+
+    columns = np.broadcast_arrays(np.asarray(dataset_id), microseconds, values, np.asarray(farm_ids),
+                                  np.asarray(lons), np.asarray(lats), np.asarray(depths),
+                                  np.asarray(calidad))
+    dataset_id, microseconds, values, farm_ids, lons, lats, depths, calidad = columns
+    from_farm = bool(np.all(np.isnan(lons)))
+
+    cursor = conn.cursor()
+    _create_staging(cursor)
+
+    if replace:
+        # Un lote con coordenadas propias (malla) no reemplaza las series ya
+        # asignadas en la ubicación de la piscifactoría, que comparten la clave
+        keep_assigned = "" if from_farm else """
+            AND NOT EXISTS (
+                SELECT 1 FROM gloria.piscifactorias p
+                WHERE p.id = va.piscifactoria_id AND p.geometria ~= va.geometria
+            )"""
+        # Claves (dataset, fecha, piscifactoría, profundidad) del lote completo, no de cada COPY
+        keys = np.empty(n_rows, dtype=[('dataset_id', np.int64), ('microsegundos', np.int64),
+                                       ('piscifactoria_id', np.int64), ('profundidad', np.float64)])
+        keys['dataset_id'] = dataset_id
+        keys['microsegundos'] = microseconds
+        keys['piscifactoria_id'] = farm_ids
+        keys['profundidad'] = np.where(np.isnan(depths), -np.inf, depths)  # NaN no se agrupa en np.unique
+        keys = np.unique(keys)
+        cursor.execute("""
+            DELETE FROM gloria.variables_ambientales va
+            USING unnest(%s::int[], %s::bigint[], %s::int[], %s::float8[])
+                AS s(dataset_id, microsegundos, piscifactoria_id, profundidad)
+            WHERE va.dataset_id = s.dataset_id
+            AND va.variable_nombre = %s
+            AND va.fecha_tiempo = TIMESTAMPTZ '2000-01-01 00:00:00+00' + s.microsegundos * INTERVAL '1 microsecond'
+            AND va.piscifactoria_id IS NOT DISTINCT FROM NULLIF(s.piscifactoria_id, 0)
+            AND va.profundidad IS NOT DISTINCT FROM NULLIF(s.profundidad, '-Infinity')
+            {keep_assigned}
+        """.format(keep_assigned=keep_assigned), (keys['dataset_id'].tolist(), keys['microsegundos'].tolist(),
+              keys['piscifactoria_id'].tolist(), keys['profundidad'].tolist(), variable_nombre))
+
+    if from_farm:
+        geometry = "p.geometria"
+        join = "JOIN gloria.piscifactorias p ON p.id = s.piscifactoria_id"
+    else:
+        geometry = "ST_SetSRID(ST_MakePoint(s.lon, s.lat), 4326)"
+        join = ""
+
+    inserted = 0
+    for start in range(0, n_rows, COPY_BATCH_ROWS):
+        batch = slice(start, start + COPY_BATCH_ROWS)
+        buffer = encode_rows(dataset_id[batch], variable_nombre, microseconds[batch], values[batch],
+                             farm_ids[batch], lons[batch], lats[batch], depths[batch], calidad[batch])
+        cursor.copy_expert("COPY variables_ambientales_staging FROM STDIN WITH (FORMAT binary)", buffer)
+
+        cursor.execute(f"""
+            INSERT INTO gloria.variables_ambientales
+            (dataset_id, variable_nombre, fecha_tiempo, valor, piscifactoria_id, geometria, profundidad, calidad)
+            SELECT s.dataset_id, s.variable_nombre, s.fecha_tiempo, s.valor,
+                   NULLIF(s.piscifactoria_id, 0), {geometry},
+                   NULLIF(s.profundidad, 'NaN'), s.calidad
+            FROM variables_ambientales_staging s
+            {join}
+        """)
+        inserted += cursor.rowcount
+        conn.commit()
+
+    if not from_farm:
+        _register_regional_points(cursor, variable_nombre, lons[farm_ids == 0], lats[farm_ids == 0])
+        conn.commit()
+
+    cursor.close()
+    logger.info(f"Cargados {inserted} registros de {variable_nombre} mediante COPY")
+    return inserted
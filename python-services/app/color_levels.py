@@ -0,0 +1,63 @@
+"""
+Niveles y rampas de color de las variables que se muestran en el mapa.
+
+Los usan las capas JSON de la ingesta (color y nivel por punto) y las teselas
+PNG de app.tiles. Los umbrales y colores del oleaje son los de
+gloria.get_oleaje_color (databases/03-wave-config.sql).
+
+Cada definición tiene umbrales ascendentes y un color/nombre más que umbrales:
+el nivel de un valor es searchsorted(thresholds, valor, side='right').
+"""
+
+import numpy as np
+
+WAVE_LEVELS = {
+    'key': 'risk',
+    'thresholds': [1.0, 2.2, 4.0, 6.0],
+    'colors': ['green', 'yellow', 'orange', 'red', 'black'],
+    'names': ['bajo', 'moderado', 'alto', 'muy_alto', 'extremo'],
+}
+
+CURRENT_LEVELS = {
+    'key': 'level',
+    'thresholds': [0.1, 0.3, 0.5, 0.8, 1.2],
+    'colors': ['blue', 'cyan', 'green', 'yellow', 'orange', 'red'],
+    'names': ['muy_lenta', 'lenta', 'moderada', 'rapida', 'muy_rapida', 'extrema'],
+}
+
+TEMPERATURE_LEVELS = {
+    'key': 'level',
+    'thresholds': [12.0, 15.0, 18.0, 22.0, 26.0],
+    'colors': ['blue', 'cyan', 'green', 'yellow', 'orange', 'red'],
+    'names': ['muy_frio', 'frio', 'templado', 'calido', 'muy_calido', 'caliente'],
+}
+
+# Colores con nombre → hexadecimal (los de gloria.configuraciones, categoría 'visualizacion')
+COLOR_HEX = {
+    'blue': '#0000ff',
+    'cyan': '#00ffff',
+    'green': '#00ff00',
+    'yellow': '#ffff00',
+    'orange': '#ffa500',
+    'red': '#ff0000',
+    'black': '#000000',
+}
+
+
+def level_index(levels, values):
+    """Índice de nivel de cada valor (array del mismo tamaño)."""
+    return np.searchsorted(levels['thresholds'], values, side='right')
+
+
+def palette(levels):
+    """Paleta RGB (n_niveles × 3, uint8) de una definición de niveles."""
+    return np.array([[int(COLOR_HEX[name][i:i + 2], 16) for i in (1, 3, 5)]
+                     for name in levels['colors']], dtype=np.uint8)
+
+
+def legend(levels):
+    """Leyenda serializable: [{desde, hasta, color, nombre}] por nivel."""
+    bounds = [None] + list(levels['thresholds']) + [None]
+    return [{'desde': bounds[i], 'hasta': bounds[i + 1],
+             'color': COLOR_HEX[color], 'nombre': name}
+            for i, (color, name) in enumerate(zip(levels['colors'], levels['names']))]
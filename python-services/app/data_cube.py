@@ -0,0 +1,392 @@
+#!/usr/bin/env python3
+"""
+Cubo de datos local (tiempo, lat, lon) con lecturas mapeadas en memoria.
+
+Cada variable se guarda en su propio directorio:
+- valores.f32: bloque float32 contiguo de forma (n_tiempos, ny, nx), NaN en tierra
+- valores_2.f32, valores_4.f32, valores_8.f32: pirámide de resolución, el mismo
+  bloque reducido a 1/2, 1/4 y 1/8 con la media de cada bloque ignorando NaN
+- tiempos.i8: instantes en microsegundos desde 1970 (datetime64[us])
+- meta.json: coordenadas de la malla (y de cada nivel de la pirámide), unidades
+  y número de instantes confirmados
+
+Los archivos solo crecen por el final, así que las lecturas de un campo en un
+instante o de la serie de una celda son vistas sobre np.memmap servidas desde
+la caché de páginas del sistema, sin copias ni consultas a la base de datos.
+La pirámide se escribe junto con cada instante, así que las lecturas de
+campos a baja resolución (teselas de poco zoom) usan CubeVariable.best_level
+y leen solo 1/4, 1/16 o 1/64 de los datos. Los cubos creados antes de la
+pirámide la calculan para sus instantes al recibir el siguiente archivo.
+"""
+
+import os
+import sys
+import copy
+import json
+import logging
+import argparse
+from pathlib import Path
+
+import netCDF4 as nc
+import numpy as np
+
+from .metrics import cache_access
+
+logger = logging.getLogger(__name__)
+
+# Directorio del cubo
+CUBE_DIR = Path(os.getenv('DATA_CUBE_DIR', '../data/cube'))
+
+# Región cubierta por el cubo (incluye todas las piscifactorías del proyecto)
+CUBE_BBOX = {
+    'lon_min': -2.0,
+    'lon_max': 1.0,
+    'lat_min': 37.0,
+    'lat_max': 40.5
+}
+
+# Variables NetCDF que se incorporan al cubo
+CUBE_VARIABLES = ['VHM0', 'VMDR', 'VTM10', 'thetao', 'so', 'uo', 'vo', 'zos']
+
+VALUES_FILE = 'valores.f32'
+TIMES_FILE = 'tiempos.i8'
+META_FILE = 'meta.json'
+
+# Factores de reducción de la pirámide de resolución (además de la malla completa)
+PYRAMID_FACTORS = [2, 4, 8]
+
+# Valores por bloque al calcular la pirámide de instantes ya guardados
+SLAB_VALUES = 2000000
+
+
+class CubeVariable:
+    """Vista de solo lectura de una variable del cubo (o de un nivel de su pirámide)."""
+
+    def __init__(self, path):
+        self.path = Path(path)
+        with open(self.path / META_FILE, 'r') as f:
+            self.version = os.fstat(f.fileno()).st_mtime_ns
+            self.meta = json.load(f)
+
+        self.name = self.meta['variable']
+        self.units = self.meta.get('units')
+        self.factor = 1
+        self.factors = [1] + sorted(int(factor) for factor in self.meta.get('overviews', {}))
+        self._levels = {1: self}
+
+        n_times = self.meta['n_times']
+        if n_times == 0:
+            self.times = np.empty(0, dtype='datetime64[us]')
+        else:
+            self.times = np.memmap(self.path / TIMES_FILE, dtype='<i8', mode='r',
+                                   shape=(n_times,)).view('datetime64[us]')
+        self._open_values(self.meta['longitudes'], self.meta['latitudes'])
+        self.resolution = float(np.median(np.abs(np.diff(self.lons)))) if len(self.lons) > 1 else 0.0
+
+    def _open_values(self, lons, lats):
+        self.lons = np.asarray(lons, dtype=np.float64)
+        self.lats = np.asarray(lats, dtype=np.float64)
+        self.shape = (len(self.times), len(self.lats), len(self.lons))
+        if self.shape[0] == 0:
+            self.values = np.empty(self.shape, dtype=np.float32)
+        else:
+            self.values = np.memmap(self.path / _values_file(self.factor), dtype='<f4', mode='r',
+                                    shape=self.shape)
+
+    def level(self, factor):
+        """Vista del nivel de la pirámide reducido por `factor` (1 = malla completa)."""
+        if factor not in self._levels:
+            if factor not in self.factors:
+                raise KeyError(f"{self.name} no tiene nivel 1/{factor} en el cubo")
+            overview = self.meta['overviews'][str(factor)]
+            level = copy.copy(self)
+            level.factor = factor
+            level._open_values(overview['longitudes'], overview['latitudes'])
+            self._levels[factor] = level
+        return self._levels[factor]
+
+    def best_level(self, cell_size):
+        """Nivel más reducido cuya celda no supera `cell_size` grados de longitud."""
+        for factor in reversed(self.factors):
+            if self.resolution * factor <= cell_size:
+                return self.level(factor)
+        return self
+
+    def time_index(self, when):
+        """Índice del instante más reciente que no supera `when`."""
+        when = np.datetime64(when, 'us')
+        idx = int(np.searchsorted(self.times, when, side='right')) - 1
+        if idx < 0:
+            raise KeyError(f"No hay datos de {self.name} anteriores a {when}")
+        return idx
+
+    def bbox_slices(self, bbox=None):
+        """Convertir un bounding box (lon_min, lat_min, lon_max, lat_max) en slices de la malla."""
+        if bbox is None:
+            return slice(None), slice(None)
+        lon_min, lat_min, lon_max, lat_max = bbox
+        ix = np.where((self.lons >= lon_min) & (self.lons <= lon_max))[0]
+        iy = np.where((self.lats >= lat_min) & (self.lats <= lat_max))[0]
+        if len(ix) == 0 or len(iy) == 0:
+            return slice(0, 0), slice(0, 0)
+        return slice(iy[0], iy[-1] + 1), slice(ix[0], ix[-1] + 1)
+
+    def field(self, when, bbox=None, cell_size=None):
+        """
+        Campo de la variable en el instante `when` sobre el bbox. Con `cell_size`
+        (grados) se lee el nivel más reducido de la pirámide que no lo supera.
+        Devuelve (lons, lats, vista 2D).
+        """
+        if cell_size is not None:
+            return self.best_level(cell_size).field(when, bbox)
+        lat_slice, lon_slice = self.bbox_slices(bbox)
+        t_idx = self.time_index(when)
+        return self.lons[lon_slice], self.lats[lat_slice], self.values[t_idx, lat_slice, lon_slice]
+
+    def nearest_cell(self, lon, lat):
+        """Índices (iy, ix) de la celda más cercana a un punto."""
+        return int(np.abs(self.lats - lat).argmin()), int(np.abs(self.lons - lon).argmin())
+
+    def series(self, lon, lat, start=None, end=None):
+        """Serie temporal en la celda más cercana a (lon, lat). Devuelve (tiempos, valores)."""
+        iy, ix = self.nearest_cell(lon, lat)
+        t0 = 0 if start is None else int(np.searchsorted(self.times, np.datetime64(start, 'us')))
+        t1 = self.shape[0] if end is None else int(np.searchsorted(self.times, np.datetime64(end, 'us'), side='right'))
+        return self.times[t0:t1], self.values[t0:t1, iy, ix]
+
+
+class DataCube:
+    """Acceso al cubo de datos local. Reabre una variable cuando su meta.json cambia."""
+
+    def __init__(self, root=CUBE_DIR):
+        self.root = Path(root)
+        self._open = {}
+
+    def variables(self):
+        """Variables disponibles en el cubo."""
+        if not self.root.exists():
+            return []
+        return sorted(p.name for p in self.root.iterdir() if (p / META_FILE).exists())
+
+    def variable(self, name):
+        """Obtener la vista de una variable, o None si no está en el cubo."""
+        meta_path = self.root / name / META_FILE
+        if not meta_path.exists():
+            return None
+        mtime = meta_path.stat().st_mtime_ns
+        cached = self._open.get(name)
+        cache_access('cubo_variables', cached is not None and cached[0] == mtime)
+        if cached is None or cached[0] != mtime:
+            cached = (mtime, CubeVariable(self.root / name))
+            self._open[name] = cached
+        return cached[1]
+
+
+def _write_meta(path, meta):
+    """Escribir meta.json de forma atómica: los lectores nunca ven un estado intermedio."""
+    tmp_path = path / (META_FILE + '.tmp')
+    with open(tmp_path, 'w') as f:
+        json.dump(meta, f)
+    os.replace(tmp_path, path / META_FILE)
+
+
+def downsample(values, factor):
+    """
+    Reducir un bloque (..., ny, nx) por `factor` con la media de cada bloque
+    factor × factor ignorando NaN (NaN si todo el bloque lo es). Los bordes
+    incompletos se promedian con las celdas que tengan.
+    """
+    *lead, ny, nx = values.shape
+    pad_y, pad_x = -ny % factor, -nx % factor
+    if pad_y or pad_x:
+        values = np.pad(values, [(0, 0)] * len(lead) + [(0, pad_y), (0, pad_x)], constant_values=np.nan)
+    blocks = values.reshape(*lead, (ny + pad_y) // factor, factor, (nx + pad_x) // factor, factor)
+
+    finite = np.isfinite(blocks)
+    sums = np.where(finite, blocks, 0).sum(axis=(-3, -1), dtype=np.float64)
+    counts = finite.sum(axis=(-3, -1))
+    out = np.full(sums.shape, np.nan, dtype='<f4')
+    np.divide(sums, counts, out=out, where=counts > 0, casting='unsafe')
+    return out
+
+
+def _downsample_coords(coords, factor):
+    """Coordenadas de los centros de los bloques de un nivel de la pirámide."""
+    coords = np.asarray(coords, dtype=np.float64)
+    return downsample(coords[np.newaxis, :], factor)[0].astype(np.float64)
+
+
+def _overview_meta(lons, lats):
+    """Coordenadas de cada nivel reducido de la pirámide, para meta.json."""
+    return {
+        str(factor): {
+            'longitudes': _downsample_coords(lons, factor).tolist(),
+            'latitudes': _downsample_coords(lats, factor).tolist(),
+        }
+        for factor in PYRAMID_FACTORS
+    }
+
+
+def _values_file(factor):
+    return VALUES_FILE if factor == 1 else f"valores_{factor}.f32"
+
+
+def _build_overviews(path, n_times, ny, nx, chunk_values=SLAB_VALUES):
+    """Calcular los niveles reducidos de los instantes ya guardados (cubos anteriores a la pirámide)."""
+    stored = np.memmap(path / VALUES_FILE, dtype='<f4', mode='r', shape=(n_times, ny, nx))
+    chunk = max(1, chunk_values // (ny * nx))
+    for factor in PYRAMID_FACTORS:
+        with open(path / _values_file(factor), 'wb') as f:
+            for start in range(0, n_times, chunk):
+                f.write(downsample(stored[start:start + chunk], factor).tobytes())
+    del stored
+    logger.info(f"🧊 Pirámide de resolución calculada para {n_times} instantes de {path.name}")
+
+
+def append_variable(root, variable, times, lons, lats, values, units=None):
+    """
+    Añadir un bloque (T, ny, nx) de una variable al cubo, con sus niveles
+    reducidos de la pirámide (PYRAMID_FACTORS).
+
+    Los instantes ya presentes se sobrescriben en su sitio (p. ej. actualizaciones
+    de predicción) y los posteriores al último se añaden al final. Los instantes
+    intermedios que no existían se descartan. Devuelve el número de instantes escritos.
+    """
+    path = Path(root) / variable
+    path.mkdir(parents=True, exist_ok=True)
+
+    times = np.asarray(times, dtype='datetime64[us]')
+    values = np.ascontiguousarray(values, dtype='<f4')
+    order = np.argsort(times, kind='stable')
+    times, values = times[order], values[order]
+
+    if (path / META_FILE).exists():
+        with open(path / META_FILE, 'r') as f:
+            meta = json.load(f)
+        if (len(meta['longitudes']) != len(lons) or len(meta['latitudes']) != len(lats)
+                or not np.allclose(meta['longitudes'], lons) or not np.allclose(meta['latitudes'], lats)):
+            raise ValueError(f"La malla no coincide con la del cubo para {variable}")
+    else:
+        meta = {
+            'variable': variable,
+            'units': units,
+            'longitudes': np.asarray(lons, dtype=np.float64).tolist(),
+            'latitudes': np.asarray(lats, dtype=np.float64).tolist(),
+            'n_times': 0
+        }
+
+    n_times = meta['n_times']
+    ny, nx = len(lats), len(lons)
+
+    # Niveles de la pirámide: factor → (forma de un instante, bloque a escribir)
+    levels = {1: ((ny, nx), values)}
+    for factor in PYRAMID_FACTORS:
+        reduced = downsample(values, factor)
+        levels[factor] = (reduced.shape[1:], reduced)
+
+    # Descartar restos de una escritura interrumpida que no llegó a confirmarse
+    for file_name, item_bytes in ((VALUES_FILE, ny * nx * 4), (TIMES_FILE, 8)):
+        with open(path / file_name, 'ab') as f:
+            f.truncate(n_times * item_bytes)
+
+    if 'overviews' not in meta:
+        if n_times:
+            _build_overviews(path, n_times, ny, nx)
+        meta['overviews'] = _overview_meta(meta['longitudes'], meta['latitudes'])
+
+    for factor in PYRAMID_FACTORS:
+        (level_ny, level_nx), _ = levels[factor]
+        with open(path / _values_file(factor), 'ab') as f:
+            f.truncate(n_times * level_ny * level_nx * 4)
+
+    existing = np.fromfile(path / TIMES_FILE, dtype='<i8').view('datetime64[us]')
+    last = existing[-1] if n_times else None
+
+    # Sobrescribir instantes existentes
+    idx = np.searchsorted(existing, times)
+    in_range = idx < n_times
+    overwrite = np.zeros(len(times), dtype=bool)
+    overwrite[in_range] = existing[idx[in_range]] == times[in_range]
+    if overwrite.any():
+        for factor, (shape, block) in levels.items():
+            stored = np.memmap(path / _values_file(factor), dtype='<f4', mode='r+', shape=(n_times, *shape))
+            stored[idx[overwrite]] = block[overwrite]
+            stored.flush()
+            del stored
+
+    # Añadir instantes nuevos al final
+    newer = ~overwrite if last is None else (times > last)
+    newer_times, unique_idx = np.unique(times[newer], return_index=True)
+    if len(newer_times):
+        for factor, (_, block) in levels.items():
+            with open(path / _values_file(factor), 'ab') as f:
+                f.write(block[newer][unique_idx].tobytes())
+        with open(path / TIMES_FILE, 'ab') as f:
+            f.write(newer_times.astype('<i8').tobytes())
+
+    skipped = len(times) - int(overwrite.sum()) - int(newer.sum())
+    if skipped:
+        logger.warning(f"⚠️  {skipped} instantes de {variable} anteriores al final del cubo descartados")
+
+    meta['n_times'] = n_times + len(newer_times)
+    _write_meta(path, meta)
+    return int(overwrite.sum()) + len(newer_times)
+
+
+def cube_spec(ds, variables=CUBE_VARIABLES):
+    """
+    Especificación de ingesta (ver app.ingest) de las variables del cubo
+    presentes en un archivo abierto: malla completa dentro de CUBE_BBOX, sin
+    muestreo, solo el nivel de superficie y los valores tal cual (sin rango).
+    """
+    return {
+        'name': 'cubo',
+        'variables': [{
+            'target': name,
+            'aliases': [name],
+            'units': getattr(ds.variables[name], 'units', None),
+        } for name in variables if name in ds.variables],
+        'depth': 0,
+        'bbox': (CUBE_BBOX['lon_min'], CUBE_BBOX['lat_min'], CUBE_BBOX['lon_max'], CUBE_BBOX['lat_max']),
+        'stride': 1,
+    }
+
+
+def append_netcdf_to_cube(file_path, root=CUBE_DIR, variables=CUBE_VARIABLES):
+    """Incorporar al cubo las variables conocidas de un archivo NetCDF. Devuelve {variable: instantes}."""
+    # app.ingest importa este módulo (CubeSink)
+    from .ingest import CubeSink, ingest_file
+
+    with nc.Dataset(file_path, 'r') as ds:
+        spec = cube_spec(ds, variables)
+    if not spec['variables']:
+        return {}
+
+    try:
+        written = ingest_file(file_path, spec, [CubeSink(root)])['counts']
+    except ValueError as e:
+        logger.warning(f"⚠️  {Path(file_path).name} no se incorpora al cubo: {e}")
+        return {}
+
+    if written:
+        logger.info(f"🧊 Cubo actualizado con {Path(file_path).name}: {written}")
+    return written
+
+
+if __name__ == '__main__':
+    logging.basicConfig(
+        level=logging.INFO,
+        format='%(asctime)s - %(levelname)s - %(message)s'
+    )
+
+    parser = argparse.ArgumentParser(description="Incorporar archivos NetCDF al cubo de datos local")
+    parser.add_argument('files', nargs='+', help="Archivos NetCDF a incorporar, en orden temporal")
+    parser.add_argument('--cube-dir', default=str(CUBE_DIR), help="Directorio del cubo")
+    args = parser.parse_args()
+
+    for file_path in sorted(args.files):
+        try:
+            append_netcdf_to_cube(file_path, root=args.cube_dir)
+        except Exception as e:
+            logger.error(f"❌ Error incorporando {file_path} al cubo: {e}")
+            sys.exit(1)
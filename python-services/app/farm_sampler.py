@@ -0,0 +1,264 @@
+"""
+Interpolación bilineal de campos en malla en la ubicación de las piscifactorías.
+
+Los pesos de interpolación se calculan una vez por malla: para cada
+piscifactoría, las cuatro celdas que la rodean y sus pesos bilineales. Con
+ellos, la serie de todas las piscifactorías para todos los instantes sale de
+una sola multiplicación de matrices por variable, y se carga con un COPY.
+
+Los campos se leen de gloria.campos_grid, que solo se llena con
+GRID_STORAGE=true, y del cubo de datos local (app.data_cube), que se llena en
+cada importación: las variables que no están en gloria.campos_grid se
+interpolan desde el cubo, con el nombre de destino de app.ingest.INGEST_SPECS.
+"""
+
+import logging
+
+import numpy as np
+
+from .bulk_load import copy_variables_ambientales
+from .data_cube import CUBE_DIR, SLAB_VALUES, DataCube
+from .grid_storage import load_grid, read_fields
+from .ingest import INGEST_SPECS, _apply_range
+
+logger = logging.getLogger(__name__)
+
+
+def _axis_weights(coords, x):
+    """
+    Índices de las dos coordenadas que rodean cada x y fracción de interpolación.
+    Devuelve (i0, i1, fraccion, dentro) para un eje ascendente o descendente.
+    """
+    coords = np.asarray(coords, dtype=np.float64)
+    x = np.asarray(x, dtype=np.float64)
+    n = len(coords)
+
+    descending = n > 1 and coords[0] > coords[-1]
+    ascending_coords = coords[::-1] if descending else coords
+
+    i0 = np.clip(np.searchsorted(ascending_coords, x, side='right') - 1, 0, max(n - 2, 0))
+    i1 = np.minimum(i0 + 1, n - 1)
+    span = ascending_coords[i1] - ascending_coords[i0]
+    with np.errstate(invalid='ignore', divide='ignore'):
+        fraction = np.where(span > 0, (x - ascending_coords[i0]) / span, 0.0)
+    inside = (x >= ascending_coords[0]) & (x <= ascending_coords[-1])
+
+    if descending:
+        i0, i1 = n - 1 - i0, n - 1 - i1
+    return i0, i1, np.clip(fraction, 0.0, 1.0), inside
+
+
+class FarmSampler:
+    """Pesos de interpolación bilineal de una malla regular en un conjunto de puntos."""
+
+    def __init__(self, lons, lats, point_lons, point_lats):
+        self.nx = len(lons)
+        self.ny = len(lats)
+        n_points = len(point_lons)
+
+        ix0, ix1, fx, inside_x = _axis_weights(lons, point_lons)
+        iy0, iy1, fy, inside_y = _axis_weights(lats, point_lats)
+        self.inside = inside_x & inside_y
+
+        # Cuatro esquinas por punto: índice plano de la celda y peso bilineal
+        corners = np.stack([
+            iy0 * self.nx + ix0,
+            iy0 * self.nx + ix1,
+            iy1 * self.nx + ix0,
+            iy1 * self.nx + ix1,
+        ], axis=1)
+        weights = np.stack([
+            (1 - fy) * (1 - fx),
+            (1 - fy) * fx,
+            fy * (1 - fx),
+            fy * fx,
+        ], axis=1)
+        weights[~self.inside] = 0.0
+
+        # Solo las celdas usadas por algún punto: matriz de pesos (n_celdas, n_puntos)
+        self.cells, inverse = np.unique(corners, return_inverse=True)
+        self.weights = np.zeros((len(self.cells), n_points), dtype=np.float64)
+        point_idx = np.repeat(np.arange(n_points), 4)
+        np.add.at(self.weights, (inverse.ravel(), point_idx), weights.ravel())
+
+    def sample(self, values):
+        """
+        Interpolar un bloque (T, ny, nx) en los puntos. Devuelve (T, n_puntos).
+
+        Las celdas NaN (tierra) no cuentan y los pesos restantes se renormalizan;
+        los puntos fuera de la malla o rodeados de tierra quedan en NaN.
+        """
+        values = np.ma.filled(np.ma.asarray(values, dtype=np.float64), np.nan)
+        block = values.reshape(values.shape[0], self.ny * self.nx)[:, self.cells]
+
+        valid = np.isfinite(block)
+        numerator = np.where(valid, block, 0.0) @ self.weights
+        denominator = valid.astype(np.float64) @ self.weights
+
+        with np.errstate(invalid='ignore', divide='ignore'):
+            return np.where(denominator > 1e-9, numerator / denominator, np.nan)
+
+
+def get_farms(conn):
+    """Obtener (ids, lons, lats) de todas las piscifactorías."""
+    cursor = conn.cursor()
+    cursor.execute("""
+        SELECT id, ST_X(geometria), ST_Y(geometria)
+        FROM gloria.piscifactorias
+        ORDER BY id
+    """)
+    rows = cursor.fetchall()
+    cursor.close()
+
+    if not rows:
+        return np.empty(0, dtype=np.int32), np.empty(0), np.empty(0)
+    ids, lons, lats = zip(*rows)
+    return np.array(ids, dtype=np.int32), np.array(lons, dtype=np.float64), np.array(lats, dtype=np.float64)
+
+
+def get_grid_fields(conn, fecha_inicio=None):
+    """Combinaciones (dataset_id, variable, grid_id) con campos en gloria.campos_grid."""
+    cursor = conn.cursor()
+    cursor.execute("""
+        SELECT DISTINCT dataset_id, variable, grid_id
+        FROM gloria.campos_grid
+        WHERE %s::timestamptz IS NULL OR fecha_tiempo >= %s::timestamptz
+        ORDER BY dataset_id, variable, grid_id
+    """, (fecha_inicio, fecha_inicio))
+    fields = cursor.fetchall()
+    cursor.close()
+    return fields
+
+
+def get_cube_fields(conn, cube):
+    """
+    Variables del cubo con destino en la base de datos, según INGEST_SPECS.
+
+    Devuelve [(dataset_id, target, var_spec, nombres en el cubo)]; las
+    variables por componentes (p. ej. uo/vo) llevan un nombre por componente.
+    El dataset es el primero de gloria.datasets que declara esas variables.
+    """
+    available = set(cube.variables())
+    cursor = conn.cursor()
+    fields = []
+
+    for spec in INGEST_SPECS.values():
+        for var_spec in spec['variables']:
+            groups = var_spec.get('components') or [var_spec['aliases']]
+            names = [next((alias for alias in aliases if alias in available), None) for aliases in groups]
+            if None in names:
+                continue
+
+            cursor.execute("""
+                SELECT id FROM gloria.datasets
+                WHERE variables && %s::text[]
+                ORDER BY id
+                LIMIT 1
+            """, (names,))
+            row = cursor.fetchone()
+            if row is None:
+                logger.warning(f"⚠️  Ningún dataset declara {names}; no se asigna {var_spec['target']} desde el cubo")
+                continue
+            fields.append((row[0], var_spec['target'], var_spec, names))
+
+    cursor.close()
+    return fields
+
+
+def _sample_cube_field(cube, var_spec, names, sampler, fecha_inicio=None):
+    """
+    Interpolar en las piscifactorías los instantes del cubo desde `fecha_inicio`.
+    Devuelve (tiempos, serie (T, n_puntos)), leyendo el memmap por bloques.
+    """
+    components = [cube.variable(name) for name in names]
+    times = components[0].times
+    t0 = 0 if fecha_inicio is None else int(np.searchsorted(times, np.datetime64(fecha_inicio, 'us')))
+    if any(len(c.times) != len(times) or not np.array_equal(c.times[t0:], times[t0:]) for c in components[1:]):
+        logger.warning(f"⚠️  Las componentes {names} del cubo no tienen los mismos instantes")
+        return times[:0], np.empty((0, sampler.weights.shape[1]))
+
+    steps = max(1, SLAB_VALUES // max(sampler.ny * sampler.nx, 1))
+    blocks = []
+    for start in range(t0, len(times), steps):
+        values = [np.array(c.values[start:start + steps], dtype=np.float32) for c in components]
+        block = np.hypot(values[0], values[1]) if len(values) == 2 else values[0]
+        blocks.append(sampler.sample(_apply_range(block, var_spec)))
+
+    if not blocks:
+        return times[:0], np.empty((0, sampler.weights.shape[1]))
+    return np.asarray(times[t0:]), np.concatenate(blocks)
+
+
+def _load_series(conn, dataset_id, variable, times, series, farm_ids):
+    """Cargar las filas finitas de una serie (T, n_puntos) con COPY. Devuelve el número de filas."""
+    t_idx, f_idx = np.nonzero(np.isfinite(series))
+    if len(t_idx) == 0:
+        return 0
+    return copy_variables_ambientales(
+        conn, dataset_id, variable,
+        times=times[t_idx],
+        values=series[t_idx, f_idx],
+        farm_ids=farm_ids[f_idx]
+    )
+
+
+def assign_grid_fields_to_farms(conn, fecha_inicio=None, farms=None, cube_root=CUBE_DIR):
+    """
+    Generar las series de todas las piscifactorías a partir de los campos en malla.
+
+    Para cada (dataset, variable, malla) de gloria.campos_grid, y para cada
+    variable del cubo en `cube_root` que no esté allí, se interpolan todos los
+    instantes desde `fecha_inicio` con una multiplicación de matrices y se
+    cargan con un COPY, reemplazando los valores asignados previamente.
+    Devuelve el total de filas.
+    """
+    farm_ids, farm_lons, farm_lats = farms if farms is not None else get_farms(conn)
+    if len(farm_ids) == 0:
+        logger.warning("No hay piscifactorías a las que asignar datos")
+        return 0
+
+    samplers = {}
+    assigned = set()
+    total = 0
+
+    for dataset_id, variable, grid_id in get_grid_fields(conn, fecha_inicio):
+        if grid_id not in samplers:
+            lons, lats = load_grid(conn, grid_id)
+            samplers[grid_id] = FarmSampler(lons, lats, farm_lons, farm_lats)
+        sampler = samplers[grid_id]
+        assigned.add(variable)
+
+        times, values = read_fields(conn, dataset_id, variable, grid_id, fecha_inicio)
+        if len(times) == 0:
+            continue
+
+        count = _load_series(conn, dataset_id, variable, times, sampler.sample(values), farm_ids)
+        if count == 0:
+            logger.warning(f"Ninguna piscifactoría dentro de la malla {grid_id} para {variable}")
+            continue
+        total += count
+        logger.info(f"Interpolados {count} valores de {variable} en {int(sampler.inside.sum())} piscifactorías")
+
+    # Variables sin campos en la base de datos (GRID_STORAGE desactivado): desde el cubo
+    cube = DataCube(cube_root)
+    cube_fields = [field for field in get_cube_fields(conn, cube) if field[1] not in assigned]
+    for dataset_id, variable, var_spec, names in cube_fields:
+        grid = cube.variable(names[0])
+        sampler = FarmSampler(grid.lons, grid.lats, farm_lons, farm_lats)
+
+        times, series = _sample_cube_field(cube, var_spec, names, sampler, fecha_inicio)
+        if len(times) == 0:
+            continue
+
+        count = _load_series(conn, dataset_id, variable, times, series, farm_ids)
+        if count == 0:
+            logger.warning(f"Ninguna piscifactoría dentro del cubo para {variable}")
+            continue
+        total += count
+        assigned.add(variable)
+        logger.info(f"Interpolados {count} valores de {variable} (cubo) en {int(sampler.inside.sum())} piscifactorías")
+
+    if not assigned:
+        logger.warning(f"⚠️  No hay campos en malla: gloria.campos_grid está vacío (GRID_STORAGE=false) "
+                       f"y el cubo {cube_root} no tiene variables conocidas")
+    return total
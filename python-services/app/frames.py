@@ -0,0 +1,201 @@
+"""
+Secuencias de fotogramas binarias para animar oleaje y corrientes.
+
+GET /frames/{capa}?start=&end=&bbox=&format=&step=&cell_size= devuelve en una
+sola respuesta todos los instantes de un intervalo sobre un bbox, leídos del
+np.memmap del cubo:
+
+    b'GLFR' | longitud de la cabecera (uint32 LE) | cabecera JSON | fotogramas
+
+La cabecera (UTF-8, rellenada con espacios hasta múltiplo de 8) describe la
+capa, sus variables (canales: VHM0; uo y vo), 'tipo' (uint8 o float16),
+'forma' [instantes, canales, ny, nx], 'instantes' ISO 8601, 'longitudes',
+'latitudes' y 'bytes_fotograma'. Los fotogramas empiezan en el byte
+8 + longitud de la cabecera y van seguidos, cada uno con sus canales en orden
+y cada canal fila a fila (little endian):
+- float16: NaN en tierra o sin datos
+- uint8 (por defecto): valor = desplazamiento[c] + escala[c] × q, y q = 255 sin datos
+
+Admite peticiones Range (un intervalo de bytes), de modo que el cliente puede
+leer la cabecera y pedir los fotogramas por partes. Las respuestas generadas se
+guardan en una caché LRU por proceso con la versión del cubo en la clave.
+"""
+
+import os
+import json
+import struct
+import hashlib
+
+import numpy as np
+from fastapi import APIRouter, HTTPException, Request, Response
+
+from .tiles import TILE_LAYERS, TileCache, layer_variables, parse_time
+
+MAGIC = b'GLFR'
+
+# Valor cuantizado reservado para "sin datos"
+UINT8_NODATA = 255
+
+FORMATS = ('uint8', 'float16')
+
+# Duración por defecto de la animación si no se indica el inicio
+DEFAULT_HOURS = 72
+
+# Límite de fotogramas por respuesta (usar `step` para intervalos más largos)
+MAX_FRAMES = int(os.getenv('FRAMES_MAX_COUNT', '240'))
+
+FRAMES_CACHE_SIZE = int(os.getenv('FRAMES_CACHE_SIZE', '64'))
+FRAMES_MAX_AGE = int(os.getenv('FRAMES_MAX_AGE', '300'))
+
+router = APIRouter(prefix="/frames", tags=["frames"])
+
+frames_cache = TileCache(FRAMES_CACHE_SIZE, name='fotogramas')
+
+
+def parse_bbox(value):
+    """bbox 'lon_min,lat_min,lon_max,lat_max' de la petición, o None."""
+    if not value:
+        return None
+    try:
+        bbox = tuple(float(part) for part in value.split(','))
+    except ValueError:
+        bbox = ()
+    if len(bbox) != 4 or bbox[0] >= bbox[2] or bbox[1] >= bbox[3]:
+        raise HTTPException(status_code=400, detail=f"bbox no válido: {value}")
+    return bbox
+
+
+def quantize(block, nodata=UINT8_NODATA):
+    """Cuantizar un bloque float a uint8 con su escala y desplazamiento (NaN → nodata)."""
+    finite = np.isfinite(block)
+    if not finite.any():
+        return np.full(block.shape, nodata, dtype=np.uint8), 1.0, 0.0
+    low, high = float(block[finite].min()), float(block[finite].max())
+    scale = (high - low) / (nodata - 1) or 1.0
+    quantized = np.full(block.shape, nodata, dtype=np.uint8)
+    quantized[finite] = np.rint((block[finite] - low) / scale).astype(np.uint8)
+    return quantized, scale, low
+
+
+def encode_frames(layer, variables, times, t_indices, lat_slice, lon_slice, fmt):
+    """Cabecera y fotogramas de una secuencia. `t_indices`: índices (o -1) por variable e instante."""
+    lons = variables[0].lons[lon_slice]
+    lats = variables[0].lats[lat_slice]
+    shape = (len(times), len(variables), len(lats), len(lons))
+    dtype = np.uint8 if fmt == 'uint8' else np.dtype('<f2')
+    frames = np.empty(shape, dtype=dtype)
+    scales, offsets = [], []
+
+    for c, (variable, indices) in enumerate(zip(variables, t_indices)):
+        present = indices >= 0
+        block = np.full((len(times), len(lats), len(lons)), np.nan, dtype=np.float32)
+        if present.any():
+            block[present] = variable.values[indices[present], lat_slice, lon_slice]
+        if fmt == 'uint8':
+            frames[:, c], scale, offset = quantize(block)
+            scales.append(scale)
+            offsets.append(offset)
+        else:
+            frames[:, c] = block
+
+    header = {
+        'capa': layer,
+        'variables': [variable.name for variable in variables],
+        'unidades': TILE_LAYERS[layer]['units'],
+        'tipo': fmt,
+        'forma': list(shape),
+        'instantes': np.datetime_as_string(times, unit='s').tolist(),
+        'longitudes': lons.tolist(),
+        'latitudes': lats.tolist(),
+        'bytes_fotograma': int(np.prod(shape[1:])) * frames.itemsize,
+    }
+    if fmt == 'uint8':
+        header.update({'escala': scales, 'desplazamiento': offsets, 'sin_datos': UINT8_NODATA})
+
+    encoded = json.dumps(header).encode('utf-8')
+    encoded += b' ' * (-(len(MAGIC) + 4 + len(encoded)) % 8)
+    return MAGIC + struct.pack('<I', len(encoded)) + encoded + frames.tobytes()
+
+
+def parse_range(value, length):
+    """(inicio, fin inclusive) de una cabecera Range de un solo intervalo, o None para la respuesta completa."""
+    if not value or not value.startswith('bytes=') or ',' in value:
+        return None
+    start, _, end = value[len('bytes='):].strip().partition('-')
+    try:
+        if start:
+            first, last = int(start), int(end) if end else length - 1
+        else:
+            first, last = max(0, length - int(end)), length - 1
+    except ValueError:
+        return None
+    if first >= length or first > last:
+        raise HTTPException(status_code=416, detail="Intervalo no satisfacible",
+                            headers={'Content-Range': f'bytes */{length}'})
+    return first, min(last, length - 1)
+
+
+@router.get("/{layer}")
+def get_frames(layer: str, request: Request, start: str = None, end: str = None, bbox: str = None,
+               format: str = 'uint8', step: int = 1, cell_size: float = None):
+    """Secuencia binaria de fotogramas de una capa entre dos instantes."""
+    if format not in FORMATS:
+        raise HTTPException(status_code=400, detail=f"Formato no válido: {format}. Disponibles: {list(FORMATS)}")
+    if step < 1:
+        raise HTTPException(status_code=400, detail="step debe ser al menos 1")
+
+    _, variables = layer_variables(layer)
+    if cell_size is not None:
+        factor = min(variable.best_level(cell_size).factor for variable in variables)
+        variables = [variable.level(factor) for variable in variables]
+
+    reference = variables[0]
+    end_time = parse_time(end) if end else None
+    end_time = reference.times[-1] if end_time is None else end_time
+    start_time = parse_time(start) if start else None
+    if start_time is None:
+        start_time = end_time - np.timedelta64(DEFAULT_HOURS, 'h')
+    t0 = int(np.searchsorted(reference.times, start_time))
+    t1 = int(np.searchsorted(reference.times, end_time, side='right'))
+    times = np.asarray(reference.times[t0:t1:step])
+    if len(times) == 0:
+        raise HTTPException(status_code=404, detail=f"No hay datos de {layer} en el intervalo")
+    if len(times) > MAX_FRAMES:
+        raise HTTPException(status_code=400, detail=f"Demasiados fotogramas ({len(times)} > {MAX_FRAMES}): usar step")
+
+    lat_slice, lon_slice = reference.bbox_slices(parse_bbox(bbox))
+    if lat_slice == slice(0, 0):
+        raise HTTPException(status_code=404, detail="El bbox no cubre la malla del cubo")
+
+    key = (layer, tuple((variable.version, variable.factor) for variable in variables),
+           str(times[0]), str(times[-1]), step, lat_slice.start, lat_slice.stop,
+           lon_slice.start, lon_slice.stop, format)
+    payload = frames_cache.get(key)
+    if payload is None:
+        t_indices = []
+        for variable in variables:
+            indices = np.searchsorted(variable.times, times)
+            found = indices < variable.shape[0]
+            found[found] = variable.times[indices[found]] == times[found]
+            t_indices.append(np.where(found, indices, -1))
+        payload = encode_frames(layer, variables, times, t_indices, lat_slice, lon_slice, format)
+        frames_cache.put(key, payload)
+
+    etag = '"' + hashlib.sha1(repr(key).encode()).hexdigest() + '"'
+    headers = {
+        'ETag': etag,
+        'Accept-Ranges': 'bytes',
+        'Cache-Control': f'public, max-age={FRAMES_MAX_AGE}',
+    }
+    if etag in request.headers.get('if-none-match', ''):
+        return Response(status_code=304, headers=headers)
+
+    if_range = request.headers.get('if-range')
+    byte_range = parse_range(request.headers.get('range'), len(payload)) if if_range in (None, etag) else None
+    if byte_range is None:
+        return Response(content=payload, media_type='application/octet-stream', headers=headers)
+
+    first, last = byte_range
+    headers['Content-Range'] = f'bytes {first}-{last}/{len(payload)}'
+    return Response(content=payload[first:last + 1], status_code=206,
+                    media_type='application/octet-stream', headers=headers)
@@ -0,0 +1,249 @@
+"""
+Almacenamiento compacto de campos en malla en gloria.campos_grid.
+
+Cada instante de una variable se guarda como un único array float4 con todos
+los valores de la malla (orden fila-mayor lat, lon; NaN en tierra), y los
+vectores de coordenadas se guardan una sola vez en gloria.grids.
+
+La escritura y la lectura mueven bloques NumPy completos mediante COPY en
+formato binario, sin crear objetos Python por celda.
+"""
+
+import io
+import struct
+import hashlib
+import logging
+
+import numpy as np
+
+from .bulk_load import PGCOPY_HEADER, PGCOPY_TRAILER, PG_EPOCH, to_pg_microseconds
+
+logger = logging.getLogger(__name__)
+
+# OID del tipo float4 (elementos del array valores)
+FLOAT4_OID = 700
+
+# Elementos de un array binario: longitud (siempre 4) + valor float4
+_ARRAY_ELEMENT = np.dtype([('len', '>i4'), ('val', '>f4')])
+
+# Caché de mallas por id: los vectores de coordenadas nunca cambian
+_GRID_CACHE = {}
+
+
+def grid_fingerprint(lons, lats):
+    """Calcular la huella MD5 de los vectores de coordenadas de una malla."""
+    digest = hashlib.md5()
+    digest.update(np.ascontiguousarray(lons, dtype='<f8').tobytes())
+    digest.update(np.ascontiguousarray(lats, dtype='<f8').tobytes())
+    return digest.hexdigest()
+
+
+def get_or_create_grid(conn, lons, lats):
+    """Obtener o crear la malla con los vectores de coordenadas dados. Devuelve su ID."""
+    lons = np.asarray(lons, dtype=np.float64)
+    lats = np.asarray(lats, dtype=np.float64)
+    huella = grid_fingerprint(lons, lats)
+
+    cursor = conn.cursor()
+    cursor.execute("SELECT id FROM gloria.grids WHERE huella = %s", (huella,))
+    result = cursor.fetchone()
+
+    if result:
+        grid_id = result[0]
+    else:
+        cursor.execute("""
+            INSERT INTO gloria.grids (huella, nx, ny, longitudes, latitudes, bbox_geom)
+            VALUES (%s, %s, %s, %s, %s, ST_SetSRID(ST_MakeEnvelope(%s, %s, %s, %s), 4326))
+            ON CONFLICT (huella) DO UPDATE SET huella = EXCLUDED.huella
+            RETURNING id
+        """, (
+            huella, len(lons), len(lats), lons.tolist(), lats.tolist(),
+            float(lons.min()), float(lats.min()), float(lons.max()), float(lats.max())
+        ))
+        grid_id = cursor.fetchone()[0]
+        conn.commit()
+        logger.info(f"✅ Nueva malla registrada: {len(lats)}x{len(lons)} (ID: {grid_id})")
+
+    cursor.close()
+    _GRID_CACHE[grid_id] = (lons, lats)
+    return grid_id
+
+
+def load_grid(conn, grid_id):
+    """Obtener los vectores (lons, lats) de una malla."""
+    if grid_id not in _GRID_CACHE:
+        cursor = conn.cursor()
+        cursor.execute(
+            "SELECT longitudes, latitudes FROM gloria.grids WHERE id = %s",
+            (grid_id,)
+        )
+        result = cursor.fetchone()
+        cursor.close()
+        if not result:
+            raise ValueError(f"Malla no encontrada: {grid_id}")
+        _GRID_CACHE[grid_id] = (np.asarray(result[0], dtype=np.float64),
+                                np.asarray(result[1], dtype=np.float64))
+    return _GRID_CACHE[grid_id]
+
+
+def _encode_fields(dataset_id, variable, microseconds, grid_id, values):
+    """Codificar un bloque (T, ny, nx) como filas de un COPY binario de campos_grid."""
+    n_times = values.shape[0]
+    n_cells = int(np.prod(values.shape[1:]))
+
+    # Elementos de todos los arrays del bloque en una sola operación
+    elements = np.empty((n_times, n_cells), dtype=_ARRAY_ELEMENT)
+    elements['len'] = 4
+    elements['val'] = values.reshape(n_times, n_cells)
+
+    variable_bytes = variable.encode('utf-8')
+    row_prefix = (
+        struct.pack('>h', 5)
+        + struct.pack('>ii', 4, dataset_id)
+        + struct.pack('>i', len(variable_bytes)) + variable_bytes
+    )
+    array_header = (
+        struct.pack('>ii', 4, grid_id)
+        + struct.pack('>i', 20 + 8 * n_cells)
+        + struct.pack('>iiiii', 1, 0, FLOAT4_OID, n_cells, 1)
+    )
+
+    buffer = io.BytesIO()
+    buffer.write(PGCOPY_HEADER)
+    for t_idx in range(n_times):
+        buffer.write(row_prefix)
+        buffer.write(struct.pack('>iq', 8, int(microseconds[t_idx])))
+        buffer.write(array_header)
+        buffer.write(elements[t_idx].tobytes())
+    buffer.write(PGCOPY_TRAILER)
+    buffer.seek(0)
+    return buffer
+
+
+def write_fields(conn, dataset_id, variable, times, grid_id, values, batch_timesteps=24):
+    """
+    Guardar un bloque de campos (T, ny, nx) en gloria.campos_grid.
+
+    Los valores enmascarados se guardan como NaN. Los instantes ya existentes
+    para la misma malla se sobrescriben. Devuelve el número de campos escritos.
+    """
+    if np.ma.isMaskedArray(values):
+        values = values.astype(np.float32).filled(np.nan)
+    values = np.asarray(values, dtype=np.float32)
+    microseconds = to_pg_microseconds(times)
+
+    if values.shape[0] != len(microseconds):
+        raise ValueError("El número de instantes no coincide con el bloque de valores")
+
+    cursor = conn.cursor()
+    cursor.execute("""
+        CREATE TEMP TABLE IF NOT EXISTS campos_grid_staging
+        (LIKE gloria.campos_grid INCLUDING DEFAULTS) ON COMMIT DELETE ROWS
+    """)
+
+    written = 0
+    for start in range(0, values.shape[0], batch_timesteps):
+        end = start + batch_timesteps
+        buffer = _encode_fields(dataset_id, variable, microseconds[start:end],
+                                grid_id, values[start:end])
+        cursor.copy_expert("COPY campos_grid_staging FROM STDIN WITH (FORMAT binary)", buffer)
+        cursor.execute("""
+            INSERT INTO gloria.campos_grid (dataset_id, variable, fecha_tiempo, grid_id, valores)
+            SELECT dataset_id, variable, fecha_tiempo, grid_id, valores
+            FROM campos_grid_staging
+            ON CONFLICT (dataset_id, variable, fecha_tiempo, grid_id) DO UPDATE
+            SET valores = EXCLUDED.valores
+        """)
+        conn.commit()
+        written += values[start:end].shape[0]
+
+    cursor.close()
+    return written
+
+
+def _copy_out(conn, query, params):
+    """Ejecutar un COPY ... TO STDOUT binario y devolver el buffer resultante."""
+    cursor = conn.cursor()
+    sql = cursor.mogrify(query, params).decode('utf-8')
+    buffer = io.BytesIO()
+    cursor.copy_expert(f"COPY ({sql}) TO STDOUT WITH (FORMAT binary)", buffer)
+    cursor.close()
+    return buffer.getvalue()
+
+
+def _decode_fields(data):
+    """Decodificar filas (fecha_tiempo, valores) de un COPY binario."""
+    offset = len(PGCOPY_HEADER)
+    times = []
+    arrays = []
+
+    while True:
+        (n_fields,) = struct.unpack_from('>h', data, offset)
+        offset += 2
+        if n_fields == -1:
+            break
+
+        _, microseconds = struct.unpack_from('>iq', data, offset)
+        offset += 12
+
+        _, ndim, has_null, _, n_cells, _ = struct.unpack_from('>iiiiii', data, offset)
+        offset += 24
+        if ndim != 1 or has_null:
+            raise ValueError("Formato de array no soportado en campos_grid (se esperan NaN, no NULL)")
+
+        elements = np.frombuffer(data, dtype=_ARRAY_ELEMENT, count=n_cells, offset=offset)
+        arrays.append(elements['val'].astype(np.float32))
+        times.append(microseconds)
+        offset += 8 * n_cells
+
+    times = PG_EPOCH + np.asarray(times, dtype='timedelta64[us]')
+    return times, arrays
+
+
+def read_fields(conn, dataset_id, variable, grid_id, fecha_inicio=None, fecha_fin=None):
+    """
+    Leer los campos de una variable en una malla como un bloque (T, ny, nx).
+
+    Devuelve (times, values) con times en datetime64[us] (UTC).
+    """
+    lons, lats = load_grid(conn, grid_id)
+    data = _copy_out(conn, """
+        SELECT fecha_tiempo, valores
+        FROM gloria.campos_grid
+        WHERE dataset_id = %s AND variable = %s AND grid_id = %s
+        AND (%s::timestamptz IS NULL OR fecha_tiempo >= %s::timestamptz)
+        AND (%s::timestamptz IS NULL OR fecha_tiempo <= %s::timestamptz)
+        ORDER BY fecha_tiempo
+    """, (dataset_id, variable, grid_id, fecha_inicio, fecha_inicio, fecha_fin, fecha_fin))
+
+    times, arrays = _decode_fields(data)
+    if not arrays:
+        return times, np.empty((0, len(lats), len(lons)), dtype=np.float32)
+    return times, np.stack(arrays).reshape(len(arrays), len(lats), len(lons))
+
+
+def read_field(conn, dataset_id, variable, grid_id, fecha_tiempo):
+    """Leer el campo (ny, nx) de una variable en un instante, o None si no existe."""
+    _, values = read_fields(conn, dataset_id, variable, grid_id, fecha_tiempo, fecha_tiempo)
+    return values[0] if len(values) else None
+
+
+def read_cell_series(conn, dataset_id, variable, grid_id, iy, ix, fecha_inicio=None, fecha_fin=None):
+    """Leer la serie temporal de una celda (iy, ix) sin transferir el resto de la malla."""
+    lons, _ = load_grid(conn, grid_id)
+    cursor = conn.cursor()
+    cursor.execute("""
+        SELECT fecha_tiempo, valores[%s]
+        FROM gloria.campos_grid
+        WHERE dataset_id = %s AND variable = %s AND grid_id = %s
+        AND (%s::timestamptz IS NULL OR fecha_tiempo >= %s::timestamptz)
+        AND (%s::timestamptz IS NULL OR fecha_tiempo <= %s::timestamptz)
+        ORDER BY fecha_tiempo
+    """, (int(iy) * len(lons) + int(ix) + 1, dataset_id, variable, grid_id,
+          fecha_inicio, fecha_inicio, fecha_fin, fecha_fin))
+    rows = cursor.fetchall()
+    cursor.close()
+
+    times = [row[0] for row in rows]
+    values = np.array([np.nan if row[1] is None else row[1] for row in rows], dtype=np.float32)
+    return times, values
@@ -7,13 +7,17 @@ Procesa archivos de oleaje y temperatura desde la carpeta /data.
 import os
 import sys
 import logging
+import argparse
 from datetime import datetime
 from pathlib import Path
 import re
 import psycopg2
-from psycopg2.extras import execute_batch
-import netCDF4 as nc
-import numpy as np
+
+from .ingest import get_spec, ingest_file, PostgresSink
+from .data_cube import append_netcdf_to_cube
+from .metrics import export_batch_metrics
+from .query_profiler import connect_kwargs
+from .profiling import add_profile_arguments, profiler_from_args, profiled
 
 # Configuración de logging
 logging.basicConfig(
@@ -45,11 +49,14 @@ BBOX = {
     'lat_max': 40.5
 }
 
+# Guardar los campos completos en gloria.campos_grid en lugar de una fila por celda
+GRID_STORAGE = os.getenv('GRID_STORAGE', 'false').lower() == 'true'
+
 
 def connect_db():
     """Conectar a la base de datos PostgreSQL."""
     try:
-        conn = psycopg2.connect(**DB_CONFIG)
+        conn = psycopg2.connect(**DB_CONFIG, **connect_kwargs())
         logger.info("✅ Conexión exitosa a la base de datos")
         return conn
     except Exception as e:
@@ -145,117 +152,41 @@ def get_or_create_dataset(conn, data_type):
     return dataset_id
 
 
-def is_in_bbox(lon, lat):
-    """Verificar si un punto está dentro del bounding box de interés."""
-    return (BBOX['lon_min'] <= lon <= BBOX['lon_max'] and
-            BBOX['lat_min'] <= lat <= BBOX['lat_max'])
+def product_spec(product):
+    """
+    Especificación de ingesta (ver app.ingest) de un producto, recortada al
+    bounding box. Con GRID_STORAGE, sin muestreo.
+    """
+    spec = get_spec(product, bbox=(BBOX['lon_min'], BBOX['lat_min'], BBOX['lon_max'], BBOX['lat_max']))
+    if GRID_STORAGE:
+        # Los campos en malla se guardan completos, sin muestreo
+        spec['stride'] = 1
+    return spec
+
+
+def ingest_product(file_path, conn, dataset_id, product):
+    """
+    Ingerir un archivo con la especificación del producto (ver app.ingest):
+    recorte al bounding box, muestreo y filtrado vectorizados, y carga por COPY
+    (o en gloria.campos_grid si GRID_STORAGE está activo).
+    """
+    spec = product_spec(product)
+    sink = PostgresSink(conn, dataset_id, calidad=100, grid_storage=GRID_STORAGE)
+    result = ingest_file(file_path, spec, [sink])
+    return sum(result['counts'].values())
 
 
 def process_wave_file(file_path, conn, dataset_id):
     """
     Procesar archivo NetCDF de oleaje.
-    Variables principales: VHM0 (altura significativa de ola), VMDR (dirección), VTM10 (período)
+    Variable principal: VHM0 (altura significativa de ola)
     """
     logger.info(f"📊 Procesando archivo de oleaje: {file_path.name}")
 
     try:
-        ds = nc.Dataset(file_path, 'r')
-
-        # Obtener dimensiones y variables
-        times = ds.variables['time']
-        lons = ds.variables['longitude'][:]
-        lats = ds.variables['latitude'][:]
-
-        # Variable principal: altura significativa de ola
-        wave_height = ds.variables['VHM0']
-
-        # Obtener fecha/hora y convertir a datetime estándar de Python
-        time_units = times.units
-        time_values = times[:]
-        cftime_dates = nc.num2date(time_values, units=time_units)
-
-        # Convertir cftime a datetime estándar de Python
-        import datetime as dt
-        dates = []
-        for cftime_date in cftime_dates:
-            try:
-                # Convertir a datetime estándar
-                python_date = dt.datetime(
-                    cftime_date.year,
-                    cftime_date.month,
-                    cftime_date.day,
-                    cftime_date.hour,
-                    cftime_date.minute,
-                    cftime_date.second,
-                    tzinfo=dt.timezone.utc
-                )
-                dates.append(python_date)
-            except:
-                # Si falla, intentar sin microsegundos
-                python_date = dt.datetime(
-                    cftime_date.year,
-                    cftime_date.month,
-                    cftime_date.day,
-                    cftime_date.hour,
-                    cftime_date.minute,
-                    cftime_date.second,
-                    tzinfo=dt.timezone.utc
-                )
-                dates.append(python_date)
-
-        cursor = conn.cursor()
-        records_to_insert = []
-
-        # Procesar cada timestamp
-        for t_idx, date in enumerate(dates):
-            wave_data = wave_height[t_idx, :, :]
-
-            # Muestreo de datos (cada N puntos para reducir volumen)
-            # Para un área pequeña, tomamos más resolución
-            step = 2  # Tomar 1 de cada 2 puntos
-
-            for i in range(0, len(lats), step):
-                for j in range(0, len(lons), step):
-                    lon = float(lons[j])
-                    lat = float(lats[i])
-
-                    # Verificar si está en nuestra región de interés
-                    if not is_in_bbox(lon, lat):
-                        continue
-
-                    value = float(wave_data[i, j])
-
-                    # Filtrar valores inválidos
-                    if np.isnan(value) or np.isinf(value) or value < 0:
-                        continue
-
-                    records_to_insert.append((
-                        dataset_id,
-                        'oleaje_altura',  # variable_nombre
-                        date,             # fecha_tiempo
-                        value,            # valor (en metros)
-                        lon,              # longitud
-                        lat               # latitud
-                    ))
-
-        # Insertar en lotes
-        if records_to_insert:
-            logger.info(f"💾 Insertando {len(records_to_insert)} registros de oleaje...")
-
-            execute_batch(cursor, """
-                INSERT INTO gloria.variables_ambientales
-                (dataset_id, variable_nombre, fecha_tiempo, valor, geometria, profundidad, calidad)
-                VALUES (%s, %s, %s, %s, ST_SetSRID(ST_MakePoint(%s, %s), 4326), 0, 100)
-                ON CONFLICT (variable_nombre, fecha_tiempo, geometria) DO NOTHING
-            """, records_to_insert, page_size=1000)
-
-            conn.commit()
-            logger.info(f"✅ {len(records_to_insert)} registros de oleaje insertados")
-
-        cursor.close()
-        ds.close()
-
-        return len(records_to_insert)
+        records = ingest_product(file_path, conn, dataset_id, 'oleaje')
+        logger.info(f"✅ {records} registros de oleaje insertados")
+        return records
 
     except Exception as e:
         logger.error(f"❌ Error procesando archivo de oleaje {file_path.name}: {e}")
@@ -266,127 +197,14 @@ def process_wave_file(file_path, conn, dataset_id):
 def process_temperature_file(file_path, conn, dataset_id):
     """
     Procesar archivo NetCDF de temperatura superficial.
-    Variables principales: thetao (temperatura potencial)
+    Variable principal: thetao (temperatura potencial), capa superficial
     """
     logger.info(f"🌡️  Procesando archivo de temperatura: {file_path.name}")
 
     try:
-        ds = nc.Dataset(file_path, 'r')
-
-        # Obtener dimensiones y variables
-        times = ds.variables['time']
-
-        # Los nombres de coordenadas pueden variar
-        if 'longitude' in ds.variables:
-            lons = ds.variables['longitude'][:]
-            lats = ds.variables['latitude'][:]
-        elif 'lon' in ds.variables:
-            lons = ds.variables['lon'][:]
-            lats = ds.variables['lat'][:]
-        elif 'x' in ds.variables and 'y' in ds.variables:
-            lons = ds.variables['x'][:]
-            lats = ds.variables['y'][:]
-        else:
-            logger.error(f"No se encontraron coordenadas en el archivo {file_path.name}")
-            return 0
-
-        # Variable principal: temperatura (puede tener diferentes nombres)
-        if 'thetao' in ds.variables:
-            temp_var = ds.variables['thetao']
-        elif 'temperature' in ds.variables:
-            temp_var = ds.variables['temperature']
-        elif 'temp' in ds.variables:
-            temp_var = ds.variables['temp']
-        else:
-            logger.error(f"No se encontró variable de temperatura en {file_path.name}")
-            logger.error(f"Variables disponibles: {list(ds.variables.keys())}")
-            return 0
-
-        # Obtener fecha/hora y convertir a datetime estándar de Python
-        time_units = times.units
-        time_values = times[:]
-        cftime_dates = nc.num2date(time_values, units=time_units)
-
-        # Convertir cftime a datetime estándar de Python
-        import datetime as dt
-        dates = []
-        for cftime_date in cftime_dates:
-            try:
-                # Convertir a datetime estándar
-                python_date = dt.datetime(
-                    cftime_date.year,
-                    cftime_date.month,
-                    cftime_date.day,
-                    cftime_date.hour,
-                    cftime_date.minute,
-                    cftime_date.second,
-                    tzinfo=dt.timezone.utc
-                )
-                dates.append(python_date)
-            except:
-                # Si falla, usar valores por defecto
-                python_date = dt.datetime(
-                    cftime_date.year,
-                    cftime_date.month,
-                    cftime_date.day,
-                    0, 0, 0,
-                    tzinfo=dt.timezone.utc
-                )
-                dates.append(python_date)
-
-        cursor = conn.cursor()
-        records_to_insert = []
-
-        # Procesar cada timestamp
-        for t_idx, date in enumerate(dates):
-            # Tomar la capa superficial (profundidad 0)
-            temp_data = temp_var[t_idx, 0, :, :]  # [time, depth, lat, lon]
-
-            # Muestreo de datos
-            step = 2  # Tomar 1 de cada 2 puntos
-
-            for i in range(0, len(lats), step):
-                for j in range(0, len(lons), step):
-                    lon = float(lons[j])
-                    lat = float(lats[i])
-
-                    # Verificar si está en nuestra región de interés
-                    if not is_in_bbox(lon, lat):
-                        continue
-
-                    value = float(temp_data[i, j])
-
-                    # Filtrar valores inválidos
-                    if np.isnan(value) or np.isinf(value):
-                        continue
-
-                    records_to_insert.append((
-                        dataset_id,
-                        'temperatura_superficial',  # variable_nombre
-                        date,                        # fecha_tiempo
-                        value,                       # valor (en °C)
-                        lon,                         # longitud
-                        lat                          # latitud
-                    ))
-
-        # Insertar en lotes
-        if records_to_insert:
-            logger.info(f"💾 Insertando {len(records_to_insert)} registros de temperatura...")
-
-            execute_batch(cursor, """
-                INSERT INTO gloria.variables_ambientales
-                (dataset_id, variable_nombre, fecha_tiempo, valor, geometria, profundidad, calidad)
-                VALUES (%s, %s, %s, %s, ST_SetSRID(ST_MakePoint(%s, %s), 4326), 0, 100)
-                ON CONFLICT (variable_nombre, fecha_tiempo, geometria) DO NOTHING
-            """, records_to_insert, page_size=1000)
-
-            conn.commit()
-            logger.info(f"✅ {len(records_to_insert)} registros de temperatura insertados")
-
-        cursor.close()
-        ds.close()
-
-        return len(records_to_insert)
+        records = ingest_product(file_path, conn, dataset_id, 'temperatura')
+        logger.info(f"✅ {records} registros de temperatura insertados")
+        return records
 
     except Exception as e:
         logger.error(f"❌ Error procesando archivo de temperatura {file_path.name}: {e}")
@@ -394,8 +212,11 @@ def process_temperature_file(file_path, conn, dataset_id):
         return 0
 
 
-def import_netcdf_files():
-    """Función principal para importar todos los archivos NetCDF."""
+def import_netcdf_files(profiler=None):
+    """
+    Función principal para importar todos los archivos NetCDF. Con un
+    profiler (app.profiling.RunProfiler) se perfila cada archivo por separado.
+    """
     logger.info("🚀 Iniciando importación de datos NetCDF...")
     logger.info(f"📁 Directorio de datos: {DATA_DIR}")
 
@@ -423,42 +244,49 @@ def import_netcdf_files():
     # Procesar cada archivo
     for nc_file in nc_files:
         try:
-            # Parsear nombre del archivo
-            metadata = parse_filename(nc_file.name)
-            data_type = metadata['data_type']
-
-            if data_type == 'unknown':
-                logger.warning(f"⚠️  Tipo de datos desconocido para {nc_file.name}, omitiendo...")
-                continue
-
-            logger.info(f"\n{'='*60}")
-            logger.info(f"📄 Archivo: {nc_file.name}")
-            logger.info(f"📅 Fecha: {metadata['date']}")
-            logger.info(f"🏷️  Tipo: {data_type}")
-
-            # Obtener o crear dataset
-            dataset_id = get_or_create_dataset(conn, data_type)
-
-            if not dataset_id:
-                logger.error(f"❌ No se pudo obtener dataset_id para {data_type}")
-                failed_files += 1
-                continue
-
-            # Procesar según el tipo
-            if data_type == 'oleaje':
-                records = process_wave_file(nc_file, conn, dataset_id)
-            elif data_type == 'temperatura':
-                records = process_temperature_file(nc_file, conn, dataset_id)
-            else:
-                records = 0
-
-            if records > 0:
-                total_records += records
-                processed_files += 1
-                logger.info(f"✅ Archivo procesado exitosamente: {records} registros")
-            else:
-                failed_files += 1
-                logger.warning(f"⚠️  No se insertaron registros para {nc_file.name}")
+            with profiled(profiler, nc_file.name):
+                # Parsear nombre del archivo
+                metadata = parse_filename(nc_file.name)
+                data_type = metadata['data_type']
+
+                if data_type == 'unknown':
+                    logger.warning(f"⚠️  Tipo de datos desconocido para {nc_file.name}, omitiendo...")
+                    continue
+
+                logger.info(f"\n{'='*60}")
+                logger.info(f"📄 Archivo: {nc_file.name}")
+                logger.info(f"📅 Fecha: {metadata['date']}")
+                logger.info(f"🏷️  Tipo: {data_type}")
+
+                # Obtener o crear dataset
+                dataset_id = get_or_create_dataset(conn, data_type)
+
+                if not dataset_id:
+                    logger.error(f"❌ No se pudo obtener dataset_id para {data_type}")
+                    failed_files += 1
+                    continue
+
+                # Procesar según el tipo
+                if data_type == 'oleaje':
+                    records = process_wave_file(nc_file, conn, dataset_id)
+                elif data_type == 'temperatura':
+                    records = process_temperature_file(nc_file, conn, dataset_id)
+                else:
+                    records = 0
+
+                if records > 0:
+                    total_records += records
+                    processed_files += 1
+                    logger.info(f"✅ Archivo procesado exitosamente: {records} registros")
+                else:
+                    failed_files += 1
+                    logger.warning(f"⚠️  No se insertaron registros para {nc_file.name}")
+
+                # Incorporar el archivo al cubo de datos local
+                try:
+                    append_netcdf_to_cube(nc_file)
+                except Exception as e:
+                    logger.warning(f"⚠️  No se pudo actualizar el cubo con {nc_file.name}: {e}")
 
         except Exception as e:
             logger.error(f"❌ Error procesando {nc_file.name}: {e}")
@@ -488,6 +316,15 @@ def import_netcdf_files():
     logger.info(f"💾 Total de registros insertados: {total_records}")
     logger.info("="*60)
 
+    if profiler is not None:
+        profiler.log_report()
+
+    export_batch_metrics('import_netcdf_data')
+
 
 if __name__ == '__main__':
-    import_netcdf_files()
+    parser = argparse.ArgumentParser(description="Importar los archivos NetCDF de oleaje y temperatura")
+    add_profile_arguments(parser)
+    args = parser.parse_args()
+
+    import_netcdf_files(profiler_from_args(args, 'import_netcdf_data'))
@@ -0,0 +1,537 @@
+"""
+Motor de ingesta de archivos NetCDF configurado por especificación de producto.
+
+Cada producto (oleaje, temperatura, corrientes, salinidad...) se describe con
+un diccionario de INGEST_SPECS:
+
+- variables: lista de variables a extraer, cada una con
+    - target: nombre de destino (variable_nombre en la base de datos)
+    - aliases: nombres posibles de la variable en el archivo, o
+      components: lista de alias por componente (se usa el módulo, p. ej. uo/vo)
+    - valid_range: (mínimo, máximo) válidos; None en un extremo = sin límite
+    - kelvin: convertir a °C los valores que parezcan Kelvin (> 200)
+    - units, levels, decimals: presentación en las capas JSON (niveles de app.color_levels)
+- depth: profundidad(es) en metros a extraer (nivel más cercano); None = todas
+- bbox: (lon_min, lat_min, lon_max, lat_max) o None para la malla completa
+- stride: paso de muestreo espacial, o 'auto' para no superar max_points
+- max_timesteps: limitar el número de instantes leídos (None = todos)
+- name: nombre del producto en las métricas (lo añade get_spec)
+
+El motor lee cada variable por bloques de instantes completos (tamaño acotado
+por slab_values), enmascara valores de relleno y fuera de rango una sola vez
+por bloque y entrega cada bloque a uno o varios destinos (sinks): carga masiva
+en PostgreSQL, Parquet, capa JSON para el frontend o cubo de datos local. El
+cubo usa su propia especificación (app.data_cube.cube_spec): malla completa
+dentro de CUBE_BBOX, sin muestreo y solo el nivel de superficie.
+"""
+
+import os
+import json
+import copy
+import time
+import logging
+from pathlib import Path
+from datetime import datetime
+
+import netCDF4 as nc
+import numpy as np
+
+from .bulk_load import copy_variables_ambientales
+from .grid_storage import get_or_create_grid, write_fields
+from .data_cube import CUBE_DIR, append_variable
+from .time_axis import read_time_axis
+from .metrics import record_rows, cache_access
+from .color_levels import WAVE_LEVELS, CURRENT_LEVELS, TEMPERATURE_LEVELS, level_index
+
+logger = logging.getLogger(__name__)
+
+# Valores por bloque de lectura (tiempo × lat × lon); limita la memoria
+SLAB_VALUES = int(os.getenv('INGEST_SLAB_VALUES', '2000000'))
+
+# Nombres posibles de las coordenadas
+COORDINATE_ALIASES = {
+    'lon': ['longitude', 'lon', 'x'],
+    'lat': ['latitude', 'lat', 'y'],
+    'time': ['time', 't'],
+    'depth': ['depth', 'deptht', 'level'],
+}
+
+# Región de interés (costa de Valencia/Murcia/Alicante)
+INTEREST_BBOX = (-1.5, 37.5, 0.7, 40.5)
+
+INGEST_SPECS = {
+    'oleaje': {
+        'variables': [{
+            'target': 'oleaje_altura',
+            'aliases': ['VHM0', 'swh', 'hs', 'wave_height'],
+            'valid_range': (0, 20),
+            'units': 'm',
+            'levels': WAVE_LEVELS,
+            'decimals': 2,
+        }],
+        'depth': None,
+        'bbox': INTEREST_BBOX,
+        'stride': 2,
+    },
+    'temperatura': {
+        'variables': [{
+            'target': 'temperatura_superficial',
+            'aliases': ['thetao', 'temperature', 'temp', 'bottomT'],
+            'valid_range': (-10, 40),
+            'kelvin': True,
+            'units': '°C',
+            'levels': TEMPERATURE_LEVELS,
+            'decimals': 2,
+        }],
+        'depth': 0,
+        'bbox': INTEREST_BBOX,
+        'stride': 2,
+    },
+    'corrientes': {
+        'variables': [{
+            'target': 'corriente',
+            'components': [['uo'], ['vo']],
+            'valid_range': (0, 5),
+            'units': 'm/s',
+            'levels': CURRENT_LEVELS,
+            'decimals': 3,
+        }],
+        'depth': 0,
+        'bbox': INTEREST_BBOX,
+        'stride': 1,
+    },
+    'salinidad': {
+        'variables': [{
+            'target': 'salinidad',
+            'aliases': ['so'],
+            'valid_range': (0, 50),
+            'units': 'PSU',
+            'decimals': 2,
+        }],
+        'depth': 0,
+        'bbox': None,
+        'stride': 1,
+    },
+}
+
+
+def get_spec(name, **overrides):
+    """
+    Copia de la especificación de un producto con cambios a nivel de dataset.
+    `target` renombra el destino de todas sus variables.
+    """
+    spec = copy.deepcopy(INGEST_SPECS[name])
+    spec['name'] = name
+    target = overrides.pop('target', None)
+    spec.update(overrides)
+    if target is not None:
+        for var_spec in spec['variables']:
+            var_spec['target'] = target
+    return spec
+
+
+def find_variable(ds, aliases):
+    """Nombre de la primera variable presente en el archivo entre los alias dados."""
+    lowered = {name.lower(): name for name in ds.variables}
+    for alias in aliases:
+        if alias in ds.variables:
+            return alias
+        if alias.lower() in lowered:
+            return lowered[alias.lower()]
+    return None
+
+
+def select_depth_levels(depths, requested=None):
+    """Índices de los niveles de profundidad más cercanos a los pedidos (todos si no se piden)."""
+    if requested is None:
+        return np.arange(len(depths))
+    requested = np.atleast_1d(np.asarray(requested, dtype=np.float64))
+    nearest = np.abs(np.asarray(depths)[:, None] - requested[None, :]).argmin(axis=0)
+    return np.unique(nearest)
+
+
+def _bbox_slice(coords, low, high, stride):
+    """Slice (con paso) de las coordenadas dentro de [low, high]."""
+    idx = np.where((coords >= low) & (coords <= high))[0]
+    if len(idx) == 0:
+        return None
+    return slice(idx[0], idx[-1] + 1, stride)
+
+
+class Slab:
+    """Bloque (T, ny, nx) de una variable ya recortado, muestreado y filtrado (NaN = no válido)."""
+
+    def __init__(self, var_spec, source, times, lons, lats, depth, values, components=None):
+        self.spec = var_spec
+        self.target = var_spec['target']
+        self.source = source
+        self.units = var_spec.get('units')
+        self.times = times
+        self.lons = lons
+        self.lats = lats
+        self.depth = depth
+        self.values = values
+        self.components = components or {}
+
+    def points(self):
+        """
+        Índices de los valores válidos: (t_idx, iy, ix). Las columnas de un punto
+        son times[t_idx], lats[iy], lons[ix] y values[t_idx, iy, ix].
+        """
+        nx = len(self.lons)
+        t_idx, flat = np.nonzero(np.isfinite(self.values.reshape(len(self.times), -1)))
+        return t_idx, flat // nx, flat % nx
+
+
+class FileGrid:
+    """Coordenadas de un archivo y su recorte según la especificación."""
+
+    def __init__(self, ds, spec):
+        lon_name = find_variable(ds, COORDINATE_ALIASES['lon'])
+        lat_name = find_variable(ds, COORDINATE_ALIASES['lat'])
+        time_name = find_variable(ds, COORDINATE_ALIASES['time'])
+        if not (lon_name and lat_name and time_name):
+            raise ValueError("No se pudieron identificar las coordenadas (lon, lat, tiempo)")
+
+        self.all_lons = np.asarray(ds.variables[lon_name][:], dtype=np.float64)
+        self.all_lats = np.asarray(ds.variables[lat_name][:], dtype=np.float64)
+        self.times = read_time_axis(ds.variables[time_name])
+        if spec.get('max_timesteps'):
+            self.times = self.times[:spec['max_timesteps']]
+
+        depth_name = find_variable(ds, COORDINATE_ALIASES['depth'])
+        self.depths = np.asarray(ds.variables[depth_name][:], dtype=np.float64) if depth_name else None
+
+        stride = spec.get('stride') or 1
+        if stride == 'auto':
+            n_depths = len(self.depths) if self.depths is not None and spec.get('depth') is None else 1
+            total = len(self.times) * len(self.all_lats) * len(self.all_lons) * n_depths
+            stride = max(1, int(np.sqrt(total / spec.get('max_points', 100000))))
+
+        bbox = spec.get('bbox')
+        if bbox is None:
+            self.lon_slice = slice(None, None, stride)
+            self.lat_slice = slice(None, None, stride)
+        else:
+            lon_min, lat_min, lon_max, lat_max = bbox
+            self.lon_slice = _bbox_slice(self.all_lons, lon_min, lon_max, stride)
+            self.lat_slice = _bbox_slice(self.all_lats, lat_min, lat_max, stride)
+
+        self.empty = self.lon_slice is None or self.lat_slice is None
+        self.stride = stride
+        if not self.empty:
+            self.lons = self.all_lons[self.lon_slice]
+            self.lats = self.all_lats[self.lat_slice]
+
+    def depth_levels(self, var, requested):
+        """Índices de profundidad a leer de `var` (None si no tiene eje de profundidad)."""
+        if var.ndim != 4:
+            return [None]
+        depths = self.depths if self.depths is not None else np.arange(var.shape[1], dtype=np.float64)
+        return [int(i) for i in select_depth_levels(depths, requested)]
+
+    def depth_value(self, d_idx):
+        if d_idx is None or self.depths is None:
+            return np.nan
+        return float(self.depths[d_idx])
+
+
+def _read_block(var, t0, t1, d_idx, grid):
+    """Leer un bloque (T, ny, nx) como float32 con NaN en los valores de relleno."""
+    if d_idx is None:
+        block = var[t0:t1, grid.lat_slice, grid.lon_slice]
+    else:
+        block = var[t0:t1, d_idx, grid.lat_slice, grid.lon_slice]
+    return np.ma.filled(np.ma.asarray(block, dtype=np.float32), np.nan)
+
+
+def _apply_range(values, var_spec):
+    """Convertir Kelvin si procede y dejar en NaN los valores fuera del rango válido."""
+    if var_spec.get('kelvin'):
+        values = np.where(values > 200, values - np.float32(273.15), values)
+    low, high = var_spec.get('valid_range') or (None, None)
+    with np.errstate(invalid='ignore'):
+        if low is not None:
+            values[values < low] = np.nan
+        if high is not None:
+            values[values > high] = np.nan
+    values[~np.isfinite(values)] = np.nan
+    return values
+
+
+def iter_slabs(ds, spec, slab_values=SLAB_VALUES):
+    """Recorrer un archivo abierto en bloques de instantes completos según la especificación."""
+    grid = FileGrid(ds, spec)
+    if grid.empty:
+        logger.warning("⚠️  La malla no intersecta con el bounding box de interés")
+        return
+
+    frame_size = max(len(grid.lats) * len(grid.lons), 1)
+    slab_steps = max(1, slab_values // frame_size)
+    n_times = len(grid.times)
+
+    for var_spec in spec['variables']:
+        if 'components' in var_spec:
+            sources = [find_variable(ds, aliases) for aliases in var_spec['components']]
+        else:
+            sources = [find_variable(ds, var_spec['aliases'])]
+        if not all(sources):
+            logger.warning(f"⚠️  Variable {var_spec['target']} no encontrada en el archivo")
+            continue
+
+        variables = [ds.variables[name] for name in sources]
+        if variables[0].ndim not in (3, 4):
+            logger.warning(f"⚠️  {sources[0]} no tiene forma (tiempo, [profundidad,] lat, lon)")
+            continue
+
+        for d_idx in grid.depth_levels(variables[0], spec.get('depth')):
+            for t0 in range(0, n_times, slab_steps):
+                t1 = min(t0 + slab_steps, n_times)
+                blocks = [_read_block(var, t0, t1, d_idx, grid) for var in variables]
+
+                if len(blocks) > 1:
+                    values = np.sqrt(sum(block * block for block in blocks))
+                    components = dict(zip(sources, blocks))
+                else:
+                    values = blocks[0]
+                    components = None
+
+                yield Slab(var_spec, sources[0] if len(sources) == 1 else var_spec['target'],
+                           grid.times[t0:t1], grid.lons, grid.lats, grid.depth_value(d_idx),
+                           _apply_range(values, var_spec), components)
+
+
+def ingest_file(file_path, spec, sinks, slab_values=SLAB_VALUES):
+    """
+    Ingerir un archivo NetCDF en los destinos dados.
+
+    Devuelve {'counts': {target: filas escritas por el primer destino},
+    'start': primer instante, 'end': último instante}. Registra en las métricas
+    las filas y el tiempo de lectura (extract) y de escritura (load) del producto.
+    """
+    counts = {}
+    start = end = None
+    extracted = 0
+    read_seconds = write_seconds = 0.0
+    with nc.Dataset(file_path, 'r') as ds:
+        slabs = iter_slabs(ds, spec, slab_values)
+        while True:
+            clock = time.perf_counter()
+            slab = next(slabs, None)
+            read_seconds += time.perf_counter() - clock
+            if slab is None:
+                break
+            extracted += int(np.count_nonzero(np.isfinite(slab.values)))
+
+            clock = time.perf_counter()
+            written = [sink.write(slab) for sink in sinks]
+            write_seconds += time.perf_counter() - clock
+
+            counts[slab.target] = counts.get(slab.target, 0) + (written[0] if written else 0)
+            if len(slab.times):
+                start = slab.times[0] if start is None else min(start, slab.times[0])
+                end = slab.times[-1] if end is None else max(end, slab.times[-1])
+
+    dataset = spec.get('name', 'generico')
+    record_rows('extract', dataset, extracted, read_seconds)
+    record_rows('load', dataset, sum(counts.values()), write_seconds)
+    return {'counts': counts, 'start': start, 'end': end}
+
+
+class PostgresSink:
+    """
+    Carga masiva en PostgreSQL.
+
+    Por defecto, una fila por valor válido en gloria.variables_ambientales (COPY
+    binario, geometría construida en el servidor). Con grid_storage, un registro
+    por instante en gloria.campos_grid. `farm_lookup(lats, lons)` devuelve
+    {(lat, lon): id de piscifactoría o None} para los puntos de la malla.
+    """
+
+    def __init__(self, conn, dataset_id, farm_lookup=None, calidad=90, grid_storage=False):
+        self.conn = conn
+        self.dataset_id = dataset_id
+        self.farm_lookup = farm_lookup
+        self.calidad = calidad
+        self.grid_storage = grid_storage
+        self._farm_grids = {}
+
+    def _farm_grid(self, lats, lons):
+        """ID de piscifactoría (0 = ninguna) de cada celda, calculado una vez por malla."""
+        key = (lats.tobytes(), lons.tobytes())
+        cache_access('malla_piscifactorias', key in self._farm_grids)
+        if key not in self._farm_grids:
+            farm_by_point = self.farm_lookup(lats, lons)
+            self._farm_grids[key] = np.array([
+                [farm_by_point.get((float(lat), float(lon))) or 0 for lon in lons]
+                for lat in lats
+            ], dtype=np.int32)
+        return self._farm_grids[key]
+
+    def write(self, slab):
+        if self.grid_storage:
+            grid_id = get_or_create_grid(self.conn, slab.lons, slab.lats)
+            write_fields(self.conn, self.dataset_id, slab.target, slab.times, grid_id, slab.values)
+            return int(np.isfinite(slab.values).sum())
+
+        t_idx, iy, ix = slab.points()
+        if len(t_idx) == 0:
+            return 0
+        farm_ids = self._farm_grid(slab.lats, slab.lons)[iy, ix] if self.farm_lookup else 0
+        return copy_variables_ambientales(
+            self.conn, self.dataset_id, slab.target,
+            times=slab.times[t_idx],
+            values=slab.values[t_idx, iy, ix],
+            farm_ids=farm_ids,
+            lons=slab.lons[ix],
+            lats=slab.lats[iy],
+            depths=slab.depth,
+            calidad=self.calidad
+        )
+
+    def close(self):
+        pass
+
+
+class ParquetSink:
+    """Archivo Parquet en formato largo: variable, fecha_tiempo, lon, lat, profundidad, valor."""
+
+    def __init__(self, path):
+        import pyarrow  # Dependencia opcional, solo para este destino
+        import pyarrow.parquet
+        self._pa = pyarrow
+        self._pq = pyarrow.parquet
+        self.path = Path(path)
+        self._writer = None
+
+    def write(self, slab):
+        t_idx, iy, ix = slab.points()
+        if len(t_idx) == 0:
+            return 0
+        pa = self._pa
+        table = pa.table({
+            'variable': pa.array([slab.target] * len(t_idx), type=pa.string()),
+            'fecha_tiempo': pa.array(slab.times[t_idx], type=pa.timestamp('us')),
+            'lon': slab.lons[ix],
+            'lat': slab.lats[iy],
+            'profundidad': np.full(len(t_idx), slab.depth),
+            'valor': slab.values[t_idx, iy, ix].astype(np.float64),
+        })
+        if self._writer is None:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            self._writer = self._pq.ParquetWriter(self.path, table.schema)
+        self._writer.write_table(table)
+        return len(t_idx)
+
+    def close(self):
+        if self._writer is not None:
+            self._writer.close()
+            self._writer = None
+
+
+def layer_statistics(values):
+    """Estadísticas descriptivas de los valores de una capa JSON."""
+    values = np.asarray(values, dtype=np.float64)
+    if len(values) == 0:
+        return {}
+    return {
+        'count': int(len(values)),
+        'min': round(float(values.min()), 2),
+        'max': round(float(values.max()), 2),
+        'mean': round(float(values.mean()), 2),
+        'median': round(float(np.median(values)), 2),
+        'std': round(float(values.std()), 2),
+        'percentile_25': round(float(np.percentile(values, 25)), 2),
+        'percentile_75': round(float(np.percentile(values, 75)), 2),
+    }
+
+
+class JsonLayerSink:
+    """
+    Capa de puntos JSON para el frontend (sin base de datos): cada punto con
+    valor, instante y el color/nivel que le corresponde según los niveles de la variable.
+    """
+
+    def __init__(self, path, source=None):
+        self.path = Path(path)
+        self.source = source
+        self.points = []
+        self.variable = None
+        self.units = None
+
+    def write(self, slab):
+        t_idx, iy, ix = slab.points()
+        if len(t_idx) == 0:
+            return 0
+        decimals = slab.spec.get('decimals', 2)
+        values = np.round(slab.values[t_idx, iy, ix].astype(np.float64), decimals)
+        lons = slab.lons[ix].tolist()
+        lats = slab.lats[iy].tolist()
+        timestamps = np.datetime_as_string(slab.times[t_idx], unit='s').tolist()
+
+        levels = slab.spec.get('levels')
+        if levels:
+            level_idx = level_index(levels, values)
+            colors = np.asarray(levels['colors'])[level_idx].tolist()
+            names = np.asarray(levels['names'])[level_idx].tolist()
+
+        components = {name: np.round(block[t_idx, iy, ix].astype(np.float64), decimals).tolist()
+                      for name, block in slab.components.items()}
+
+        for i, value in enumerate(values.tolist()):
+            point = {'lon': lons[i], 'lat': lats[i], 'value': value}
+            for name, component in components.items():
+                point[name] = component[i]
+            point['timestamp'] = timestamps[i]
+            if levels:
+                point['color'] = colors[i]
+                point[levels['key']] = names[i]
+            point['variable'] = slab.target
+            point['unit'] = slab.units
+            self.points.append(point)
+
+        self.variable = slab.target
+        self.units = slab.units
+        return len(values)
+
+    def close(self):
+        """Escribir la capa con sus estadísticas y metadatos."""
+        stats = layer_statistics([p['value'] for p in self.points])
+        output = {
+            'data': self.points,
+            'statistics': stats,
+            'metadata': {
+                'total_points': len(self.points),
+                'variable': self.variable,
+                'unit': self.units,
+                'source': self.source,
+                'extracted_at': datetime.now().isoformat()
+            }
+        }
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        with open(self.path, 'w') as f:
+            json.dump(output, f, indent=2)
+        return stats
+
+
+class CubeSink:
+    """
+    Cubo de datos local. Cada variable se guarda con su nombre NetCDF. El cubo
+    exige una malla fija por variable y un solo nivel, así que la
+    especificación debe ser la de app.data_cube.cube_spec (malla completa,
+    superficie); un segundo nivel de la misma variable es un error.
+    """
+
+    def __init__(self, root=CUBE_DIR):
+        self.root = root
+        self.depths = {}
+
+    def write(self, slab):
+        depth = self.depths.setdefault(slab.source, slab.depth)
+        if not (depth == slab.depth or (np.isnan(depth) and np.isnan(slab.depth))):
+            raise ValueError(f"El cubo admite un solo nivel por variable ({slab.source}: {depth} y {slab.depth})")
+        return append_variable(self.root, slab.source, slab.times, slab.lons, slab.lats,
+                               slab.values, units=slab.units)
+
+    def close(self):
+        pass
@@ -0,0 +1,382 @@
+"""
+Ejecución en segundo plano de la cadena de actualización de datos.
+
+POST /jobs/pipeline encola una ejecución de backend/src/scripts/pipeline.py y
+devuelve su ID de inmediato. Cada trabajo se ejecuta como subproceso con su
+salida en un archivo de log, y su estado se guarda en JOBS_DIR como JSON, de
+modo que cualquier worker de uvicorn puede responder a las consultas.
+
+Solo puede haber una ejecución a la vez por dataset: los trabajos toman un
+bloqueo de archivo (flock) por dataset, compartido entre procesos. Un trabajo
+sin lista de datasets los bloquea todos. Las etapas globales de la cadena
+(assign, predict, refresh) y la escritura de metadata.json se serializan
+dentro de pipeline.py y del descargador. Pedir de nuevo una ejecución idéntica
+mientras otra sigue en cola o en curso devuelve el trabajo existente; la
+búsqueda y la creación se hacen bajo un flock para que dos workers no creen
+trabajos duplicados.
+
+Cada trabajo guarda el PID del worker que lo ejecuta y un latido que ese worker
+renueva periódicamente. Un trabajo activo cuyo worker ya no existe o cuyo latido
+ha caducado (reinicio o caída de uvicorn) se marca como 'fallido' al consultarlo.
+"""
+
+import os
+import sys
+import json
+import uuid
+import time
+import fcntl
+import logging
+import threading
+import subprocess
+from pathlib import Path
+from datetime import datetime
+from contextlib import ExitStack
+from typing import List, Optional
+from concurrent.futures import ThreadPoolExecutor
+
+from fastapi import APIRouter, HTTPException, Query
+from pydantic import BaseModel
+
+logger = logging.getLogger(__name__)
+
+# Directorio de estado, logs y bloqueos de los trabajos
+JOBS_DIR = Path(os.getenv('JOBS_DIR', '/tmp/gloria-jobs'))
+
+# Script de la cadena de actualización
+PIPELINE_SCRIPT = Path(os.getenv(
+    'PIPELINE_SCRIPT',
+    Path(__file__).resolve().parents[2] / 'backend' / 'src' / 'scripts' / 'pipeline.py'
+))
+
+# Trabajos simultáneos por proceso (el bloqueo por dataset evita solapes)
+JOB_WORKERS = int(os.getenv('JOB_WORKERS', '2'))
+
+# Etapas de la cadena, en orden (ver pipeline.py)
+PIPELINE_STAGES = ['download', 'validate', 'extract', 'load', 'assign', 'predict', 'refresh']
+
+# Bloqueo que toman los trabajos sin lista de datasets
+ALL_DATASETS_LOCK = '_todos'
+
+ACTIVE_STATES = ('en_cola', 'en_curso')
+
+# Bloqueo de la búsqueda y creación de trabajos (compartido entre workers)
+QUEUE_LOCK = '_cola'
+
+# Intervalo del latido de los trabajos activos y antigüedad a partir de la que caduca (s)
+JOB_HEARTBEAT_SECONDS = int(os.getenv('JOB_HEARTBEAT_SECONDS', '30'))
+JOB_STALE_SECONDS = int(os.getenv('JOB_STALE_SECONDS', str(4 * JOB_HEARTBEAT_SECONDS)))
+
+router = APIRouter(prefix="/jobs", tags=["jobs"])
+
+_executor = ThreadPoolExecutor(max_workers=JOB_WORKERS, thread_name_prefix='job')
+
+# Trabajos activos de este proceso (los que renueva el hilo de latido)
+_owned_jobs = set()
+_owned_lock = threading.Lock()
+_heartbeat_thread = None
+
+# Serializa las escrituras de estado de este proceso (hilo del trabajo y del latido)
+_state_lock = threading.Lock()
+
+
+class PipelineJobRequest(BaseModel):
+    datasets: Optional[List[str]] = None
+    from_stage: Optional[str] = None
+    only: Optional[List[str]] = None
+
+
+def _job_path(job_id, suffix):
+    return JOBS_DIR / f"{job_id}{suffix}"
+
+
+def _write_state(state):
+    """Guardar el estado de un trabajo de forma atómica."""
+    tmp_path = _job_path(state['id'], '.json.tmp')
+    with open(tmp_path, 'w') as f:
+        json.dump(state, f)
+    os.replace(tmp_path, _job_path(state['id'], '.json'))
+
+
+def _read_state(job_id):
+    try:
+        with open(_job_path(job_id, '.json'), 'r') as f:
+            return json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return None
+
+
+def _update_state(job_id, **changes):
+    with _state_lock:
+        state = _read_state(job_id)
+        state.update(changes)
+        _write_state(state)
+    return state
+
+
+def _heartbeat_loop():
+    """Renovar el latido de los trabajos activos de este proceso."""
+    while True:
+        time.sleep(JOB_HEARTBEAT_SECONDS)
+        with _owned_lock:
+            job_ids = list(_owned_jobs)
+        for job_id in job_ids:
+            try:
+                _update_state(job_id, latido=time.time())
+            except Exception as e:
+                logger.warning(f"⚠️ No se pudo renovar el latido del trabajo {job_id}: {e}")
+
+
+def _own_job(job_id):
+    """Registrar un trabajo de este proceso y arrancar el hilo de latido si hace falta."""
+    global _heartbeat_thread
+    with _owned_lock:
+        _owned_jobs.add(job_id)
+        if _heartbeat_thread is None:
+            _heartbeat_thread = threading.Thread(target=_heartbeat_loop, name='job-heartbeat', daemon=True)
+            _heartbeat_thread.start()
+
+
+def _release_job(job_id):
+    with _owned_lock:
+        _owned_jobs.discard(job_id)
+
+
+def _process_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def _orphan_reason(state):
+    """Motivo por el que un trabajo activo ya no tiene quien lo ejecute, o None."""
+    if state.get('estado') not in ACTIVE_STATES:
+        return None
+    worker_pid = state.get('worker_pid')
+    if worker_pid == os.getpid():
+        # Mismo PID pero sin el trabajo registrado: el worker se reinició con un PID reutilizado
+        with _owned_lock:
+            owned = state['id'] in _owned_jobs
+        if not owned:
+            return f"El worker {worker_pid} se reinició sin terminar el trabajo"
+    elif worker_pid and not _process_alive(worker_pid):
+        return f"El worker {worker_pid} que ejecutaba el trabajo ya no existe"
+    heartbeat = state.get('latido')
+    if heartbeat and time.time() - heartbeat > JOB_STALE_SECONDS:
+        return f"Sin latido del worker {worker_pid} desde hace {time.time() - heartbeat:.0f}s"
+    return None
+
+
+def _check_orphan(state):
+    """Marcar como 'fallido' un trabajo activo huérfano; devuelve el estado actualizado."""
+    reason = _orphan_reason(state)
+    if reason is None:
+        return state
+    logger.warning(f"⚠️ Trabajo {state['id']} huérfano: {reason}")
+    return _update_state(state['id'], estado='fallido', error=reason, fin=datetime.now().isoformat())
+
+
+def _job_stages(request):
+    if request.get('only'):
+        return [stage for stage in PIPELINE_STAGES if stage in request['only']]
+    start = PIPELINE_STAGES.index(request['from_stage']) if request.get('from_stage') else 0
+    return PIPELINE_STAGES[start:]
+
+
+def _pipeline_command(request):
+    command = [sys.executable, str(PIPELINE_SCRIPT)]
+    if request.get('from_stage'):
+        command += ['--from-stage', request['from_stage']]
+    for stage in request.get('only') or []:
+        command += ['--only', stage]
+    if request.get('datasets'):
+        command += ['--datasets'] + request['datasets']
+    return command
+
+
+def _dataset_locks(stack, datasets):
+    """
+    Tomar los bloqueos de los datasets del trabajo (bloqueante, en orden fijo
+    para evitar interbloqueos). Sin datasets: bloqueo exclusivo de todos.
+    """
+    lock_dir = JOBS_DIR / 'locks'
+    lock_dir.mkdir(parents=True, exist_ok=True)
+
+    all_lock = stack.enter_context(open(lock_dir / f"{ALL_DATASETS_LOCK}.lock", 'w'))
+    if not datasets:
+        fcntl.flock(all_lock, fcntl.LOCK_EX)
+        return
+    fcntl.flock(all_lock, fcntl.LOCK_SH)
+
+    for dataset_id in sorted(set(datasets)):
+        lock_file = stack.enter_context(open(lock_dir / f"{dataset_id.replace('/', '_')}.lock", 'w'))
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+
+
+def _run_job(job_id):
+    """Ejecutar un trabajo encolado en este proceso."""
+    state = _read_state(job_id)
+    _own_job(job_id)
+    try:
+        with ExitStack() as stack:
+            _dataset_locks(stack, state['request'].get('datasets'))
+
+            state = _update_state(job_id, estado='en_curso', inicio=datetime.now().isoformat())
+            logger.info(f"Iniciando trabajo {job_id}: {' '.join(state['comando'])}")
+
+            with open(_job_path(job_id, '.log'), 'ab') as log_file:
+                process = subprocess.Popen(
+                    state['comando'],
+                    stdout=log_file,
+                    stderr=subprocess.STDOUT,
+                    cwd=str(JOBS_DIR)
+                )
+                _update_state(job_id, pid=process.pid)
+                exit_code = process.wait()
+
+        _update_state(
+            job_id,
+            estado='completado' if exit_code == 0 else 'fallido',
+            codigo_salida=exit_code,
+            fin=datetime.now().isoformat()
+        )
+    except Exception as e:
+        logger.error(f"Error en el trabajo {job_id}: {e}")
+        _update_state(job_id, estado='fallido', error=str(e), fin=datetime.now().isoformat())
+    finally:
+        _release_job(job_id)
+
+
+def _tail(path, lines):
+    """Últimas `lines` líneas de un archivo de log sin leerlo entero."""
+    if not path.exists():
+        return []
+    with open(path, 'rb') as f:
+        f.seek(0, os.SEEK_END)
+        size = f.tell()
+        block = min(size, max(4096, lines * 200))
+        while True:
+            f.seek(size - block)
+            data = f.read(block)
+            if block == size or data.count(b'\n') > lines:
+                break
+            block = min(size, block * 2)
+    return data.decode('utf-8', errors='replace').splitlines()[-lines:]
+
+
+def _progress(state):
+    """Etapas terminadas según las líneas de tiempo por etapa del log de la cadena."""
+    stages = state['etapas']
+    completed = []
+    log_path = _job_path(state['id'], '.log')
+    if log_path.exists():
+        with open(log_path, 'r', encoding='utf-8', errors='replace') as f:
+            for line in f:
+                if 'Etapa ' in line and '⏱️' in line:
+                    stage = line.split('Etapa ', 1)[1].split(':', 1)[0].strip()
+                    if stage in stages:
+                        completed.append(stage)
+
+    current = None
+    if state['estado'] == 'en_curso':
+        current = next((stage for stage in stages if stage not in completed), None)
+    return {
+        'etapas_completadas': completed,
+        'etapa_actual': current,
+        'progreso': round(len(completed) / len(stages), 2) if stages else 1.0
+    }
+
+
+def _find_active_job(request):
+    """
+    Trabajo en cola o en curso con la misma petición, si existe. Los trabajos
+    huérfanos (worker muerto o sin latido) se marcan como 'fallido' y no cuentan.
+    """
+    if not JOBS_DIR.exists():
+        return None
+    for path in JOBS_DIR.glob('*.json'):
+        try:
+            with open(path, 'r') as f:
+                state = json.load(f)
+        except (OSError, json.JSONDecodeError):
+            continue
+        if state.get('estado') in ACTIVE_STATES and state.get('request') == request:
+            state = _check_orphan(state)
+            if state['estado'] in ACTIVE_STATES:
+                return state
+    return None
+
+
+@router.post("/pipeline", status_code=202)
+def enqueue_pipeline(request: PipelineJobRequest):
+    """Encola una ejecución de la cadena de actualización y devuelve su ID."""
+    for stage in ([request.from_stage] if request.from_stage else []) + (request.only or []):
+        if stage not in PIPELINE_STAGES:
+            raise HTTPException(status_code=400, detail=f"Etapa desconocida: {stage}")
+    if not PIPELINE_SCRIPT.exists():
+        raise HTTPException(status_code=503, detail=f"Script de la cadena no disponible: {PIPELINE_SCRIPT}")
+
+    JOBS_DIR.mkdir(parents=True, exist_ok=True)
+    job_request = {
+        'datasets': sorted(request.datasets) if request.datasets else None,
+        'from_stage': request.from_stage,
+        'only': request.only
+    }
+
+    lock_dir = JOBS_DIR / 'locks'
+    lock_dir.mkdir(parents=True, exist_ok=True)
+    with open(lock_dir / f"{QUEUE_LOCK}.lock", 'w') as queue_lock:
+        fcntl.flock(queue_lock, fcntl.LOCK_EX)
+
+        existing = _find_active_job(job_request)
+        if existing:
+            return {'job_id': existing['id'], 'estado': existing['estado'], 'existente': True}
+
+        job_id = uuid.uuid4().hex[:12]
+        _write_state({
+            'id': job_id,
+            'estado': 'en_cola',
+            'request': job_request,
+            'etapas': _job_stages(job_request),
+            'comando': _pipeline_command(job_request),
+            'creado': datetime.now().isoformat(),
+            'worker_pid': os.getpid(),
+            'latido': time.time()
+        })
+        _own_job(job_id)
+    _executor.submit(_run_job, job_id)
+
+    return {'job_id': job_id, 'estado': 'en_cola', 'existente': False}
+
+
+@router.get("")
+async def list_jobs(limit: int = Query(20, ge=1, le=200)):
+    """Trabajos más recientes."""
+    if not JOBS_DIR.exists():
+        return []
+    paths = sorted(JOBS_DIR.glob('*.json'), key=lambda p: p.stat().st_mtime, reverse=True)[:limit]
+    jobs = [_read_state(path.stem) for path in paths]
+    return [job for job in jobs if job]
+
+
+@router.get("/{job_id}")
+async def get_job(job_id: str):
+    """Estado y progreso de un trabajo."""
+    state = _read_state(job_id)
+    if state is None:
+        raise HTTPException(status_code=404, detail="Trabajo no encontrado")
+    state = _check_orphan(state)
+    return {**state, **_progress(state)}
+
+
+@router.get("/{job_id}/log")
+async def get_job_log(job_id: str, lines: int = Query(100, ge=1, le=5000)):
+    """Últimas líneas del log de un trabajo."""
+    state = _read_state(job_id)
+    if state is None:
+        raise HTTPException(status_code=404, detail="Trabajo no encontrado")
+    return {'job_id': job_id, 'estado': state['estado'], 'lineas': _tail(_job_path(job_id, '.log'), lines)}
@@ -1,4 +1,4 @@
-from fastapi import FastAPI, HTTPException, Query
+from fastapi import FastAPI, HTTPException, Query, Request, Response
 from pydantic import BaseModel
 from datetime import datetime, timedelta
 import numpy as np
@@ -6,13 +6,57 @@ from typing import List, Optional
 import psycopg2
 from psycopg2.extras import RealDictCursor
 import os
+import time
 from .models.escape_prediction_model import EscapePredictionModel
+from .data_cube import DataCube
+from .jobs import router as jobs_router
+from .tiles import router as tiles_router
+from .vector_tiles import router as vector_tiles_router
+from .frames import router as frames_router
+from . import metrics
+from .query_profiler import connect_kwargs
 
 app = FastAPI(title="GlorIA - Predicción de Riesgo de Escapes")
 
+# Trabajos de actualización de datos en segundo plano
+app.include_router(jobs_router)
+
+# Teselas PNG de los campos del cubo
+app.include_router(tiles_router)
+
+# Teselas vectoriales de piscifactorías, alertas y lecturas
+app.include_router(vector_tiles_router)
+
+# Secuencias de fotogramas para animaciones
+app.include_router(frames_router)
+
+@app.middleware("http")
+async def record_request_metrics(request: Request, call_next):
+    """Latencia de cada petición, etiquetada con la plantilla de la ruta."""
+    start = time.perf_counter()
+    status = 500
+    try:
+        response = await call_next(request)
+        status = response.status_code
+        return response
+    finally:
+        route = getattr(request.scope.get('route'), 'path', 'sin_ruta')
+        metrics.REQUEST_DURATION.labels(
+            method=request.method, route=route, status=str(status)
+        ).observe(time.perf_counter() - start)
+
+@app.get("/metrics", include_in_schema=False)
+def get_metrics():
+    """Métricas en formato Prometheus."""
+    body, content_type = metrics.metrics_response()
+    return Response(content=body, media_type=content_type)
+
 # Instanciar el modelo
 model = EscapePredictionModel()
 
+# Cubo de datos local (lecturas mapeadas en memoria)
+cube = DataCube()
+
 # Conexión a la base de datos
 def get_db_connection():
     return psycopg2.connect(
@@ -20,9 +64,26 @@ def get_db_connection():
         user=os.getenv("DB_USER", "postgres"),
         password=os.getenv("DB_PASSWORD", "postgres"), 
         host=os.getenv("DB_HOST", "localhost"),
-        port=os.getenv("DB_PORT", "5432")
+        port=os.getenv("DB_PORT", "5432"),
+        **connect_kwargs()
     )
 
+def get_cube_wave_heights(lon, lat):
+    """
+    Obtiene la altura de ola más reciente y la de 24 h antes en la celda del cubo
+    más cercana a la piscifactoría. Devuelve None si el cubo no tiene datos.
+    """
+    variable = cube.variable('VHM0')
+    if variable is None or variable.shape[0] == 0:
+        return None
+
+    _, values = variable.series(lon, lat, start=variable.times[-1] - np.timedelta64(24, 'h'))
+    values = values[np.isfinite(values)]
+    if len(values) < 2:
+        return None
+
+    return float(values[-1]), float(values[0])
+
 # Modelo de datos para la respuesta
 class RiskResponse(BaseModel):
     piscifactoria_id: int
@@ -44,32 +105,35 @@ async def get_risk_assessment(piscifactoria_id: int):
         cursor = conn.cursor(cursor_factory=RealDictCursor)
         
         # Obtener información de la piscifactoría
-        cursor.execute("""
-            SELECT id, nombre FROM gloria.piscifactorias WHERE id = %s
-        """, (piscifactoria_id,))
+        with metrics.timed_query('riesgo_piscifactoria'):
+            cursor.execute("""
+                SELECT id, nombre, ST_X(geometria) AS lon, ST_Y(geometria) AS lat
+                FROM gloria.piscifactorias WHERE id = %s
+            """, (piscifactoria_id,))
         
         farm = cursor.fetchone()
         if not farm:
             raise HTTPException(status_code=404, detail="Piscifactoría no encontrada")
         
         # Obtener datos de altura de olas y corrientes más recientes
-        cursor.execute("""
-            SELECT 
-                v1.variable_nombre, 
-                v1.valor, 
-                v1.fecha_tiempo 
-            FROM gloria.variables_ambientales v1
-            JOIN (
+        with metrics.timed_query('riesgo_corrientes'):
+            cursor.execute("""
                 SELECT 
-                    variable_nombre, 
-                    MAX(fecha_tiempo) as max_fecha 
-                FROM gloria.variables_ambientales 
-                WHERE piscifactoria_id = %s
-                AND variable_nombre IN ('uo', 'vo')
-                GROUP BY variable_nombre
-            ) v2 ON v1.variable_nombre = v2.variable_nombre AND v1.fecha_tiempo = v2.max_fecha
-            WHERE v1.piscifactoria_id = %s
-        """, (piscifactoria_id, piscifactoria_id))
+                    v1.variable_nombre, 
+                    v1.valor, 
+                    v1.fecha_tiempo 
+                FROM gloria.variables_ambientales v1
+                JOIN (
+                    SELECT 
+                        variable_nombre, 
+                        MAX(fecha_tiempo) as max_fecha 
+                    FROM gloria.variables_ambientales 
+                    WHERE piscifactoria_id = %s
+                    AND variable_nombre IN ('uo', 'vo')
+                    GROUP BY variable_nombre
+                ) v2 ON v1.variable_nombre = v2.variable_nombre AND v1.fecha_tiempo = v2.max_fecha
+                WHERE v1.piscifactoria_id = %s
+            """, (piscifactoria_id, piscifactoria_id))
         
         current_data = cursor.fetchall()
         
@@ -81,37 +145,38 @@ async def get_risk_assessment(piscifactoria_id: int):
         current_velocity = np.sqrt(current_u**2 + current_v**2)
         
         # Obtener datos de olas (hoy y ayer)
-        cursor.execute("""
-            SELECT 
-                fecha_tiempo, 
-                valor 
-            FROM gloria.variables_ambientales 
-            WHERE piscifactoria_id = %s 
-            AND variable_nombre = 'wave_height'
-            ORDER BY fecha_tiempo DESC 
-            LIMIT 2
-        """, (piscifactoria_id,))
+        with metrics.timed_query('riesgo_oleaje'):
+            cursor.execute("""
+                SELECT 
+                    fecha_tiempo, 
+                    valor 
+                FROM gloria.variables_ambientales 
+                WHERE piscifactoria_id = %s 
+                AND variable_nombre = 'wave_height'
+                ORDER BY fecha_tiempo DESC 
+                LIMIT 2
+            """, (piscifactoria_id,))
         
         wave_data = cursor.fetchall()
         
-        # Si no hay suficientes datos, usar valores simulados
+        # Si no hay suficientes datos, usar el cubo local o valores simulados
         if len(wave_data) < 2:
-            current_wave = 1.5
-            prev_day_wave = 1.2
+            current_wave, prev_day_wave = get_cube_wave_heights(farm['lon'], farm['lat']) or (1.5, 1.2)
             temperatura = 22
         else:
             current_wave = wave_data[0]['valor']
             prev_day_wave = wave_data[1]['valor']
             
             # Obtener temperatura
-            cursor.execute("""
-                SELECT valor 
-                FROM gloria.variables_ambientales 
-                WHERE piscifactoria_id = %s 
-                AND variable_nombre = 'temperature'
-                ORDER BY fecha_tiempo DESC 
-                LIMIT 1
-            """, (piscifactoria_id,))
+            with metrics.timed_query('riesgo_temperatura'):
+                cursor.execute("""
+                    SELECT valor 
+                    FROM gloria.variables_ambientales 
+                    WHERE piscifactoria_id = %s 
+                    AND variable_nombre = 'temperature'
+                    ORDER BY fecha_tiempo DESC 
+                    LIMIT 1
+                """, (piscifactoria_id,))
             
             temp_data = cursor.fetchone()
             temperatura = temp_data['valor'] if temp_data else 22
@@ -120,12 +185,13 @@ async def get_risk_assessment(piscifactoria_id: int):
         conn.close()
         
         # Calcular el riesgo
-        risk_assessment = model.get_risk_assessment(
-            wave_height=current_wave,
-            prev_day_wave_height=prev_day_wave,
-            temperature=temperatura,
-            current_velocity=current_velocity
-        )
+        with metrics.timed(metrics.MODEL_SCORING, model='riesgo_escape'):
+            risk_assessment = model.get_risk_assessment(
+                wave_height=current_wave,
+                prev_day_wave_height=prev_day_wave,
+                temperature=temperatura,
+                current_velocity=current_velocity
+            )
         
         # Crear respuesta
         return {
@@ -151,23 +217,25 @@ async def get_prediction(piscifactoria_id: int, days: int = Query(7, ge=1, le=14
         cursor = conn.cursor(cursor_factory=RealDictCursor)
         
         # Obtener información de la piscifactoría
-        cursor.execute("""
-            SELECT id, nombre FROM gloria.piscifactorias WHERE id = %s
-        """, (piscifactoria_id,))
+        with metrics.timed_query('prediccion_piscifactoria'):
+            cursor.execute("""
+                SELECT id, nombre FROM gloria.piscifactorias WHERE id = %s
+            """, (piscifactoria_id,))
         
         farm = cursor.fetchone()
         if not farm:
             raise HTTPException(status_code=404, detail="Piscifactoría no encontrada")
         
         # Obtener datos históricos de olas
-        cursor.execute("""
-            SELECT fecha_tiempo, valor 
-            FROM gloria.variables_ambientales 
-            WHERE piscifactoria_id = %s 
-            AND variable_nombre = 'wave_height'
-            ORDER BY fecha_tiempo DESC 
-            LIMIT 7
-        """, (piscifactoria_id,))
+        with metrics.timed_query('prediccion_oleaje'):
+            cursor.execute("""
+                SELECT fecha_tiempo, valor 
+                FROM gloria.variables_ambientales 
+                WHERE piscifactoria_id = %s 
+                AND variable_nombre = 'wave_height'
+                ORDER BY fecha_tiempo DESC 
+                LIMIT 7
+            """, (piscifactoria_id,))
         
         historical_waves = cursor.fetchall()
         
@@ -203,12 +271,13 @@ async def get_prediction(piscifactoria_id: int, days: int = Query(7, ge=1, le=14
                 prev_day_wave = last_wave
             
             # Obtener evaluación de riesgo
-            risk = model.get_risk_assessment(
-                wave_height=simulated_wave,
-                prev_day_wave_height=prev_day_wave,
-                temperature=last_temperature,
-                current_velocity=last_current
-            )
+            with metrics.timed(metrics.MODEL_SCORING, model='riesgo_escape'):
+                risk = model.get_risk_assessment(
+                    wave_height=simulated_wave,
+                    prev_day_wave_height=prev_day_wave,
+                    temperature=last_temperature,
+                    current_velocity=last_current
+                )
             
             # Añadir predicción
             predictions.append({
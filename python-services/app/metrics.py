@@ -0,0 +1,156 @@
+"""
+Métricas Prometheus compartidas por el servicio FastAPI y los scripts por lotes.
+
+- gloria_http_request_duration_seconds{method, route, status}: latencia por ruta (plantilla, no URL)
+- gloria_db_query_duration_seconds{query}: tiempo de cada consulta con nombre
+- gloria_rows_total{stage, dataset} y gloria_rows_per_second{stage, dataset}:
+  filas extraídas/cargadas por producto y ritmo de la última ejecución
+- gloria_ingest_duration_seconds{stage, dataset}: duración de la extracción y la carga de cada archivo
+- gloria_stage_duration_seconds{stage, dataset}: duración de las etapas de la cadena
+- gloria_model_scoring_seconds{model}: tiempo de evaluación del modelo de riesgo
+- gloria_cache_requests_total{cache, result}: aciertos (hit) y fallos (miss) de cachés
+
+El servicio las publica en /metrics. Con varios workers de uvicorn hay que
+definir PROMETHEUS_MULTIPROC_DIR (directorio vacío al arrancar) para que
+/metrics agregue los procesos. Los scripts por lotes las exportan al terminar
+con export_batch_metrics: a un Pushgateway (PROMETHEUS_PUSHGATEWAY) o a un
+archivo .prom para el textfile collector de node_exporter (PROMETHEUS_TEXTFILE_DIR).
+
+Si prometheus_client no está instalado, las métricas no hacen nada.
+"""
+
+import os
+import time
+import logging
+import contextvars
+from pathlib import Path
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+try:
+    import prometheus_client
+    from prometheus_client import Counter, Gauge, Histogram
+except ImportError:  # Dependencia opcional: sin ella las métricas son no-op
+    prometheus_client = None
+
+PUSHGATEWAY = os.getenv('PROMETHEUS_PUSHGATEWAY')
+TEXTFILE_DIR = os.getenv('PROMETHEUS_TEXTFILE_DIR')
+MULTIPROC_DIR = os.getenv('PROMETHEUS_MULTIPROC_DIR')
+
+# Cubetas de latencia (segundos): de consultas de milisegundos a etapas de minutos
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+STAGE_BUCKETS = (1, 5, 15, 30, 60, 120, 300, 600, 1800, 3600, 7200)
+# Extracción y carga por archivo: de fracciones de segundo a varios minutos
+INGEST_BUCKETS = LATENCY_BUCKETS + (60, 120, 300, 600)
+
+# Nombre de la consulta en curso (lo usa también el perfilado de app.query_profiler)
+CURRENT_QUERY = contextvars.ContextVar('gloria_current_query', default=None)
+
+
+class _NoopMetric:
+    """Sustituto de una métrica cuando prometheus_client no está disponible."""
+
+    def labels(self, *args, **kwargs):
+        return self
+
+    def observe(self, value):
+        pass
+
+    def inc(self, amount=1):
+        pass
+
+    def set(self, value):
+        pass
+
+
+if prometheus_client is not None:
+    REQUEST_DURATION = Histogram(
+        'gloria_http_request_duration_seconds', 'Latencia de las peticiones HTTP por ruta',
+        ['method', 'route', 'status'], buckets=LATENCY_BUCKETS)
+    QUERY_DURATION = Histogram(
+        'gloria_db_query_duration_seconds', 'Duración de las consultas SQL con nombre',
+        ['query'], buckets=LATENCY_BUCKETS)
+    ROWS = Counter(
+        'gloria_rows', 'Filas extraídas o cargadas por producto', ['stage', 'dataset'])
+    ROWS_PER_SECOND = Gauge(
+        'gloria_rows_per_second', 'Filas por segundo de la última ejecución', ['stage', 'dataset'],
+        multiprocess_mode='mostrecent')
+    INGEST_DURATION = Histogram(
+        'gloria_ingest_duration_seconds', 'Duración de la extracción y la carga de cada archivo',
+        ['stage', 'dataset'], buckets=INGEST_BUCKETS)
+    STAGE_DURATION = Histogram(
+        'gloria_stage_duration_seconds', 'Duración de las etapas de la cadena',
+        ['stage', 'dataset'], buckets=STAGE_BUCKETS)
+    MODEL_SCORING = Histogram(
+        'gloria_model_scoring_seconds', 'Tiempo de evaluación del modelo de riesgo',
+        ['model'], buckets=LATENCY_BUCKETS)
+    CACHE_REQUESTS = Counter(
+        'gloria_cache_requests', 'Consultas a cachés internas', ['cache', 'result'])
+else:
+    REQUEST_DURATION = QUERY_DURATION = ROWS = ROWS_PER_SECOND = _NoopMetric()
+    INGEST_DURATION = STAGE_DURATION = MODEL_SCORING = CACHE_REQUESTS = _NoopMetric()
+
+
+@contextmanager
+def timed(metric, **labels):
+    """Medir la duración del bloque en un histograma."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        metric.labels(**labels).observe(time.perf_counter() - start)
+
+
+@contextmanager
+def timed_query(name):
+    """Medir una consulta SQL con nombre: `with timed_query('riesgo_oleaje'): cursor.execute(...)`."""
+    token = CURRENT_QUERY.set(name)
+    try:
+        with timed(QUERY_DURATION, query=name):
+            yield
+    finally:
+        CURRENT_QUERY.reset(token)
+
+
+def record_rows(stage, dataset, rows, seconds):
+    """Registrar filas procesadas por una etapa (extract, load...) de un producto."""
+    ROWS.labels(stage=stage, dataset=dataset).inc(rows)
+    INGEST_DURATION.labels(stage=stage, dataset=dataset).observe(seconds)
+    if seconds > 0:
+        ROWS_PER_SECOND.labels(stage=stage, dataset=dataset).set(rows / seconds)
+
+
+def cache_access(cache, hit):
+    """Registrar un acierto o fallo de caché."""
+    CACHE_REQUESTS.labels(cache=cache, result='hit' if hit else 'miss').inc()
+
+
+def metrics_response():
+    """(cuerpo, content type) de la exposición de métricas, agregando workers si procede."""
+    if prometheus_client is None:
+        return b'', 'text/plain; charset=utf-8'
+    registry = prometheus_client.REGISTRY
+    if MULTIPROC_DIR:
+        from prometheus_client import multiprocess
+        registry = prometheus_client.CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    return prometheus_client.generate_latest(registry), prometheus_client.CONTENT_TYPE_LATEST
+
+
+def export_batch_metrics(job):
+    """
+    Exportar las métricas de un script por lotes al terminar: al Pushgateway
+    si está configurado, y/o a <PROMETHEUS_TEXTFILE_DIR>/<job>.prom.
+    """
+    if prometheus_client is None or not (PUSHGATEWAY or TEXTFILE_DIR):
+        return
+    try:
+        if PUSHGATEWAY:
+            prometheus_client.push_to_gateway(PUSHGATEWAY, job=job, registry=prometheus_client.REGISTRY)
+        if TEXTFILE_DIR:
+            Path(TEXTFILE_DIR).mkdir(parents=True, exist_ok=True)
+            prometheus_client.write_to_textfile(str(Path(TEXTFILE_DIR) / f"{job}.prom"), prometheus_client.REGISTRY)
+        logger.info(f"📈 Métricas de {job} exportadas")
+    except Exception as e:
+        logger.warning(f"⚠️  No se pudieron exportar las métricas de {job}: {e}")
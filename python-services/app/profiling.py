@@ -0,0 +1,242 @@
+"""
+Perfilado opcional de las importaciones largas (--profile).
+
+Dos modos:
+- sample (por defecto): un hilo toma muestras de la pila del hilo principal
+  cada `interval` segundos (sys._current_frames), con coste bajo y sin
+  instrumentar el código. Cada muestra pesa el tiempo transcurrido desde la
+  anterior, de modo que las esperas en código C (lectura de NetCDF, red con
+  PostgreSQL) cuentan lo que duran.
+- cprofile: perfil determinista de cProfile (más preciso por función, con más
+  sobrecoste).
+
+Por cada archivo de entrada se escribe en el directorio de salida:
+- <archivo>.collapsed: pilas en formato "a;b;c segundos" (flamegraph.pl, speedscope)
+- <archivo>.speedscope.json: perfil para https://www.speedscope.app
+- <archivo>.pstats: estadísticas de cProfile (modo cprofile)
+
+Los scripts lo activan con add_profile_arguments/profiler_from_args:
+    python import_netcdf_data.py --profile [--profile-dir DIR] [--profile-top N]
+    python process_data.py --profile cprofile
+
+Al final, report() resume las funciones más costosas de toda la ejecución y,
+en modo sample, el reparto entre extracción, búsqueda de piscifactorías e inserción.
+"""
+
+import sys
+import json
+import time
+import pstats
+import cProfile
+import logging
+import threading
+from pathlib import Path
+from datetime import datetime
+from collections import Counter
+from contextlib import contextmanager, nullcontext
+
+logger = logging.getLogger(__name__)
+
+# Fases de la importación: funciones que identifican cada una (se usa la más interna de la pila)
+PHASES = {
+    'extraccion': ('iter_slabs', '_read_block', '_apply_range', 'read_time_axis', 'decode_times'),
+    'piscifactorias': ('find_closest_piscifactorias', 'find_closest_piscifactoria', '_farm_grid'),
+    'insercion': ('copy_variables_ambientales', 'encode_rows', 'write_fields', 'get_or_create_grid'),
+    'cubo': ('append_netcdf_to_cube', 'append_variable'),
+}
+
+SPEEDSCOPE_SCHEMA = 'https://www.speedscope.app/file-format-schema.json'
+
+
+def _frame_name(code):
+    return f"{code.co_name} ({Path(code.co_filename).name}:{code.co_firstlineno})"
+
+
+class StackSampler:
+    """Muestreo periódico de la pila de un hilo. Acumula segundos por pila (raíz → hoja)."""
+
+    def __init__(self, thread_id=None, interval=0.005):
+        self.thread_id = thread_id or threading.main_thread().ident
+        self.interval = interval
+        self.stacks = Counter()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def _sample(self):
+        last = time.perf_counter()
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            now = time.perf_counter()
+            if frame is not None:
+                stack = []
+                while frame is not None:
+                    stack.append(_frame_name(frame.f_code))
+                    frame = frame.f_back
+                self.stacks[tuple(reversed(stack))] += now - last
+            last = now
+
+    def start(self):
+        self._thread = threading.Thread(target=self._sample, name='stack-sampler', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    def write_collapsed(self, path):
+        with open(path, 'w') as f:
+            for stack, seconds in self.stacks.most_common():
+                f.write(f"{';'.join(stack)} {seconds:.6f}\n")
+
+    def write_speedscope(self, path, name):
+        frames, index = [], {}
+        samples, weights = [], []
+        for stack, seconds in self.stacks.items():
+            sample = []
+            for frame_name in stack:
+                if frame_name not in index:
+                    index[frame_name] = len(frames)
+                    frames.append({'name': frame_name})
+                sample.append(index[frame_name])
+            samples.append(sample)
+            weights.append(seconds)
+
+        with open(path, 'w') as f:
+            json.dump({
+                '$schema': SPEEDSCOPE_SCHEMA,
+                'shared': {'frames': frames},
+                'profiles': [{
+                    'type': 'sampled',
+                    'name': name,
+                    'unit': 'seconds',
+                    'startValue': 0,
+                    'endValue': sum(weights),
+                    'samples': samples,
+                    'weights': weights,
+                }],
+                'name': name,
+                'exporter': 'gloria.profiling',
+            }, f)
+
+
+class RunProfiler:
+    """Perfil por archivo de una importación y resumen conjunto al terminar."""
+
+    def __init__(self, output_dir, mode='sample', top_n=20, interval=0.005):
+        if mode not in ('sample', 'cprofile'):
+            raise ValueError(f"Modo de perfilado desconocido: {mode}")
+        self.output_dir = Path(output_dir)
+        self.output_dir.mkdir(parents=True, exist_ok=True)
+        self.mode = mode
+        self.top_n = top_n
+        self.interval = interval
+        self.self_seconds = Counter()
+        self.total_seconds = Counter()
+        self.phase_seconds = Counter()
+        self.file_seconds = {}
+        self._stats = None
+
+    @contextmanager
+    def profile(self, label):
+        """Perfilar el bloque y guardar sus archivos con el nombre `label`."""
+        label = Path(str(label)).stem
+        start = time.perf_counter()
+        if self.mode == 'sample':
+            sampler = StackSampler(interval=self.interval)
+            sampler.start()
+            try:
+                yield
+            finally:
+                sampler.stop()
+                self.file_seconds[label] = time.perf_counter() - start
+                sampler.write_collapsed(self.output_dir / f"{label}.collapsed")
+                sampler.write_speedscope(self.output_dir / f"{label}.speedscope.json", label)
+                self._add_samples(sampler.stacks)
+        else:
+            profiler = cProfile.Profile()
+            profiler.enable()
+            try:
+                yield
+            finally:
+                profiler.disable()
+                self.file_seconds[label] = time.perf_counter() - start
+                profiler.dump_stats(self.output_dir / f"{label}.pstats")
+                if self._stats is None:
+                    self._stats = pstats.Stats(profiler)
+                else:
+                    self._stats.add(profiler)
+
+    def _add_samples(self, stacks):
+        for stack, seconds in stacks.items():
+            self.self_seconds[stack[-1]] += seconds
+            for frame_name in set(stack):
+                self.total_seconds[frame_name] += seconds
+            phase = self._phase(stack)
+            self.phase_seconds[phase] += seconds
+
+    @staticmethod
+    def _phase(stack):
+        for frame_name in reversed(stack):
+            function = frame_name.split(' ', 1)[0]
+            for phase, functions in PHASES.items():
+                if function in functions:
+                    return phase
+        return 'otros'
+
+    def _top_functions(self):
+        """[(función, segundos propios, segundos acumulados)] más costosas."""
+        if self.mode == 'sample':
+            return [(name, seconds, self.total_seconds[name])
+                    for name, seconds in self.self_seconds.most_common(self.top_n)]
+        if self._stats is None:
+            return []
+        rows = []
+        for (filename, line, function), (_, _, tottime, cumtime, _) in self._stats.stats.items():
+            rows.append((f"{function} ({Path(filename).name}:{line})", tottime, cumtime))
+        return sorted(rows, key=lambda row: row[1], reverse=True)[:self.top_n]
+
+    def report(self):
+        """Resumen de la ejecución (líneas de texto); también se guarda en resumen.txt."""
+        total = sum(self.file_seconds.values())
+        lines = [f"Perfil ({self.mode}) de {len(self.file_seconds)} archivos, {total:.1f}s: {self.output_dir}"]
+
+        if self.phase_seconds:
+            sampled = sum(self.phase_seconds.values()) or 1
+            phases = ', '.join(f"{phase} {seconds / sampled:.0%}"
+                               for phase, seconds in self.phase_seconds.most_common())
+            lines.append(f"Reparto por fase: {phases}")
+
+        lines.append(f"{'propio (s)':>11} {'acumulado (s)':>14}  función")
+        for name, own, cumulative in self._top_functions():
+            lines.append(f"{own:>11.2f} {cumulative:>14.2f}  {name}")
+
+        with open(self.output_dir / 'resumen.txt', 'w') as f:
+            f.write('\n'.join(lines) + '\n')
+        return lines
+
+    def log_report(self):
+        for line in self.report():
+            logger.info(f"🔬 {line}")
+
+
+def add_profile_arguments(parser):
+    """Opciones --profile, --profile-dir y --profile-top de un script de importación."""
+    parser.add_argument('--profile', nargs='?', const='sample', choices=('sample', 'cprofile'),
+                        help="Perfilar cada archivo (muestreo de pila por defecto, o cProfile)")
+    parser.add_argument('--profile-dir', type=Path,
+                        help="Directorio de los perfiles (por defecto, ./profiles/<script>-<fecha>)")
+    parser.add_argument('--profile-top', type=int, default=20,
+                        help="Funciones más costosas a mostrar en el resumen")
+
+
+def profiler_from_args(args, name):
+    """RunProfiler según las opciones de add_profile_arguments, o None sin --profile."""
+    if not args.profile:
+        return None
+    output_dir = args.profile_dir or Path('profiles') / f"{name}-{datetime.now():%Y%m%d-%H%M%S}"
+    return RunProfiler(output_dir, mode=args.profile, top_n=args.profile_top)
+
+
+def profiled(profiler, label):
+    """Contexto de perfilado de un archivo; no hace nada si profiler es None."""
+    return profiler.profile(label) if profiler is not None else nullcontext()
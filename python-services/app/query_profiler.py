@@ -0,0 +1,193 @@
+"""
+Perfilado de consultas SQL (opcional, con QUERY_PROFILING=true).
+
+Las conexiones creadas con connect_kwargs() usan ProfilingConnection: todos
+sus cursores (también RealDictCursor y demás fábricas) miden cada sentencia y
+la registran en gloria_db_query_duration_seconds con un nombre. El nombre es
+el de metrics.timed_query si la sentencia se ejecuta dentro de uno; si no, se
+deduce de la función que la lanza y de la tabla principal
+("process_data.process_files:insert gloria.importaciones").
+
+Cuando una sentencia supera SLOW_QUERY_MS se obtiene su plan estimado con
+EXPLAIN (sin ANALYZE: la sentencia no se vuelve a ejecutar) y se añade al log
+de consultas lentas (SLOW_QUERY_LOG, una línea JSON por consulta). Cada nombre
+se analiza como mucho una vez cada SLOW_QUERY_EXPLAIN_INTERVAL segundos.
+Repetirla con ANALYZE duplicaría el coste de una consulta ya lenta, mantendría
+sus bloqueos y, en las escrituras (también un SELECT que llama a una función
+que escribe), consumiría secuencias que un ROLLBACK no devuelve. Para los
+tiempos reales por nodo, usar auto_explain (auto_explain.log_analyze) o
+pg_stat_statements en el servidor.
+
+Sin QUERY_PROFILING, connect_kwargs() está vacío y las conexiones son las de
+psycopg2 sin ningún coste añadido.
+"""
+
+import os
+import re
+import sys
+import json
+import time
+import logging
+import threading
+from datetime import datetime
+
+import psycopg2
+import psycopg2.extensions
+
+from .metrics import CURRENT_QUERY, QUERY_DURATION
+
+logger = logging.getLogger(__name__)
+
+PROFILING = os.getenv('QUERY_PROFILING', 'false').lower() == 'true'
+SLOW_QUERY_MS = float(os.getenv('SLOW_QUERY_MS', '500'))
+SLOW_QUERY_LOG = os.getenv('SLOW_QUERY_LOG', '/tmp/gloria-slow-queries.log')
+SLOW_QUERY_EXPLAIN_INTERVAL = float(os.getenv('SLOW_QUERY_EXPLAIN_INTERVAL', '300'))
+
+# Sentencias que admiten EXPLAIN; el resto (COPY, DDL, SET...) solo se mide
+EXPLAINABLE = ('select', 'with', 'insert', 'update', 'delete', 'values')
+
+# Longitud máxima del SQL guardado en el log
+MAX_SQL_LENGTH = 4000
+
+_TABLE_PATTERN = re.compile(r'\b(?:from|into|update|join)\s+([\w."]+)', re.IGNORECASE)
+
+# Módulos que no cuentan como origen de una consulta al deducir su nombre
+_INTERNAL_MODULES = (__name__, 'psycopg2')
+
+_last_explain = {}
+_explain_lock = threading.Lock()
+
+
+def _caller():
+    """'módulo.función' del primer marco fuera del perfilado y de psycopg2."""
+    frame = sys._getframe(3)
+    while frame is not None:
+        module = frame.f_globals.get('__name__', '')
+        if not module.startswith(_INTERNAL_MODULES):
+            return f"{module.rsplit('.', 1)[-1]}.{frame.f_code.co_name}"
+        frame = frame.f_back
+    return 'desconocido'
+
+
+def query_name(sql):
+    """Nombre de una sentencia: el de timed_query o función de origen + verbo + tabla."""
+    name = CURRENT_QUERY.get()
+    if name:
+        return name
+    if isinstance(sql, bytes):
+        sql = sql.decode('utf-8', errors='replace')
+    sql = sql if isinstance(sql, str) else str(sql)
+    words = sql.split(None, 1)
+    verb = words[0].lower() if words else ''
+    table = _TABLE_PATTERN.search(sql)
+    return f"{_caller()}:{verb} {table.group(1).lower() if table else ''}".strip()
+
+
+def _should_explain(name):
+    now = time.monotonic()
+    with _explain_lock:
+        if now - _last_explain.get(name, -SLOW_QUERY_EXPLAIN_INTERVAL) < SLOW_QUERY_EXPLAIN_INTERVAL:
+            return False
+        _last_explain[name] = now
+        return True
+
+
+def _explain(conn, sql):
+    """
+    Plan estimado (EXPLAIN, sin ejecutar la sentencia). El SAVEPOINT solo evita
+    que un error del EXPLAIN deje abortada la transacción de la aplicación.
+    """
+    if conn.autocommit or conn.get_transaction_status() == psycopg2.extensions.TRANSACTION_STATUS_INERROR:
+        return None
+    cursor = psycopg2.extensions.connection.cursor(conn, cursor_factory=psycopg2.extensions.cursor)
+    try:
+        cursor.execute("SAVEPOINT gloria_explain")
+        try:
+            cursor.execute("EXPLAIN " + sql)
+            return '\n'.join(row[0] for row in cursor.fetchall())
+        finally:
+            cursor.execute("ROLLBACK TO SAVEPOINT gloria_explain")
+            cursor.execute("RELEASE SAVEPOINT gloria_explain")
+    except psycopg2.Error as e:
+        logger.warning(f"⚠️  No se pudo obtener el plan de una consulta lenta: {e}")
+        return None
+    finally:
+        cursor.close()
+
+
+def _log_slow_query(entry):
+    try:
+        with open(SLOW_QUERY_LOG, 'a') as f:
+            f.write(json.dumps(entry, ensure_ascii=False) + '\n')
+    except OSError as e:
+        logger.warning(f"⚠️  No se pudo escribir en {SLOW_QUERY_LOG}: {e}")
+
+
+class ProfilingCursorMixin:
+    """Medición y captura de planes para cualquier clase de cursor de psycopg2."""
+
+    def execute(self, query, vars=None):
+        name = query_name(query)
+        start = time.perf_counter()
+        result = super().execute(query, vars)
+        self._profile(name, query, vars, time.perf_counter() - start)
+        return result
+
+    def executemany(self, query, vars_list):
+        name = query_name(query)
+        start = time.perf_counter()
+        result = super().executemany(query, vars_list)
+        self._profile(name, query, None, time.perf_counter() - start, explain=False)
+        return result
+
+    def _profile(self, name, query, vars, seconds, explain=True):
+        # Las consultas con timed_query ya se registran allí
+        if CURRENT_QUERY.get() is None:
+            QUERY_DURATION.labels(query=name).observe(seconds)
+
+        milliseconds = seconds * 1000
+        if milliseconds < SLOW_QUERY_MS:
+            return
+
+        sql = self.mogrify(query, vars).decode('utf-8', errors='replace') if vars is not None else str(query)
+        plan = None
+        if explain and sql.lstrip().split(None, 1)[0].lower() in EXPLAINABLE and _should_explain(name):
+            plan = _explain(self.connection, sql)
+
+        logger.warning(f"🐢 Consulta lenta {name}: {milliseconds:.0f} ms")
+        _log_slow_query({
+            'fecha': datetime.now().isoformat(),
+            'pid': os.getpid(),
+            'consulta': name,
+            'ms': round(milliseconds, 1),
+            'filas': self.rowcount,
+            'sql': sql[:MAX_SQL_LENGTH],
+            'plan': plan,
+        })
+
+
+_profiling_classes = {}
+
+
+def _profiling_class(cursor_class):
+    """Subclase con perfilado de una clase de cursor (una por clase)."""
+    if issubclass(cursor_class, ProfilingCursorMixin):
+        return cursor_class
+    if cursor_class not in _profiling_classes:
+        _profiling_classes[cursor_class] = type(
+            f"Profiling{cursor_class.__name__}", (ProfilingCursorMixin, cursor_class), {})
+    return _profiling_classes[cursor_class]
+
+
+class ProfilingConnection(psycopg2.extensions.connection):
+    """Conexión cuyos cursores, de cualquier fábrica, se perfilan."""
+
+    def cursor(self, *args, **kwargs):
+        factory = kwargs.get('cursor_factory') or self.cursor_factory or psycopg2.extensions.cursor
+        kwargs['cursor_factory'] = _profiling_class(factory)
+        return super().cursor(*args, **kwargs)
+
+
+def connect_kwargs():
+    """Argumentos extra de psycopg2.connect: el perfilado si QUERY_PROFILING está activo."""
+    return {'connection_factory': ProfilingConnection} if PROFILING else {}
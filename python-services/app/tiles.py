@@ -0,0 +1,239 @@
+"""
+Teselas PNG de los campos del cubo de datos local.
+
+GET /tiles/{capa}/{instante}/{z}/{x}/{y}.png devuelve una tesela de 256×256
+(Web Mercator, esquema XYZ) con el campo de la capa coloreado según sus
+niveles de app.color_levels; tierra y zonas sin datos son transparentes.
+El instante es una fecha ISO 8601 (se usa el más reciente que no la supera)
+o 'latest'. GET /tiles lista las capas con su leyenda e instantes disponibles.
+
+Cada píxel toma la celda más cercana de la malla, leída directamente del
+np.memmap del cubo: solo se tocan las filas y columnas que cubre la tesela.
+Con poco zoom se lee el nivel más reducido de la pirámide del cubo cuyas
+celdas no superan el tamaño de un píxel.
+Las teselas generadas se guardan en una caché LRU por proceso, con clave
+(capa, instante, z, x, y) y la versión del cubo, de modo que una
+actualización del cubo no sirve teselas antiguas.
+"""
+
+import io
+import os
+import threading
+from datetime import datetime, timezone
+from collections import OrderedDict
+
+import numpy as np
+from PIL import Image
+from fastapi import APIRouter, HTTPException, Response
+
+from .data_cube import DataCube
+from .color_levels import WAVE_LEVELS, CURRENT_LEVELS, TEMPERATURE_LEVELS, level_index, palette, legend
+from .metrics import cache_access
+
+TILE_SIZE = 256
+
+# Zoom máximo admitido
+MAX_ZOOM = 18
+
+# Teselas en la caché LRU de cada proceso (PNG de pocos KB cada una)
+TILE_CACHE_SIZE = int(os.getenv('TILE_CACHE_SIZE', '4096'))
+
+# Cache-Control de las teselas de un instante concreto y de 'latest'
+TILE_MAX_AGE = int(os.getenv('TILE_MAX_AGE', '3600'))
+LATEST_TILE_MAX_AGE = int(os.getenv('LATEST_TILE_MAX_AGE', '300'))
+
+# Capas disponibles: variables del cubo (con varias, se usa el módulo) y niveles de color
+TILE_LAYERS = {
+    'oleaje': {
+        'variables': ['VHM0'],
+        'units': 'm',
+        'levels': WAVE_LEVELS,
+    },
+    'temperatura': {
+        'variables': ['thetao'],
+        'units': '°C',
+        'levels': TEMPERATURE_LEVELS,
+    },
+    'corrientes': {
+        'variables': ['uo', 'vo'],
+        'units': 'm/s',
+        'levels': CURRENT_LEVELS,
+    },
+}
+
+router = APIRouter(prefix="/tiles", tags=["tiles"])
+
+cube = DataCube()
+
+
+class TileCache:
+    """Caché LRU de teselas, segura entre hilos. `name` es la etiqueta de sus métricas."""
+
+    def __init__(self, max_tiles=TILE_CACHE_SIZE, name='teselas'):
+        self.max_tiles = max_tiles
+        self.name = name
+        self._tiles = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            png = self._tiles.get(key)
+            if png is not None:
+                self._tiles.move_to_end(key)
+        cache_access(self.name, png is not None)
+        return png
+
+    def put(self, key, png):
+        with self._lock:
+            self._tiles[key] = png
+            self._tiles.move_to_end(key)
+            while len(self._tiles) > self.max_tiles:
+                self._tiles.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._tiles.clear()
+
+
+tile_cache = TileCache()
+
+
+def tile_coordinates(z, x, y, size=TILE_SIZE):
+    """Longitudes (columnas) y latitudes (filas) de los centros de los píxeles de una tesela."""
+    n = 2 ** z
+    pixels = (np.arange(size) + 0.5) / size
+    lons = (x + pixels) / n * 360.0 - 180.0
+    lats = np.degrees(np.arctan(np.sinh(np.pi * (1 - 2 * (y + pixels) / n))))
+    return lons, lats
+
+
+def nearest_indices(coords, targets):
+    """
+    Índice de la coordenada más cercana a cada objetivo y máscara de los que
+    caen dentro de la malla (hasta media celda más allá de los extremos).
+    """
+    order = np.argsort(coords)
+    ordered = coords[order]
+    if len(ordered) == 1:
+        return np.zeros(len(targets), dtype=np.intp), np.ones(len(targets), dtype=bool)
+
+    idx = np.clip(np.searchsorted(ordered, targets), 1, len(ordered) - 1)
+    idx -= (targets - ordered[idx - 1]) < (ordered[idx] - targets)
+    half_cell = np.median(np.diff(ordered)) / 2
+    inside = (targets >= ordered[0] - half_cell) & (targets <= ordered[-1] + half_cell)
+    return order[idx], inside
+
+
+def sample_field(variables, t_indices, lons, lats):
+    """
+    Valores de la capa en la rejilla de píxeles (lats × lons), NaN fuera de la
+    malla. Cada variable se lee en su índice temporal; con varias variables
+    (componentes) devuelve el módulo.
+    """
+    reference = variables[0]
+    ix, x_inside = nearest_indices(reference.lons, lons)
+    iy, y_inside = nearest_indices(reference.lats, lats)
+
+    values = np.full((len(lats), len(lons)), np.nan, dtype=np.float32)
+    if not x_inside.any() or not y_inside.any():
+        return values
+
+    rows, cols = np.ix_(iy[y_inside], ix[x_inside])
+    components = [variable.values[t_idx][rows, cols] for variable, t_idx in zip(variables, t_indices)]
+    block = components[0] if len(components) == 1 else np.sqrt(sum(c * c for c in components))
+    values[np.ix_(y_inside, x_inside)] = block
+    return values
+
+
+def encode_png(values, levels):
+    """PNG con paleta: un índice por nivel y uno transparente para NaN."""
+    n_levels = len(levels['colors'])
+    indices = level_index(levels, values).astype(np.uint8)
+    indices[~np.isfinite(values)] = n_levels
+
+    colors = np.vstack([palette(levels), np.zeros((1, 3), dtype=np.uint8)])
+    image = Image.fromarray(indices)
+    image.putpalette(colors.ravel().tolist())  # 'L' → 'P'
+
+    buffer = io.BytesIO()
+    image.save(buffer, format='PNG', transparency=n_levels)
+    return buffer.getvalue()
+
+
+def layer_variables(layer):
+    """Vistas del cubo de las variables de una capa."""
+    config = TILE_LAYERS.get(layer)
+    if config is None:
+        raise HTTPException(status_code=404, detail=f"Capa desconocida: {layer}. Disponibles: {list(TILE_LAYERS)}")
+
+    variables = [cube.variable(name) for name in config['variables']]
+    if any(variable is None or variable.shape[0] == 0 for variable in variables):
+        raise HTTPException(status_code=404, detail=f"El cubo no tiene datos de {layer}")
+    if any(variable.shape[1:] != variables[0].shape[1:] for variable in variables):
+        raise HTTPException(status_code=500, detail=f"Las componentes de {layer} no comparten malla")
+    return config, variables
+
+
+def parse_time(value):
+    """Instante de la petición: 'latest' (None) o fecha ISO 8601 (UTC)."""
+    if value == 'latest':
+        return None
+    try:
+        when = datetime.fromisoformat(value.replace('Z', '+00:00'))
+    except ValueError:
+        raise HTTPException(status_code=400, detail=f"Instante no válido: {value}")
+    if when.tzinfo is not None:
+        when = when.astimezone(timezone.utc).replace(tzinfo=None)
+    return np.datetime64(when, 'us')
+
+
+@router.get("")
+def list_layers():
+    """Capas de teselas con sus unidades, leyenda e instantes disponibles."""
+    layers = []
+    for name, config in TILE_LAYERS.items():
+        variable = cube.variable(config['variables'][0])
+        available = variable is not None and variable.shape[0] > 0
+        layers.append({
+            'capa': name,
+            'unidades': config['units'],
+            'leyenda': legend(config['levels']),
+            'desde': np.datetime_as_string(variable.times[0], unit='s') if available else None,
+            'hasta': np.datetime_as_string(variable.times[-1], unit='s') if available else None,
+            'instantes': int(variable.shape[0]) if variable is not None else 0,
+            'url': f"/tiles/{name}/{{instante}}/{{z}}/{{x}}/{{y}}.png",
+        })
+    return {'capas': layers}
+
+
+@router.get("/{layer}/{time}/{z}/{x}/{y}.png")
+def get_tile(layer: str, time: str, z: int, x: int, y: int):
+    """Tesela PNG de una capa en un instante."""
+    if not 0 <= z <= MAX_ZOOM or not 0 <= x < 2 ** z or not 0 <= y < 2 ** z:
+        raise HTTPException(status_code=404, detail="Tesela fuera de rango")
+
+    config, variables = layer_variables(layer)
+    when = parse_time(time)
+    try:
+        t_idx = variables[0].shape[0] - 1 if when is None else variables[0].time_index(when)
+        t_indices = [variable.time_index(variables[0].times[t_idx]) for variable in variables]
+    except KeyError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+
+    instant = np.datetime_as_string(variables[0].times[t_idx], unit='s')
+    key = (layer, tuple(variable.version for variable in variables), instant, z, x, y)
+    png = tile_cache.get(key)
+    if png is None:
+        # Nivel de la pirámide más reducido que aún tiene celdas no mayores que un píxel
+        pixel_size = 360.0 / (TILE_SIZE * 2 ** z)
+        factor = min(variable.best_level(pixel_size).factor for variable in variables)
+        lons, lats = tile_coordinates(z, x, y)
+        values = sample_field([variable.level(factor) for variable in variables], t_indices, lons, lats)
+        png = encode_png(values, config['levels'])
+        tile_cache.put(key, png)
+
+    max_age = LATEST_TILE_MAX_AGE if when is None else TILE_MAX_AGE
+    return Response(content=png, media_type='image/png', headers={
+        'Cache-Control': f'public, max-age={max_age}',
+        'X-Tile-Time': instant,
+    })
@@ -0,0 +1,128 @@
+"""
+Conversión vectorizada de ejes temporales NetCDF a numpy.datetime64[us].
+
+Para los calendarios estándar, las unidades "<unidad> since <referencia>" se
+resuelven con aritmética de desplazamientos sobre el array completo, sin crear
+un objeto datetime/cftime por instante. Los instantes son datetime64[us]
+(int64 desde 1970) y llegan así hasta el COPY binario.
+
+Los demás casos pasan por objetos cftime:
+- calendarios de fechas reales (julian, o standard antes de 1582-10-15): se
+  convierten al gregoriano proléptico mediante el día juliano (toordinal)
+- calendarios de modelo (noleap, all_leap, 360_day...): sus fechas no siempre
+  existen en el gregoriano (30 de febrero), así que se conserva el tiempo
+  transcurrido desde la referencia: un año de 360 días ocupa 360 días reales
+Cualquier otro calendario se rechaza con ValueError.
+"""
+
+import re
+
+import netCDF4 as nc
+import numpy as np
+
+# Microsegundos por unidad de tiempo CF
+UNIT_MICROSECONDS = {
+    'microseconds': 1, 'microsecond': 1, 'us': 1,
+    'milliseconds': 1000, 'millisecond': 1000, 'msec': 1000, 'ms': 1000,
+    'seconds': 1000000, 'second': 1000000, 'secs': 1000000, 'sec': 1000000, 's': 1000000,
+    'minutes': 60000000, 'minute': 60000000, 'mins': 60000000, 'min': 60000000,
+    'hours': 3600000000, 'hour': 3600000000, 'hrs': 3600000000, 'hr': 3600000000, 'h': 3600000000,
+    'days': 86400000000, 'day': 86400000000, 'd': 86400000000,
+    'weeks': 604800000000, 'week': 604800000000,
+}
+
+# Calendarios equivalentes al gregoriano proléptico para fechas posteriores a 1582-10-15
+STANDARD_CALENDARS = {'standard', 'gregorian', 'proleptic_gregorian'}
+GREGORIAN_START = np.datetime64('1582-10-15', 'us')
+
+# Calendarios de fechas reales (mismo día juliano que el gregoriano proléptico)
+REAL_CALENDARS = STANDARD_CALENDARS | {'julian'}
+
+# Calendarios de modelo, con años de duración fija
+MODEL_CALENDARS = {'noleap', '365_day', 'all_leap', '366_day', '360_day'}
+
+EPOCH = np.datetime64('1970-01-01', 'us')
+
+# toordinal() de cftime (día juliano) de 1970-01-01
+EPOCH_ORDINAL = 2440588
+
+_UNITS_PATTERN = re.compile(
+    r'^\s*(?P<unit>\w+)\s+since\s+'
+    r'(?P<date>\d{1,4}-\d{1,2}-\d{1,2})'
+    r'(?:[ T](?P<hour>\d{1,2}):(?P<minute>\d{1,2})(?::(?P<second>\d{1,2}(?:\.\d+)?))?)?'
+    r'\s*(?P<tz>Z|UTC|[+-]\d{1,2}(?::?\d{2})?)?\s*$',
+    re.IGNORECASE
+)
+
+
+def parse_time_units(units):
+    """
+    Interpretar unas unidades CF "<unidad> since <referencia>".
+    Devuelve (microsegundos por unidad, referencia datetime64[us] en UTC) o None.
+    """
+    match = _UNITS_PATTERN.match(units or '')
+    if not match or match['unit'].lower() not in UNIT_MICROSECONDS:
+        return None
+
+    year, month, day = (int(part) for part in match['date'].split('-'))
+    try:
+        reference = np.datetime64(f"{year:04d}-{month:02d}-{day:02d}", 'us')
+    except ValueError:
+        return None  # Fecha inexistente en el gregoriano (p. ej. 360_day)
+    reference += np.timedelta64(int(match['hour'] or 0), 'h') + np.timedelta64(int(match['minute'] or 0), 'm')
+    reference += np.timedelta64(int(round(float(match['second'] or 0) * 1e6)), 'us')
+
+    # Desplazamiento horario de la referencia (+HH:MM): pasar a UTC
+    tz = match['tz']
+    if tz and tz.upper() not in ('Z', 'UTC'):
+        sign = -1 if tz[0] == '-' else 1
+        digits = tz[1:].replace(':', '')
+        hours, minutes = int(digits[:-2] or digits), int(digits[-2:]) if len(digits) > 2 else 0
+        reference -= sign * (np.timedelta64(hours, 'h') + np.timedelta64(minutes, 'm'))
+
+    return UNIT_MICROSECONDS[match['unit'].lower()], reference
+
+
+def _offsets(values, factor):
+    """Desplazamientos en microsegundos (timedelta64[us]) de valores en una unidad."""
+    if np.issubdtype(values.dtype, np.integer):
+        offsets = values.astype(np.int64) * factor
+    else:
+        offsets = np.round(values.astype(np.float64) * factor).astype(np.int64)
+    return offsets.astype('timedelta64[us]')
+
+
+def _from_cftime(dates):
+    """Fechas cftime de un calendario real → datetime64[us] del gregoriano proléptico."""
+    dates = np.atleast_1d(dates)
+    days = np.array([d.toordinal() - EPOCH_ORDINAL for d in dates], dtype=np.int64)
+    microseconds = np.array([((d.hour * 60 + d.minute) * 60 + d.second) * 1000000 + d.microsecond
+                             for d in dates], dtype=np.int64)
+    return EPOCH + days.astype('timedelta64[D]') + microseconds.astype('timedelta64[us]')
+
+
+def decode_times(values, units, calendar='standard'):
+    """Convertir valores de un eje temporal CF a datetime64[us] (UTC, sin zona horaria)."""
+    values = np.atleast_1d(np.ma.getdata(values))
+    parsed = parse_time_units(units)
+    calendar = (calendar or 'standard').lower()
+
+    if parsed is not None and calendar in STANDARD_CALENDARS:
+        factor, reference = parsed
+        if reference >= GREGORIAN_START or calendar == 'proleptic_gregorian':
+            return reference + _offsets(values, factor)
+
+    if calendar in REAL_CALENDARS:
+        dates = nc.num2date(values, units=units, calendar=calendar, only_use_cftime_datetimes=True)
+        return _from_cftime(dates)
+
+    if calendar in MODEL_CALENDARS and parsed is not None:
+        factor, reference = parsed
+        return reference + _offsets(values, factor)
+
+    raise ValueError(f"Calendario no soportado: '{calendar}' con unidades '{units}'")
+
+
+def read_time_axis(time_var):
+    """Convertir el eje temporal (variable NetCDF) de un archivo a datetime64[us]."""
+    return decode_times(time_var[:], time_var.units, getattr(time_var, 'calendar', 'standard'))
@@ -0,0 +1,253 @@
+"""
+Teselas vectoriales (Mapbox Vector Tiles) de piscifactorías, alertas y lecturas.
+
+GET /mvt/{z}/{x}/{y}.pbf devuelve, generadas en PostGIS con ST_AsMVT, las capas:
+- piscifactorias: piscifactorías activas (área simplificada desde AREA_MIN_ZOOM)
+- alertas: gloria.alertas_activas, en la ubicación de la alerta o de su piscifactoría
+- lecturas: gloria.ultimas_lecturas (filtrables con ?variable=)
+Con ?layers=piscifactorias,alertas se piden solo algunas capas.
+
+Por debajo de CLUSTER_MAX_ZOOM los puntos se agrupan en una rejilla
+Web Mercator alineada con las teselas (CLUSTER_CELLS × CLUSTER_CELLS celdas
+por tesela), de modo que un grupo nunca se parte entre dos teselas. Cada grupo
+lleva `cantidad` y, si tiene un solo elemento, sus atributos.
+
+Las capas de alertas y lecturas salen de vistas materializadas, que solo
+cambian al llamar a gloria.refresh_materialized_views() (etapa refresh de la
+cadena), y cada refresco queda registrado en gloria.refrescos_vistas (ver
+08-view-refreshes.sql), igual que los cambios de gloria.piscifactorias. El ETag es el ID del último refresco: el navegador
+revalida con If-None-Match y recibe 304 sin que se genere la tesela. Las
+teselas generadas se guardan además en una caché LRU por proceso con esa
+misma clave.
+"""
+
+import os
+
+import psycopg2
+from fastapi import APIRouter, HTTPException, Request, Response
+
+from . import metrics
+from .query_profiler import connect_kwargs
+from .tiles import TileCache, MAX_ZOOM
+
+MVT_LAYERS = ['piscifactorias', 'alertas', 'lecturas']
+
+# Resolución interna de las teselas y margen (en unidades de tesela) para no cortar símbolos
+MVT_EXTENT = 4096
+MVT_BUFFER = 64
+
+# Zoom desde el que los puntos se sirven sin agrupar
+CLUSTER_MAX_ZOOM = int(os.getenv('MVT_CLUSTER_MAX_ZOOM', '11'))
+
+# Celdas de agrupación por lado de tesela (potencia de 2: 4 → celdas de 64 px)
+CLUSTER_CELLS = 4
+
+# Zoom desde el que las piscifactorías se dibujan con su área en lugar de un punto
+AREA_MIN_ZOOM = 13
+
+# Tolerancia de simplificación de las áreas, en píxeles de pantalla
+SIMPLIFY_PIXELS = 1.0
+
+# Mitad del lado del mundo en Web Mercator (m)
+WEB_MERCATOR_HALF = 20037508.342789244
+
+# Cache-Control: revalidar con el ETag tras este tiempo
+MVT_MAX_AGE = int(os.getenv('MVT_MAX_AGE', '300'))
+
+# Cambiarlo invalida los ETag emitidos si cambia el contenido de las teselas
+MVT_VERSION = 1
+
+MVT_CACHE_SIZE = int(os.getenv('MVT_CACHE_SIZE', '2048'))
+
+router = APIRouter(prefix="/mvt", tags=["mvt"])
+
+mvt_cache = TileCache(MVT_CACHE_SIZE, name='teselas_mvt')
+
+# Envolvente de la tesela en 3857 y en 4326 (para los índices GIST de las tablas)
+_TILE_CTE = """
+    tile AS (
+        SELECT ST_TileEnvelope(%(z)s, %(x)s, %(y)s) AS env,
+               ST_Transform(ST_TileEnvelope(%(z)s, %(x)s, %(y)s), 4326) AS env_4326
+    )
+"""
+
+# Clave de la celda de agrupación de un punto en 3857
+_CELL = "floor(ST_X(geom) / %(cell)s), floor(ST_Y(geom) / %(cell)s)"
+
+# Por capa: puntos en 3857 (points), geometrías de detalle si difieren (detail),
+# grupos por celda (cluster) y atributos de cada variante (columns, cluster_columns)
+LAYER_SQL = {
+    'piscifactorias': {
+        'points': """
+            SELECT p.id, p.nombre, p.tipo, p.provincia, p.capacidad_produccion,
+                   ST_Transform(p.geometria, 3857) AS geom
+            FROM gloria.piscifactorias p, tile
+            WHERE p.activo AND p.geometria && tile.env_4326
+        """,
+        'detail': f"""
+            SELECT p.id, p.nombre, p.tipo, p.provincia, p.capacidad_produccion,
+                   CASE WHEN %(z)s >= {AREA_MIN_ZOOM} AND p.geom_area IS NOT NULL
+                        THEN ST_SimplifyPreserveTopology(ST_Transform(p.geom_area, 3857), %(tolerance)s)
+                        ELSE ST_Transform(p.geometria, 3857)
+                   END AS geom
+            FROM gloria.piscifactorias p, tile
+            WHERE p.activo AND (p.geometria && tile.env_4326 OR p.geom_area && tile.env_4326)
+        """,
+        'cluster': """
+            SELECT count(*) AS cantidad,
+                   CASE WHEN count(*) = 1 THEN min(id) END AS id,
+                   CASE WHEN count(*) = 1 THEN min(nombre) END AS nombre,
+                   ST_Centroid(ST_Collect(geom)) AS geom
+            FROM puntos
+            GROUP BY {cell}
+        """,
+        'columns': ['id', 'nombre', 'tipo', 'provincia', 'capacidad_produccion'],
+        'cluster_columns': ['cantidad', 'id', 'nombre'],
+    },
+    'alertas': {
+        'points': """
+            SELECT a.id, a.piscifactoria_id, a.piscifactoria_nombre, a.tipo, a.nivel, a.descripcion,
+                   a.fecha_inicio::text AS fecha_inicio, a.valor_actual, a.valor_umbral,
+                   ST_Transform(COALESCE(a.geometria, p.geometria), 3857) AS geom
+            FROM gloria.alertas_activas a
+            JOIN gloria.piscifactorias p ON p.id = a.piscifactoria_id
+            CROSS JOIN tile
+            WHERE COALESCE(a.geometria, p.geometria) && tile.env_4326
+        """,
+        'cluster': """
+            SELECT count(*) AS cantidad,
+                   string_agg(DISTINCT nivel, ',') AS niveles,
+                   CASE WHEN count(*) = 1 THEN min(id) END AS id,
+                   CASE WHEN count(*) = 1 THEN min(tipo) END AS tipo,
+                   CASE WHEN count(*) = 1 THEN min(descripcion) END AS descripcion,
+                   ST_Centroid(ST_Collect(geom)) AS geom
+            FROM puntos
+            GROUP BY {cell}
+        """,
+        'columns': ['id', 'piscifactoria_id', 'piscifactoria_nombre', 'tipo', 'nivel', 'descripcion',
+                    'fecha_inicio', 'valor_actual', 'valor_umbral'],
+        'cluster_columns': ['cantidad', 'niveles', 'id', 'tipo', 'descripcion'],
+    },
+    'lecturas': {
+        'points': """
+            SELECT l.id, l.piscifactoria_id, l.piscifactoria_nombre, l.variable_nombre AS variable,
+                   l.valor, l.fecha_tiempo::text AS fecha, ST_Transform(l.geometria, 3857) AS geom
+            FROM gloria.ultimas_lecturas l, tile
+            WHERE l.geometria && tile.env_4326
+            AND (%(variable)s IS NULL OR l.variable_nombre = %(variable)s)
+        """,
+        'cluster': """
+            SELECT count(*) AS cantidad, variable,
+                   avg(valor) AS valor, max(valor) AS valor_maximo, max(fecha) AS fecha,
+                   ST_Centroid(ST_Collect(geom)) AS geom
+            FROM puntos
+            GROUP BY variable, {cell}
+        """,
+        'columns': ['id', 'piscifactoria_id', 'piscifactoria_nombre', 'variable', 'valor', 'fecha'],
+        'cluster_columns': ['cantidad', 'variable', 'valor', 'valor_maximo', 'fecha'],
+    },
+}
+
+
+def layer_query(layer, clustered):
+    """SQL que devuelve la capa `layer` codificada con ST_AsMVT (bytea, vacío si no hay nada)."""
+    sql = LAYER_SQL[layer]
+    if clustered:
+        features = f"puntos AS ({sql['points']}), g AS ({sql['cluster'].format(cell=_CELL)})"
+        columns = sql['cluster_columns']
+    else:
+        features = f"g AS ({sql.get('detail', sql['points'])})"
+        columns = sql['columns']
+    return f"""
+        WITH {_TILE_CTE}, {features}
+        SELECT COALESCE((
+            SELECT ST_AsMVT(mvt.*, '{layer}', {MVT_EXTENT}, 'geom')
+            FROM (
+                SELECT {', '.join('g.' + column for column in columns)},
+                       ST_AsMVTGeom(g.geom, tile.env, {MVT_EXTENT}, {MVT_BUFFER}, true) AS geom
+                FROM g, tile
+            ) mvt
+            WHERE mvt.geom IS NOT NULL
+        ), ''::bytea)
+    """
+
+
+def tile_params(z, x, y, variable=None):
+    """Parámetros de las consultas: celda de agrupación y tolerancia de simplificación (m)."""
+    tile_size = 2 * WEB_MERCATOR_HALF / 2 ** z
+    return {
+        'z': z, 'x': x, 'y': y,
+        'cell': tile_size / CLUSTER_CELLS,
+        'tolerance': tile_size / 256 * SIMPLIFY_PIXELS,
+        'variable': variable,
+    }
+
+
+def get_db_connection():
+    return psycopg2.connect(
+        dbname=os.getenv("DB_NAME", "gloria"),
+        user=os.getenv("DB_USER", "postgres"),
+        password=os.getenv("DB_PASSWORD", "postgres"),
+        host=os.getenv("DB_HOST", "localhost"),
+        port=os.getenv("DB_PORT", "5432"),
+        **connect_kwargs()
+    )
+
+
+def last_refresh_id(cursor):
+    with metrics.timed_query('mvt_ultimo_refresco'):
+        cursor.execute("SELECT COALESCE(MAX(id), 0) FROM gloria.refrescos_vistas")
+    return cursor.fetchone()[0]
+
+
+def render_tile(cursor, z, x, y, layers, variable=None):
+    """Tesela MVT con las capas pedidas (la concatenación de capas MVT es una tesela válida)."""
+    params = tile_params(z, x, y, variable)
+    clustered = z < CLUSTER_MAX_ZOOM
+    parts = []
+    for layer in layers:
+        with metrics.timed_query(f'mvt_{layer}'):
+            cursor.execute(layer_query(layer, clustered), params)
+        parts.append(bytes(cursor.fetchone()[0]))
+    return b''.join(parts)
+
+
+@router.get("/{z}/{x}/{y}.pbf")
+def get_vector_tile(z: int, x: int, y: int, request: Request, layers: str = None, variable: str = None):
+    """Tesela vectorial con piscifactorías, alertas activas y últimas lecturas."""
+    if not 0 <= z <= MAX_ZOOM or not 0 <= x < 2 ** z or not 0 <= y < 2 ** z:
+        raise HTTPException(status_code=404, detail="Tesela fuera de rango")
+
+    requested = MVT_LAYERS if not layers else [name.strip() for name in layers.split(',') if name.strip()]
+    unknown = [name for name in requested if name not in MVT_LAYERS]
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Capas desconocidas: {unknown}. Disponibles: {MVT_LAYERS}")
+
+    try:
+        conn = get_db_connection()
+    except psycopg2.Error as e:
+        raise HTTPException(status_code=503, detail=f"Base de datos no disponible: {e}")
+
+    try:
+        cursor = conn.cursor()
+        refresh_id = last_refresh_id(cursor)
+        etag = f'"mvt-{MVT_VERSION}-{refresh_id}"'
+        headers = {
+            'ETag': etag,
+            'Cache-Control': f'public, max-age={MVT_MAX_AGE}, must-revalidate',
+        }
+        if etag in request.headers.get('if-none-match', ''):
+            return Response(status_code=304, headers=headers)
+
+        key = (refresh_id, z, x, y, tuple(requested), variable)
+        tile = mvt_cache.get(key)
+        if tile is None:
+            tile = render_tile(cursor, z, x, y, requested, variable)
+            mvt_cache.put(key, tile)
+        cursor.close()
+    except psycopg2.Error as e:
+        raise HTTPException(status_code=500, detail=f"Error generando la tesela: {e}")
+    finally:
+        conn.close()
+
+    return Response(content=tile, media_type='application/vnd.mapbox-vector-tile', headers=headers)
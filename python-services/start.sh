@@ -17,11 +17,16 @@ if [ -d "/data" ] && [ "$(ls -A /data/*.nc 2>/dev/null)" ]; then
     echo "📦 Archivos NetCDF encontrados en /data"
 
     # Verificar si ya se han importado datos
-    RECORD_COUNT=$(PGPASSWORD=$DB_PASSWORD psql -h "$DB_HOST" -U "$DB_USER" -d "$DB_NAME" -t -c "SELECT COUNT(*) FROM gloria.variables_ambientales WHERE variable_nombre IN ('oleaje_altura', 'temperatura_superficial');" 2>/dev/null | xargs)
+    if [ "$GRID_STORAGE" = "true" ]; then
+        COUNT_QUERY="SELECT COUNT(*) FROM gloria.campos_grid;"
+    else
+        COUNT_QUERY="SELECT COUNT(*) FROM gloria.variables_ambientales WHERE variable_nombre IN ('oleaje_altura', 'temperatura_superficial');"
+    fi
+    RECORD_COUNT=$(PGPASSWORD=$DB_PASSWORD psql -h "$DB_HOST" -U "$DB_USER" -d "$DB_NAME" -t -c "$COUNT_QUERY" 2>/dev/null | xargs)
 
     if [ "$RECORD_COUNT" -eq "0" ] || [ "$FORCE_IMPORT" = "true" ]; then
         echo "🔄 Importando datos NetCDF a la base de datos..."
-        python3 /app/app/import_netcdf_data.py
+        python3 -m app.import_netcdf_data
         echo "✅ Importación completada"
     else
         echo "ℹ️  Ya existen $RECORD_COUNT registros en la base de datos"
@@ -31,6 +36,11 @@ else
     echo "⚠️  No se encontraron archivos NetCDF en /data"
 fi
 
+# Métricas Prometheus compartidas por los workers (directorio vacío en cada arranque)
+export PROMETHEUS_MULTIPROC_DIR="${PROMETHEUS_MULTIPROC_DIR:-/tmp/gloria-metrics}"
+rm -rf "$PROMETHEUS_MULTIPROC_DIR"
+mkdir -p "$PROMETHEUS_MULTIPROC_DIR"
+
 # Iniciar el servidor FastAPI
 echo "🌐 Iniciando servidor FastAPI..."
 exec uvicorn app.main:app --host 0.0.0.0 --port 8000 --workers 4
@@ -0,0 +1,56 @@
+"""Pruebas de la incorporación de archivos NetCDF al cubo de datos (app.data_cube)."""
+
+import netCDF4 as nc
+import numpy as np
+import pytest
+
+from app.data_cube import CUBE_BBOX, DataCube, append_netcdf_to_cube
+from app.ingest import CubeSink, ingest_file, get_spec
+
+LONS = np.linspace(-3.0, 2.0, 50)
+LATS = np.linspace(36.0, 41.0, 40)
+
+
+@pytest.fixture
+def netcdf_file(tmp_path):
+    """Archivo con temperatura en dos niveles y oleaje sin eje de profundidad."""
+    path = tmp_path / 'muestra.nc'
+    rng = np.random.default_rng(0)
+    with nc.Dataset(path, 'w') as ds:
+        ds.createDimension('time', 3)
+        ds.createDimension('depth', 2)
+        ds.createDimension('latitude', len(LATS))
+        ds.createDimension('longitude', len(LONS))
+        time = ds.createVariable('time', 'f8', ('time',))
+        time.units = 'hours since 2026-01-01'
+        time[:] = [0, 24, 48]
+        ds.createVariable('depth', 'f4', ('depth',))[:] = [1.0, 10.0]
+        ds.createVariable('latitude', 'f8', ('latitude',))[:] = LATS
+        ds.createVariable('longitude', 'f8', ('longitude',))[:] = LONS
+        thetao = ds.createVariable('thetao', 'f4', ('time', 'depth', 'latitude', 'longitude'))
+        thetao.units = 'degrees_C'
+        thetao[:] = rng.uniform(10, 25, (3, 2, len(LATS), len(LONS)))
+        ds.createVariable('VHM0', 'f4', ('time', 'latitude', 'longitude'))[:] = rng.uniform(0, 3, (3, len(LATS), len(LONS)))
+    return path
+
+
+def test_append_netcdf_full_grid_surface(netcdf_file, tmp_path):
+    written = append_netcdf_to_cube(netcdf_file, root=tmp_path / 'cubo')
+    assert written == {'thetao': 3, 'VHM0': 3}
+
+    ix = np.where((LONS >= CUBE_BBOX['lon_min']) & (LONS <= CUBE_BBOX['lon_max']))[0]
+    iy = np.where((LATS >= CUBE_BBOX['lat_min']) & (LATS <= CUBE_BBOX['lat_max']))[0]
+    with nc.Dataset(netcdf_file) as ds:
+        surface = ds.variables['thetao'][:, 0, iy[0]:iy[-1] + 1, ix[0]:ix[-1] + 1]
+
+    thetao = DataCube(tmp_path / 'cubo').variable('thetao')
+    np.testing.assert_array_equal(thetao.lons, LONS[ix])
+    np.testing.assert_array_equal(thetao.lats, LATS[iy])
+    np.testing.assert_array_equal(thetao.values, surface)
+    assert thetao.units == 'degrees_C'
+
+
+def test_cube_sink_rejects_several_levels(netcdf_file, tmp_path):
+    spec = get_spec('temperatura', bbox=None, stride=1, depth=None)
+    with pytest.raises(ValueError):
+        ingest_file(netcdf_file, spec, [CubeSink(tmp_path / 'cubo')])
@@ -0,0 +1,48 @@
+"""Pruebas de la interpolación en piscifactorías desde el cubo de datos (app.farm_sampler)."""
+
+import numpy as np
+import pytest
+
+from app.data_cube import append_variable, DataCube
+from app.farm_sampler import FarmSampler, _sample_cube_field
+from app.ingest import INGEST_SPECS
+
+LONS = np.linspace(-2.0, 1.0, 7)
+LATS = np.linspace(37.0, 40.5, 8)
+TIMES = np.arange('2026-01-01', '2026-01-05', dtype='datetime64[D]').astype('datetime64[us]')
+
+VAR_SPECS = {var_spec['target']: var_spec for spec in INGEST_SPECS.values() for var_spec in spec['variables']}
+
+
+def constant(value):
+    return np.full((len(TIMES), len(LATS), len(LONS)), value, dtype=np.float32)
+
+
+@pytest.fixture
+def sampler():
+    # Una piscifactoría dentro de la malla y otra fuera
+    return FarmSampler(LONS, LATS, np.array([-0.5, 5.0]), np.array([38.0, 38.0]))
+
+
+def test_cube_field_kelvin_and_land(tmp_path, sampler):
+    values = constant(290.15)
+    values[:, 0, :] = np.nan
+    append_variable(tmp_path, 'thetao', TIMES, LONS, LATS, values)
+
+    times, series = _sample_cube_field(DataCube(tmp_path), VAR_SPECS['temperatura_superficial'],
+                                       ['thetao'], sampler)
+
+    np.testing.assert_array_equal(times, TIMES)
+    np.testing.assert_allclose(series[:, 0], 17.0, rtol=1e-5)
+    assert np.isnan(series[:, 1]).all()
+
+
+def test_cube_field_components_since(tmp_path, sampler):
+    append_variable(tmp_path, 'uo', TIMES, LONS, LATS, constant(3.0))
+    append_variable(tmp_path, 'vo', TIMES, LONS, LATS, constant(4.0))
+
+    times, series = _sample_cube_field(DataCube(tmp_path), VAR_SPECS['corriente'],
+                                       ['uo', 'vo'], sampler, fecha_inicio='2026-01-03')
+
+    np.testing.assert_array_equal(times, TIMES[2:])
+    np.testing.assert_allclose(series[:, 0], 5.0)
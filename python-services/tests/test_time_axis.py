@@ -0,0 +1,96 @@
+"""Pruebas de la conversión de ejes temporales CF (app.time_axis)."""
+
+import numpy as np
+import pytest
+
+from app.time_axis import decode_times, parse_time_units
+
+
+def dt64(*values):
+    return np.array(values, dtype='datetime64[us]')
+
+
+@pytest.mark.parametrize('units, factor, reference', [
+    ('days since 2000-01-01', 86400000000, '2000-01-01T00:00'),
+    ('hours since 1950-01-01 00:00:00', 3600000000, '1950-01-01T00:00'),
+    ('seconds since 1970-01-01T00:00:00Z', 1000000, '1970-01-01T00:00'),
+    ('minutes since 2020-3-5 6:07:08.5', 60000000, '2020-03-05T06:07:08.5'),
+    ('hours since 2000-01-01 00:00:00 +02:00', 3600000000, '1999-12-31T22:00'),
+    ('hours since 2000-01-01 00:00 -0530', 3600000000, '2000-01-01T05:30'),
+    ('days since 2000-01-01 UTC', 86400000000, '2000-01-01T00:00'),
+])
+def test_parse_time_units(units, factor, reference):
+    assert parse_time_units(units) == (factor, np.datetime64(reference, 'us'))
+
+
+@pytest.mark.parametrize('units', ['', 'days', 'fortnights since 2000-01-01', 'days since 2000-02-30'])
+def test_parse_time_units_not_recognized(units):
+    assert parse_time_units(units) is None
+
+
+def test_decode_integer_axis():
+    values = np.array([0, 1, 48], dtype=np.int32)
+    expected = dt64('2024-01-01T00:00', '2024-01-01T01:00', '2024-01-03T00:00')
+    np.testing.assert_array_equal(decode_times(values, 'hours since 2024-01-01'), expected)
+
+
+def test_decode_float_axis_rounds_to_microseconds():
+    values = np.array([0.5, 1.25, 1 / 3], dtype=np.float64)
+    expected = dt64('2024-01-01T12:00', '2024-01-02T06:00', '2024-01-01T08:00')
+    np.testing.assert_array_equal(decode_times(values, 'days since 2024-01-01'), expected)
+
+
+def test_decode_large_integer_axis_without_float_loss():
+    # Microsegundos desde 1970 que no caben exactos en un float64
+    values = np.array([1700000000123457], dtype=np.int64)
+    expected = dt64('2023-11-14T22:13:20.123457')
+    np.testing.assert_array_equal(decode_times(values, 'microseconds since 1970-01-01'), expected)
+
+
+def test_decode_timezone_offset():
+    expected = dt64('1999-12-31T22:00', '1999-12-31T23:00')
+    np.testing.assert_array_equal(decode_times([0, 1], 'hours since 2000-01-01 00:00:00 +02:00'), expected)
+
+
+def test_decode_masked_scalar():
+    values = np.ma.masked_array([3], mask=[False])
+    np.testing.assert_array_equal(decode_times(values, 'days since 2000-01-01'), dt64('2000-01-04'))
+
+
+@pytest.mark.parametrize('calendar', [None, 'standard', 'gregorian', 'proleptic_gregorian', 'GREGORIAN'])
+def test_decode_standard_calendars(calendar):
+    np.testing.assert_array_equal(decode_times([0, 31], 'days since 2000-01-01', calendar),
+                                  dt64('2000-01-01', '2000-02-01'))
+
+
+def test_decode_standard_calendar_before_gregorian_reform():
+    # Antes de 1582-10-15, 'standard' es el calendario juliano
+    np.testing.assert_array_equal(decode_times([0, 1], 'days since 1500-01-01', 'standard'),
+                                  dt64('1500-01-10', '1500-01-11'))
+
+
+def test_decode_julian_calendar():
+    np.testing.assert_array_equal(decode_times([0, 0.5], 'days since 1969-12-19', 'julian'),
+                                  dt64('1970-01-01T00:00', '1970-01-01T12:00'))
+
+
+@pytest.mark.parametrize('calendar, values, expected', [
+    ('360_day', [0, 59], ['2000-01-01', '2000-02-29']),
+    ('noleap', [0, 365], ['2000-01-01', '2000-12-31']),
+    ('365_day', [0, 1.5], ['2000-01-01T00:00', '2000-01-02T12:00']),
+    ('all_leap', [0, 366], ['2001-01-01', '2002-01-02']),
+])
+def test_decode_model_calendars_keep_elapsed_time(calendar, values, expected):
+    decoded = decode_times(values, 'days since ' + expected[0][:10], calendar)
+    np.testing.assert_array_equal(decoded, dt64(*expected))
+    assert np.all(np.diff(decoded) > np.timedelta64(0, 'us'))
+
+
+def test_decode_unsupported_calendar():
+    with pytest.raises(ValueError, match='Calendario no soportado'):
+        decode_times([0], 'days since 2000-01-01', 'none')
+
+
+def test_decode_model_calendar_with_unparsable_units():
+    with pytest.raises(ValueError, match='Calendario no soportado'):
+        decode_times([0], 'days since 2000-02-30', '360_day')
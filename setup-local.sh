@@ -37,6 +37,11 @@ sudo -u postgres psql -d gloria -c "CREATE EXTENSION IF NOT EXISTS postgis;"
 sudo -u postgres psql -d gloria -c "CREATE EXTENSION IF NOT EXISTS postgis_topology;"
 sudo -u postgres psql -d gloria < databases/init.sql
 sudo -u postgres psql -d gloria < databases/03-wave-config.sql
+sudo -u postgres psql -d gloria < databases/04-grid-storage.sql
+sudo -u postgres psql -d gloria < databases/05-farm-lookup.sql
+sudo -u postgres psql -d gloria < databases/06-farm-grid-points.sql
+sudo -u postgres psql -d gloria < databases/07-regional-points.sql
+sudo -u postgres psql -d gloria < databases/08-view-refreshes.sql
 
 # 5. Instalar dependencias Python (en virtual environment)
 echo -e "${YELLOW}[5/7] Instalando dependencias Python...${NC}"
@@ -78,7 +83,7 @@ echo "======================================"
 echo ""
 echo "1. Importar datos NetCDF:"
 echo "   cd python-services"
-echo "   python3 app/import_netcdf_data.py"
+echo "   python3 -m app.import_netcdf_data"
 echo ""
 echo "2. Iniciar Backend (en una terminal):"
 echo "   cd backend"